@@ -3,19 +3,55 @@ Yandex Music Discord RPC - Главное приложение с GUI
 by @nevercr7
 """
 
-import tkinter as tk
-from tkinter import ttk, messagebox
-import webbrowser
-import threading
 import sys
-import os
-import winreg
 
-from settings import (
-    load_settings, save_settings, get_token, set_token,
-    is_first_run, DISCORD_CLIENT_ID, is_autostart_enabled, set_autostart_enabled
-)
-from auth import open_auth_page, extract_token_from_url, OAUTH_URL
+# В собранном .exe дочерний процесс чтения медиа-сессии (media_worker)
+# запускается тем же exe — freeze_support() выполняет его и завершает процесс
+if __name__ == "__main__" and getattr(sys, "frozen", False):
+    from multiprocessing import freeze_support
+    freeze_support()
+
+# Фоновый режим без интерфейса: tkinter и трей не загружаются вовсе
+if __name__ == "__main__" and "--daemon" in sys.argv:
+    from daemon import main as daemon_main
+    sys.exit(daemon_main())
+
+# Повторный запуск (автозапуск + ручной клик): показываем окно уже работающего
+# экземпляра и выходим, не загружая tkinter
+if __name__ == "__main__":
+    from single_instance import acquire_instance
+    if acquire_instance("reload" if "--reload" in sys.argv else "show") is None:
+        sys.exit(0)
+
+# Интерфейс — только при запуске окна. Дочерний процесс media_worker (spawn)
+# импортирует этот файл как __mp_main__ при каждом запуске и перезапуске:
+# ему достаются только определения ниже, без tkinter и авторизации
+if __name__ == "__main__":
+    import tkinter as tk
+    from tkinter import ttk, messagebox
+    import threading
+    import os
+    
+    from settings import (
+        load_settings, save_settings, get_token, set_token,
+        is_first_run, DISCORD_CLIENT_ID, is_autostart_enabled, set_autostart_enabled
+    )
+    from auth import open_auth_page, extract_token_from_url, OAUTH_URL
+    from logger import setup_logging, shutdown_logging
+    from single_instance import release_instance, set_command_handler
+
+
+def bring_to_front(root: "tk.Tk"):
+    """Показать окно поверх остальных (в том числе скрытое в трей)"""
+    root.deiconify()
+    root.lift()
+    root.focus_force()
+
+
+def open_url(url: str):
+    """Открыть ссылку в браузере (webbrowser грузится только по клику)"""
+    import webbrowser
+    webbrowser.open(url)
 
 
 class SetupWindow:
@@ -33,6 +69,12 @@ class SetupWindow:
         self.center_window()
         
         self.create_widgets()
+        set_command_handler(self.on_instance_command)
+    
+    def on_instance_command(self, command):
+        """Команда от повторного запуска (вызывается из потока канала)"""
+        if command == "show":
+            self.root.after(0, lambda: bring_to_front(self.root))
     
     def center_window(self):
         self.root.update_idletasks()
@@ -170,7 +212,7 @@ class SetupWindow:
             cursor="hand2"
         )
         help_link.pack(side="left", padx=15)
-        help_link.bind("<Button-1>", lambda e: webbrowser.open(
+        help_link.bind("<Button-1>", lambda e: open_url(
             "https://github.com/MarshalX/yandex-music-api/discussions/513"
         ))
         
@@ -183,7 +225,7 @@ class SetupWindow:
             cursor="hand2"
         )
         tg_link.pack(side="left", padx=15)
-        tg_link.bind("<Button-1>", lambda e: webbrowser.open("https://t.me/nevercr7"))
+        tg_link.bind("<Button-1>", lambda e: open_url("https://t.me/nevercr7"))
         
         gh_link = tk.Label(
             links_frame,
@@ -194,7 +236,7 @@ class SetupWindow:
             cursor="hand2"
         )
         gh_link.pack(side="left", padx=15)
-        gh_link.bind("<Button-1>", lambda e: webbrowser.open("https://github.com/Nevercr7"))
+        gh_link.bind("<Button-1>", lambda e: open_url("https://github.com/Nevercr7"))
     
     def _on_ctrl_key(self, event, entry):
         """Обработка Ctrl+клавиша для русской раскладки"""
@@ -281,6 +323,7 @@ class MainWindow:
         
         # Обработчик закрытия
         self.root.protocol("WM_DELETE_WINDOW", self.on_close)
+        set_command_handler(self.on_instance_command)
     
     def center_window(self):
         self.root.update_idletasks()
@@ -390,7 +433,7 @@ class MainWindow:
             cursor="hand2"
         )
         tg_link.pack(side="left", padx=10)
-        tg_link.bind("<Button-1>", lambda e: webbrowser.open("https://t.me/nevercr7"))
+        tg_link.bind("<Button-1>", lambda e: open_url("https://t.me/nevercr7"))
         
         gh_link = tk.Label(
             links_frame,
@@ -401,7 +444,7 @@ class MainWindow:
             cursor="hand2"
         )
         gh_link.pack(side="left", padx=10)
-        gh_link.bind("<Button-1>", lambda e: webbrowser.open("https://github.com/Nevercr7"))
+        gh_link.bind("<Button-1>", lambda e: open_url("https://github.com/Nevercr7"))
     
     def start_rpc(self):
         """Запустить RPC и свернуть в трей"""
@@ -427,6 +470,14 @@ class MainWindow:
         thread = threading.Thread(target=run_tray, daemon=True)
         thread.start()
     
+    def on_instance_command(self, command):
+        """Команда от повторного запуска (вызывается из потока канала)"""
+        if command == "show":
+            # Окно показываем, но RPC в трее продолжает работать
+            self.root.after(0, lambda: bring_to_front(self.root))
+        elif command == "reload" and self.tray_app:
+            self.tray_app.pipeline.reload_settings()
+    
     def on_tray_quit(self):
         """Callback при выходе из трея"""
         self.is_running = False
@@ -473,6 +524,8 @@ class MainWindow:
     
     def add_to_autostart(self) -> bool:
         """Добавить в автозапуск"""
+        from backends import get_autostart
+        
         try:
             # Определяем путь к exe или скрипту
             if getattr(sys, 'frozen', False):
@@ -488,13 +541,7 @@ class MainWindow:
                 else:
                     app_path = f'"{python_path}" "{script_path}"'
             
-            key = winreg.OpenKey(
-                winreg.HKEY_CURRENT_USER,
-                r"Software\Microsoft\Windows\CurrentVersion\Run",
-                0, winreg.KEY_SET_VALUE
-            )
-            winreg.SetValueEx(key, "YandexMusicRPC", 0, winreg.REG_SZ, app_path)
-            winreg.CloseKey(key)
+            get_autostart().enable(app_path)
             return True
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось добавить в автозапуск:\n{e}")
@@ -502,16 +549,10 @@ class MainWindow:
     
     def remove_from_autostart(self) -> bool:
         """Убрать из автозапуска"""
+        from backends import get_autostart
+        
         try:
-            key = winreg.OpenKey(
-                winreg.HKEY_CURRENT_USER,
-                r"Software\Microsoft\Windows\CurrentVersion\Run",
-                0, winreg.KEY_SET_VALUE
-            )
-            winreg.DeleteValue(key, "YandexMusicRPC")
-            winreg.CloseKey(key)
-            return True
-        except FileNotFoundError:
+            get_autostart().disable()
             return True
         except Exception as e:
             messagebox.showerror("Ошибка", f"Не удалось убрать из автозапуска:\n{e}")
@@ -543,13 +584,20 @@ def start_main_window():
 
 def main():
     """Точка входа"""
-    if is_first_run():
-        # Первый запуск - показываем настройку
-        setup = SetupWindow(on_complete=start_main_window)
-        setup.run()
-    else:
-        # Не первый запуск - главное окно
-        start_main_window()
+    setup_logging()
+    try:
+        if is_first_run():
+            # Первый запуск - показываем настройку
+            setup = SetupWindow(on_complete=start_main_window)
+            setup.run()
+        else:
+            # Не первый запуск - главное окно
+            start_main_window()
+    finally:
+        from pipeline import close_services
+        close_services()
+        release_instance()
+        shutdown_logging()
 
 
 if __name__ == "__main__":
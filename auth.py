@@ -3,7 +3,6 @@
 Получение токена через браузер (ручной способ)
 """
 
-import webbrowser
 from typing import Optional
 
 # OAuth параметры Yandex Music
@@ -19,6 +18,7 @@ OAUTH_URL = (
 
 def open_auth_page():
     """Открыть страницу авторизации в браузере"""
+    import webbrowser
     webbrowser.open(OAUTH_URL)
 
 
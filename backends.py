@@ -0,0 +1,234 @@
+"""
+Платформенные бэкенды
+Источник трека, автозапуск и трей описаны интерфейсами (ниже), а реализации
+зарегистрированы по платформам и импортируются только при выборе. Так ядро
+(конвейер, трей) не тянет winrt, winreg и pystray и запускается на любой ОС
+
+Интерфейсы (утиная типизация, как у остальных модулей):
+    Источник трека: async get_current_track() -> Optional[TrackInfo];
+        необязательно start_recording(path) / stop_recording() — запись трассы
+    Автозапуск: enable(command) / disable(), ошибки — OSError
+    Трей: пространство имён с Icon, Menu, MenuItem в подмножестве API pystray:
+        Icon(name, image, title, menu) с .icon, .title, update_menu(), run(), stop()
+"""
+
+import importlib
+import os
+import sys
+import threading
+from types import SimpleNamespace
+from typing import Optional
+
+from media_session import TrackInfo
+from logger import get_logger
+
+log = get_logger("backends")
+
+# Вид -> имя -> (модуль, атрибут или None — сам модуль, платформы или None — любая).
+# Порядок — предпочтение: без явного выбора берётся первый подходящий
+BACKENDS = {
+    "track_source": {
+        "gsmtc": ("media_session", "MediaSessionManager", ("win32",)),
+        "memory": ("backends", "InMemoryTrackSource", None),
+    },
+    "autostart": {
+        "windows": ("backends", "WindowsAutostart", ("win32",)),
+        "xdg": ("backends", "XdgAutostart", ("linux",)),
+        "memory": ("backends", "InMemoryAutostart", None),
+    },
+    "tray": {
+        "pystray": ("pystray", None, ("win32", "darwin", "linux")),
+        "headless": ("backends", "HeadlessTray", None),
+    },
+}
+
+
+def available(kind: str) -> list:
+    """Имена бэкендов вида kind, подходящих этой платформе (в порядке предпочтения)"""
+    return [name for name, (_, _, platforms) in BACKENDS[kind].items()
+            if platforms is None or sys.platform.startswith(platforms)]
+
+
+def load_backend(kind: str, name: Optional[str] = None):
+    """
+    Импортировать бэкенд (класс или модуль). Неподходящий платформе или
+    не установленный бэкенд заменяется следующим подходящим
+    """
+    candidates = available(kind)
+    if name:
+        if name in candidates:
+            candidates.remove(name)
+            candidates.insert(0, name)
+        else:
+            log.warning("backends.select", "Бэкенд недоступен на этой платформе",
+                        kind=kind, name=name, platform=sys.platform)
+    for candidate in candidates:
+        module_name, attribute, _ = BACKENDS[kind][candidate]
+        try:
+            module = importlib.import_module(module_name)
+        except ImportError as e:
+            log.warning("backends.load", "Бэкенд не загружен", kind=kind, name=candidate, error=str(e))
+            continue
+        log.debug("backends.load", "Бэкенд выбран", kind=kind, name=candidate)
+        return getattr(module, attribute) if attribute else module
+    raise RuntimeError(f"нет доступного бэкенда {kind}")
+
+
+def create_track_source(name: Optional[str] = None):
+    """Источник трека для конвейера"""
+    return load_backend("track_source", name)()
+
+
+def get_autostart():
+    """Автозапуск этой платформы"""
+    return load_backend("autostart")()
+
+
+def get_tray(name: Optional[str] = None):
+    """Трей: pystray или HeadlessTray"""
+    return load_backend("tray", name)
+
+
+# === Источник трека ===
+
+class InMemoryTrackSource:
+    """Источник трека без медиа-сессии: трек задаётся вызовом set_track (любая ОС)"""
+    
+    def __init__(self, track: Optional[TrackInfo] = None):
+        self.track = track
+    
+    def set_track(self, track: Optional[TrackInfo]):
+        """Сменить трек (потокобезопасно: одно присваивание)"""
+        self.track = track
+    
+    async def get_current_track(self) -> Optional[TrackInfo]:
+        return self.track
+
+
+# === Автозапуск ===
+
+AUTOSTART_NAME = "YandexMusicRPC"
+
+
+class WindowsAutostart:
+    """Ключ Run в реестре текущего пользователя"""
+    
+    KEY = r"Software\Microsoft\Windows\CurrentVersion\Run"
+    
+    def enable(self, command: str):
+        import winreg
+        key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.KEY, 0, winreg.KEY_SET_VALUE)
+        try:
+            winreg.SetValueEx(key, AUTOSTART_NAME, 0, winreg.REG_SZ, command)
+        finally:
+            winreg.CloseKey(key)
+    
+    def disable(self):
+        import winreg
+        key = winreg.OpenKey(winreg.HKEY_CURRENT_USER, self.KEY, 0, winreg.KEY_SET_VALUE)
+        try:
+            winreg.DeleteValue(key, AUTOSTART_NAME)
+        except FileNotFoundError:
+            pass  # Уже убрано
+        finally:
+            winreg.CloseKey(key)
+
+
+class XdgAutostart:
+    """Файл .desktop в ~/.config/autostart (GNOME, KDE и другие по стандарту XDG)"""
+    
+    def __init__(self, folder: Optional[str] = None):
+        config = os.environ.get("XDG_CONFIG_HOME") or os.path.expanduser("~/.config")
+        self.path = os.path.join(folder or os.path.join(config, "autostart"), f"{AUTOSTART_NAME}.desktop")
+    
+    def enable(self, command: str):
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        with open(self.path, "w", encoding="utf-8") as f:
+            f.write("[Desktop Entry]\nType=Application\nName=Yandex Music RPC\n"
+                    f"Exec={command}\nX-GNOME-Autostart-enabled=true\n")
+    
+    def disable(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class InMemoryAutostart:
+    """Автозапуск, который только запоминает команду (платформы без автозапуска)"""
+    
+    def __init__(self):
+        self.command: Optional[str] = None
+    
+    def enable(self, command: str):
+        self.command = command
+    
+    def disable(self):
+        self.command = None
+
+
+# === Трей ===
+
+class HeadlessMenuItem:
+    def __init__(self, text, action, enabled: bool = True):
+        self.text = text
+        self.action = action
+        self.enabled = enabled
+
+
+class HeadlessMenu:
+    def __init__(self, *items):
+        self.items = items
+
+
+class HeadlessIcon:
+    """Иконка без трея: run() держит поток до stop(), как pystray.Icon"""
+    
+    def __init__(self, name: str, icon=None, title: str = "", menu: Optional[HeadlessMenu] = None):
+        self.name = name
+        self.icon = icon
+        self.title = title
+        self.menu = menu
+        self._stopped = threading.Event()
+    
+    def update_menu(self):
+        pass
+    
+    def run(self):
+        self._stopped.wait()
+    
+    def stop(self):
+        self._stopped.set()
+
+
+HeadlessTray = SimpleNamespace(Icon=HeadlessIcon, Menu=HeadlessMenu, MenuItem=HeadlessMenuItem)
+
+
+if __name__ == "__main__":
+    # Тест модуля
+    import asyncio
+    import tempfile
+    
+    for kind in BACKENDS:
+        print(f"{kind}: доступны {available(kind)}")
+    
+    source = create_track_source("gsmtc" if sys.platform == "win32" else "memory")
+    print(f"Источник трека: {type(source).__name__}")
+    memory = create_track_source("memory")
+    memory.set_track(TrackInfo(title="Трек", artist="Исполнитель", is_playing=True))
+    print(f"  в памяти: {asyncio.run(memory.get_current_track())}")
+    
+    with tempfile.TemporaryDirectory() as folder:
+        autostart = XdgAutostart(folder)
+        autostart.enable('"/usr/bin/python3" "/opt/app.py"')
+        print(f"XDG автозапуск: {os.path.exists(autostart.path)}")
+        autostart.disable()
+        autostart.disable()
+        print(f"  убран: {not os.path.exists(autostart.path)}")
+    
+    tray = get_tray("headless")
+    icon = tray.Icon("test", None, "Подсказка", tray.Menu(tray.MenuItem("Выход", None)))
+    threading.Timer(0.05, icon.stop).start()
+    icon.run()
+    print("Трей без иконки: run() вернулся после stop()")
+    print(f"Модули ОС не загружены: {not any(m in sys.modules for m in ('winrt', 'winreg', 'pystray'))}")
@@ -0,0 +1,141 @@
+"""
+Бенчмарк раздачи оверлея: задержка от publish() до получения кадра
+сотнями локальных WebSocket-клиентов, плюс медленные клиенты,
+которые не читают и должны пропускать кадры, не тормозя остальных
+
+Запуск: python benchmarks/bench_overlay.py [--clients 300] [--updates 200] [--slow 10] [--json]
+"""
+
+import argparse
+import asyncio
+import base64
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+from fakes import make_track
+
+from bench_pipeline import percentiles
+from metrics import REGISTRY
+from overlay_server import OverlayServer
+
+
+async def _connect(port: int, receive_buffer: int = 0):
+    """Открыть WebSocket к серверу оверлея (receive_buffer — урезать буфер приёма)"""
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    if receive_buffer:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, receive_buffer)
+    sock.setblocking(False)
+    await asyncio.get_running_loop().sock_connect(sock, ("127.0.0.1", port))
+    reader, writer = await asyncio.open_connection(sock=sock)
+    key = base64.b64encode(os.urandom(16)).decode()
+    writer.write(
+        f"GET /ws HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+        f"Sec-WebSocket-Key: {key}\r\nSec-WebSocket-Version: 13\r\n\r\n".encode()
+    )
+    await reader.readuntil(b"\r\n\r\n")
+    return reader, writer
+
+
+async def _read_frame(reader: asyncio.StreamReader) -> bytes:
+    head = await reader.readexactly(2)
+    length = head[1] & 0x7F
+    if length == 126:
+        length = struct.unpack("!H", await reader.readexactly(2))[0]
+    elif length == 127:
+        length = struct.unpack("!Q", await reader.readexactly(8))[0]
+    return await reader.readexactly(length)
+
+
+async def _listen(reader, latencies: list, last_title: str, done: asyncio.Event, counter: list):
+    """Читать кадры до последнего состояния и мерить задержку по updated_at внутри кадра"""
+    while True:
+        payload = await _read_frame(reader)
+        state = json.loads(payload)
+        latencies.append(time.time() - state["updated_at"])
+        if state["track"]["title"] == last_title:
+            break
+    counter[0] += 1
+    if counter[0] == counter[1]:
+        done.set()
+
+
+async def _run(clients: int, updates: int, slow: int, interval: float) -> dict:
+    server = OverlayServer(0)
+    server.start()
+    frames = REGISTRY.get("overlay_frames_total")
+    skipped = REGISTRY.get("overlay_frames_skipped_total")
+    frames_before, skipped_before = frames.value, skipped.value
+    
+    # Медленные клиенты подключаются с маленьким буфером приёма и не читают
+    slow_connections = [await _connect(server.port, receive_buffer=4096) for _ in range(slow)]
+    connections = [await _connect(server.port) for _ in range(clients)]
+    while len(server.clients) < clients + slow:
+        await asyncio.sleep(0.01)
+    
+    latencies: list = []
+    done = asyncio.Event()
+    counter = [0, clients]
+    last_title = make_track(updates - 1).title
+    listeners = [asyncio.create_task(_listen(reader, latencies, last_title, done, counter))
+                 for reader, _ in connections]
+    
+    # Длинная ссылка на обложку, чтобы медленные клиенты быстрее упёрлись в буферы
+    cover = "https://avatars.example/" + "x" * 16000
+    started = time.perf_counter()
+    for index in range(updates):
+        server.publish(make_track(index), cover)
+        await asyncio.sleep(interval)
+    await asyncio.wait_for(done.wait(), 30)
+    elapsed = time.perf_counter() - started
+    
+    for task in listeners:
+        task.cancel()
+    for _, writer in connections + slow_connections:
+        writer.close()
+    server.stop()
+    
+    result = percentiles(latencies)
+    result.update({
+        "clients": clients,
+        "slow_clients": slow,
+        "updates": updates,
+        "frames_serialized": frames.value - frames_before,
+        "deliveries": len(latencies),
+        "skipped": skipped.value - skipped_before,
+        "elapsed_s": round(elapsed, 3),
+    })
+    return result
+
+
+def bench_overlay(clients: int = 300, updates: int = 200, slow: int = 10, interval: float = 0.02) -> dict:
+    """Раздача updates состояний clients клиентам"""
+    return asyncio.run(_run(clients, updates, slow, interval))
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк раздачи оверлея")
+    parser.add_argument("--clients", type=int, default=300, help="Сколько клиентов читают кадры")
+    parser.add_argument("--updates", type=int, default=200, help="Сколько смен состояния")
+    parser.add_argument("--slow", type=int, default=10, help="Сколько клиентов не читают вовсе")
+    parser.add_argument("--json", action="store_true", help="Вывести результат в JSON")
+    args = parser.parse_args()
+    
+    result = bench_overlay(args.clients, args.updates, args.slow)
+    if args.json:
+        print(json.dumps(result, ensure_ascii=False, indent=2))
+        return 0
+    
+    print(f"Клиентов: {result['clients']} (+{result['slow_clients']} не читают), смен: {result['updates']}")
+    print(f"  Сериализовано кадров: {result['frames_serialized']}, доставлено: {result['deliveries']}")
+    print(f"  Задержка раздачи: p50 {result['p50_ms']:.2f} мс, p95 {result['p95_ms']:.2f} мс, "
+          f"max {result['max_ms']:.2f} мс")
+    print(f"  Вытеснено более свежими (медленные клиенты и отставшие): {result['skipped']}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
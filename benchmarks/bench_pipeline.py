@@ -0,0 +1,331 @@
+"""
+Сквозные бенчмарки конвейера на поддельных бэкендах
+Работают на Linux без сети и пишут результаты в JSON для сравнения между версиями
+
+Запуск: python benchmarks/bench_pipeline.py [tick track_change cover_cache idle_cpu history lyrics media_worker] [--output файл.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+from bisect import bisect_right
+from datetime import datetime
+from typing import List
+
+from fakes import (
+    LYRICS_LINE_SECONDS, ROOT, FakeDiscordRPC, FakeMediaSource, FakeYandexAPI, StuckMediaSource,
+    accelerate, make_track, make_yandex_api, run_until
+)
+
+from pipeline import PresencePipeline
+
+RESULTS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "results")
+
+
+def percentiles(samples: List[float]) -> dict:
+    """p50/p95/max в миллисекундах"""
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+    pick = lambda q: ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+    return {
+        "count": len(ordered),
+        "p50_ms": round(pick(0.5) * 1000, 3),
+        "p95_ms": round(pick(0.95) * 1000, 3),
+        "max_ms": round(ordered[-1] * 1000, 3),
+    }
+
+
+# === Бенчмарки ===
+
+def bench_tick(duration: float = 2.0) -> dict:
+    """Задержка одного тика: чтение трека -> вызов update_presence"""
+    media = FakeMediaSource(make_track())
+    discord = FakeDiscordRPC()
+    pipeline = PresencePipeline(media, discord, FakeYandexAPI())
+    accelerate(pipeline, 50)
+    
+    started = time.perf_counter()
+    asyncio.run(run_until(pipeline, lambda: time.perf_counter() - started > duration,
+                          timeout=duration + 5))
+    
+    latencies = []
+    for call_time in discord.call_times:
+        index = bisect_right(media.read_times, call_time) - 1
+        if index >= 0:
+            latencies.append(call_time - media.read_times[index])
+    result = percentiles(latencies)
+    result["ticks"] = media.reads
+    return result
+
+
+def bench_track_change(changes: int = 10, factor: float = 10) -> dict:
+    """Время от смены трека до отправки статуса (интервалы опроса ускорены в factor раз)"""
+    media = FakeMediaSource(make_track(0))
+    discord = FakeDiscordRPC()
+    pipeline = PresencePipeline(media, discord, FakeYandexAPI(search_latency=0.05))
+    accelerate(pipeline, factor)
+    latencies = []
+    
+    async def drive():
+        task = asyncio.create_task(pipeline.run())
+        rng = random.Random(42)
+        await asyncio.sleep(0.5)
+        for index in range(1, changes + 1):
+            # Ждём, пока конвейер вернётся в обычный режим воспроизведения
+            await asyncio.sleep(pipeline.scheduler.action_window + rng.random() * pipeline.update_interval)
+            track = make_track(index)
+            before = len(discord.sent)
+            media.set_track(track)
+            while not any(track.title in key for _, key in discord.sent[before:]):
+                await asyncio.sleep(0.001)
+            sent_at = next(t for t, key in discord.sent[before:] if track.title in key)
+            latencies.append(sent_at - media.changed_at)
+        pipeline.stop()
+        await task
+    
+    asyncio.run(drive())
+    result = percentiles(latencies)
+    result["time_scale"] = factor
+    result["real_p50_ms"] = round(result["p50_ms"] * factor, 1)
+    return result
+
+
+def bench_cover_cache(number: int = 200000) -> dict:
+    """Стоимость пути через кэш обложек: попадание и промах"""
+    api = make_yandex_api()
+    api.get_cover_url("Трек", "Исполнитель")
+    hit = timeit.timeit(lambda: api.get_cover_url("Трек", "Исполнитель"), number=number)
+    
+    misses = 2000
+    started = time.perf_counter()
+    for index in range(misses):
+        api.get_cover_url(f"Трек {index}", "Исполнитель")
+    miss = time.perf_counter() - started
+    
+    pipeline = PresencePipeline(FakeMediaSource(), FakeDiscordRPC(), api)
+    track = make_track()
+    pipeline._get_cover_url(track)
+    pipeline_hit = timeit.timeit(lambda: pipeline._get_cover_url(track), number=number)
+    
+    return {
+        "api_hit_us": round(hit / number * 1e6, 3),
+        "api_miss_us": round(miss / misses * 1e6, 3),
+        "pipeline_hit_us": round(pipeline_hit / number * 1e6, 3),
+    }
+
+
+def bench_history(plays: int = 100000, number: int = 100000) -> dict:
+    """Цена записи истории в цикле опроса и скорость запросов к ней"""
+    from history import ListeningHistory, Play, PlayTracker
+    
+    # На Windows файл базы занят соединением запросов — не мешаем удалению папки
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+        history = ListeningHistory(os.path.join(folder, "history.db"), flush_batch=1000)
+        
+        # Путь из цикла опроса: каждый тик — observe, каждые 40 тиков — новый трек
+        tracker = PlayTracker(history.record)
+        tracks = [make_track(index) for index in range(number // 40 + 1)]
+        now = time.time()
+        started = time.perf_counter()
+        for tick in range(number):
+            tracker.observe(tracks[tick // 40], now + tick * 5)
+        observe = time.perf_counter() - started
+        
+        rng = random.Random(1)
+        base = now - 365 * 86400
+        for index in range(plays):
+            history.record(Play(base + index * 300, f"Трек {rng.randrange(5000)}",
+                                f"Исполнитель {rng.randrange(500)}", "Альбом", 180, rng.randrange(5, 180)))
+        started = time.perf_counter()
+        history.close(timeout=60)
+        flush = time.perf_counter() - started
+        
+        month = now - 30 * 86400
+        queries = {
+            "top_artists_month": lambda: history.top_artists(month),
+            "top_tracks_month": lambda: history.top_tracks(month),
+            "listening_time_month": lambda: history.listening_time(month),
+            "by_day_year": lambda: history.listening_time_by_day(base),
+        }
+        result = {
+            "observe_us": round(observe / number * 1e6, 3),
+            "flush_plays_per_s": round(plays / flush),
+        }
+        for name, query in queries.items():
+            result[f"{name}_ms"] = round(timeit.timeit(query, number=20) / 20 * 1000, 3)
+        return result
+
+
+class _PlayingSource(FakeMediaSource):
+    """Медиа-сессия, в которой трек играет с начала в реальном времени"""
+    
+    def __init__(self):
+        super().__init__(make_track())
+        self.started = time.perf_counter()
+    
+    async def get_current_track(self):
+        self.reads += 1
+        return make_track(position=int(time.perf_counter() - self.started))
+
+
+def bench_lyrics(duration: float = 9.0, number: int = 200000) -> dict:
+    """Поиск строки по позиции и задержка смены строки в статусе (реальное время)"""
+    from lyrics import parse_lrc
+    
+    timeline = parse_lrc("\n".join(f"[{i // 60:02d}:{i % 60:02d}.00]Строка {i}" for i in range(600)))
+    lookup = timeit.timeit(lambda: timeline.line_at(317.5), number=number)
+    
+    media = _PlayingSource()
+    discord = FakeDiscordRPC()
+    pipeline = PresencePipeline(media, discord, make_yandex_api(), lyrics_mode="state")
+    asyncio.run(run_until(pipeline, lambda: time.perf_counter() - media.started > duration,
+                          timeout=duration + 5, poll=0.05))
+    
+    # Задержка: отправка строки k относительно её метки k * LYRICS_LINE_SECONDS.
+    # Позиция из медиа-сессии целая, поэтому до секунды задержки — ожидаемо
+    lags = []
+    for sent_at, track_key in discord.sent:
+        lyric = track_key.rsplit("|", 1)[-1]
+        if lyric.startswith("Строка "):
+            line_start = media.started + int(lyric.split()[-1]) * LYRICS_LINE_SECONDS
+            lags.append(max(0.0, sent_at - line_start))
+    result = {"lookup_us": round(lookup / number * 1e6, 3), "media_reads": media.reads}
+    result.update({f"line_{key}": value for key, value in percentiles(lags).items()})
+    return result
+
+
+def _idle_run(track, duration: float, factor: float) -> dict:
+    media = FakeMediaSource(track)
+    discord = FakeDiscordRPC()
+    pipeline = PresencePipeline(media, discord, FakeYandexAPI())
+    accelerate(pipeline, factor)
+    
+    cpu_started = time.process_time()
+    started = time.perf_counter()
+    asyncio.run(run_until(pipeline, lambda: time.perf_counter() - started > duration,
+                          timeout=duration + 5, poll=0.05))
+    cpu = time.process_time() - cpu_started
+    simulated_hours = (time.perf_counter() - started) * factor / 3600
+    return {
+        "cpu_seconds_per_hour": round(cpu / simulated_hours, 3),
+        "wakeups_per_hour": round(media.reads / simulated_hours),
+        "fixed_5s_wakeups_per_hour": 720,
+    }
+
+
+def bench_idle_cpu(duration: float = 5.0, factor: float = 60) -> dict:
+    """CPU за час простоя: Yandex Music закрыт и трек на паузе"""
+    return {
+        "no_session": _idle_run(None, duration, factor),
+        "paused": _idle_run(make_track(is_playing=False), duration, factor),
+        "time_scale": factor,
+    }
+
+
+def bench_media_worker(duration: float = 6.0, stall_timeout: float = 1.0) -> dict:
+    """
+    Медиа-сессия в отдельном процессе, которая зависает после трёх чтений:
+    сколько раз процесс перезапущен и как долго конвейер ждал чтения трека
+    """
+    from media_worker import ProcessTrackSource
+    
+    source = ProcessTrackSource(StuckMediaSource, args=(make_track(), 3),
+                                poll_interval=0.2, stall_timeout=stall_timeout)
+    read_ms = []
+    read = source.get_current_track
+    
+    async def timed_read():
+        started = time.perf_counter()
+        track = await read()
+        read_ms.append((time.perf_counter() - started) * 1000)
+        return track
+    
+    source.get_current_track = timed_read
+    discord = FakeDiscordRPC()
+    pipeline = PresencePipeline(source, discord, FakeYandexAPI())
+    accelerate(pipeline, 10)
+    started = time.perf_counter()
+    try:
+        asyncio.run(run_until(pipeline, lambda: time.perf_counter() - started > duration,
+                              timeout=duration + 5, poll=0.05))
+    finally:
+        source.close()
+    # Первое чтение ждёт запуска процесса — его считаем отдельно
+    return {
+        "respawns": source.respawns,
+        "stall_timeout_s": stall_timeout,
+        "first_read_ms": round(read_ms[0], 1),
+        "read_max_ms": round(max(read_ms[1:]), 3),
+        "reads": len(read_ms),
+        "presence_updates": len(discord.sent),
+    }
+
+
+BENCHMARKS = {
+    "tick": bench_tick,
+    "track_change": bench_track_change,
+    "cover_cache": bench_cover_cache,
+    "idle_cpu": bench_idle_cpu,
+    "history": bench_history,
+    "lyrics": bench_lyrics,
+    "media_worker": bench_media_worker,
+}
+
+
+def _git_revision() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return ""
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарки конвейера")
+    parser.add_argument("names", nargs="*",
+                        help=f"Какие бенчмарки запустить: {', '.join(BENCHMARKS)} (по умолчанию все)")
+    parser.add_argument("--output", help="Файл результатов (по умолчанию benchmarks/results/...)")
+    args = parser.parse_args()
+    
+    names = args.names or list(BENCHMARKS)
+    unknown = [name for name in names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"неизвестные бенчмарки: {', '.join(unknown)}")
+    
+    results = {}
+    for name in names:
+        print(f"▶ {name}...", flush=True)
+        results[name] = BENCHMARKS[name]()
+        print(f"  {json.dumps(results[name], ensure_ascii=False)}")
+    
+    report = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "revision": _git_revision(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+        },
+        "results": results,
+    }
+    
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"pipeline-{datetime.now():%Y%m%d-%H%M%S}.json")
+    with open(output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты: {output}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
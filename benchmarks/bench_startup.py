@@ -0,0 +1,161 @@
+"""
+Регрессионный бенчмарк запуска
+Проверяет бюджет времени импорта, отсутствие тяжёлых модулей при старте
+фонового режима, время до первого статуса и до статуса с обложкой
+при холодном и тёплом (со снимком) запуске, параллельность шагов
+запуска — на поддельных бэкендах.
+Код возврата 1, если бюджет превышен
+
+Запуск: python benchmarks/bench_startup.py [--json results.json]
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+
+from fakes import FakeDiscordRPC, FakeMediaSource, FakeYandexAPI, make_track, run_until
+from startup_profile import import_time_ms, loaded_modules
+
+from pipeline import PresencePipeline
+
+# Бюджеты (мс)
+IMPORT_BUDGET_MS = {
+    "daemon": 250,
+    "pipeline": 200,
+}
+FIRST_PRESENCE_BUDGET_MS = 100
+# Тёплый перезапуск: статус с обложкой без поиска в Yandex Music
+WARM_COVER_PRESENCE_BUDGET_MS = 100
+# Параллельный запуск: первый статус не позже самого долгого из шагов
+# (медиа-сессия, Discord) плюс этот запас
+PARALLEL_SLACK_MS = 50
+
+# Задержки медленных бэкендов для проверки параллельного запуска (с)
+STARTUP_LATENCY = {"media": 0.15, "discord": 0.2, "yandex_init": 0.3, "search": 0.3}
+
+# Эти модули не должны грузиться при импорте фонового режима
+HEAVY_MODULES = ("tkinter", "PIL", "pystray", "pypresence", "yandex_music", "winrt",
+                 "winreg", "webbrowser")
+
+
+def measure_first_presence(runs: int = 5, search_latency: float = 0.3) -> float:
+    """Медианное время от запуска конвейера до первого статуса (мс)"""
+    samples = []
+    for _ in range(runs):
+        discord = FakeDiscordRPC()
+        pipeline = PresencePipeline(FakeMediaSource(make_track()), discord,
+                                    FakeYandexAPI(search_latency=search_latency))
+        asyncio.run(run_until(pipeline, lambda: pipeline.first_presence_at is not None))
+        samples.append((pipeline.first_presence_at - pipeline.started_at) * 1000)
+    samples.sort()
+    return samples[len(samples) // 2]
+
+
+def _cover_presence_ms(pipeline, discord: FakeDiscordRPC):
+    """Когда ушёл первый статус с обложкой (мс от запуска) или None"""
+    for sent_at, track_key in list(discord.sent):
+        if track_key and track_key.split("|")[3] != "None":
+            return (sent_at - pipeline.started_at) * 1000
+    return None
+
+
+def measure_warm_restart(runs: int = 5, search_latency: float = 0.3) -> dict:
+    """Медианное время до статуса с обложкой: без снимка и со снимком прошлого запуска (мс)"""
+    samples = {"cold": [], "warm": []}
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "snapshot.json")
+        for _ in range(runs):
+            for kind in ("cold", "warm"):
+                if kind == "cold" and os.path.exists(path):
+                    os.remove(path)
+                discord = FakeDiscordRPC()
+                pipeline = PresencePipeline(FakeMediaSource(make_track()), discord,
+                                            FakeYandexAPI(search_latency=search_latency),
+                                            snapshot_path=path)
+                asyncio.run(run_until(pipeline, lambda: _cover_presence_ms(pipeline, discord) is not None))
+                samples[kind].append(_cover_presence_ms(pipeline, discord))
+    return {kind: sorted(values)[len(values) // 2] for kind, values in samples.items()}
+
+
+def measure_parallel_startup(runs: int = 3, latency: dict = STARTUP_LATENCY) -> dict:
+    """
+    Медианное время до первого статуса и до статуса с обложкой (мс), когда
+    каждый шаг запуска медленный; sequential — сумма шагов при запуске по очереди
+    """
+    samples = {"first": [], "cover": []}
+    for _ in range(runs):
+        discord = FakeDiscordRPC(connect_latency=latency["discord"])
+        pipeline = PresencePipeline(FakeMediaSource(make_track(), latency=latency["media"]), discord,
+                                    FakeYandexAPI(search_latency=latency["search"],
+                                                  init_latency=latency["yandex_init"]))
+        asyncio.run(run_until(pipeline, lambda: _cover_presence_ms(pipeline, discord) is not None))
+        samples["first"].append((pipeline.first_presence_at - pipeline.started_at) * 1000)
+        samples["cover"].append(_cover_presence_ms(pipeline, discord))
+    result = {kind: sorted(values)[len(values) // 2] for kind, values in samples.items()}
+    result["sequential"] = sum(latency.values()) * 1000
+    return result
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Бенчмарк запуска")
+    parser.add_argument("--json", help="Записать результаты в JSON-файл")
+    args = parser.parse_args()
+    
+    results = {"import_ms": {}, "heavy_modules": {}, "budgets": {}}
+    failures = []
+    
+    for module, budget in IMPORT_BUDGET_MS.items():
+        elapsed = import_time_ms(module)
+        results["import_ms"][module] = round(elapsed, 2)
+        results["budgets"][f"import_{module}_ms"] = budget
+        print(f"import {module}: {elapsed:.1f} мс (бюджет {budget} мс)")
+        if elapsed > budget:
+            failures.append(f"import {module} {elapsed:.1f} мс > {budget} мс")
+    
+    heavy = loaded_modules("daemon", HEAVY_MODULES)
+    results["heavy_modules"]["daemon"] = heavy
+    print(f"Тяжёлые модули при import daemon: {', '.join(heavy) or 'нет'}")
+    if heavy:
+        failures.append(f"import daemon загружает {', '.join(heavy)}")
+    
+    first_presence = measure_first_presence()
+    results["first_presence_ms"] = round(first_presence, 2)
+    results["budgets"]["first_presence_ms"] = FIRST_PRESENCE_BUDGET_MS
+    print(f"Время до первого статуса: {first_presence:.1f} мс (бюджет {FIRST_PRESENCE_BUDGET_MS} мс)")
+    if first_presence > FIRST_PRESENCE_BUDGET_MS:
+        failures.append(f"первый статус {first_presence:.1f} мс > {FIRST_PRESENCE_BUDGET_MS} мс")
+    
+    restart = measure_warm_restart()
+    results["cover_presence_ms"] = {kind: round(value, 2) for kind, value in restart.items()}
+    results["budgets"]["warm_cover_presence_ms"] = WARM_COVER_PRESENCE_BUDGET_MS
+    print(f"Статус с обложкой: без снимка {restart['cold']:.1f} мс, "
+          f"со снимком {restart['warm']:.1f} мс (бюджет {WARM_COVER_PRESENCE_BUDGET_MS} мс)")
+    if restart["warm"] > WARM_COVER_PRESENCE_BUDGET_MS:
+        failures.append(f"тёплый перезапуск {restart['warm']:.1f} мс > {WARM_COVER_PRESENCE_BUDGET_MS} мс")
+    
+    parallel = measure_parallel_startup()
+    budget = max(STARTUP_LATENCY["media"], STARTUP_LATENCY["discord"]) * 1000 + PARALLEL_SLACK_MS
+    results["parallel_startup_ms"] = {kind: round(value, 2) for kind, value in parallel.items()}
+    results["budgets"]["parallel_first_presence_ms"] = budget
+    print(f"Медленные бэкенды: первый статус {parallel['first']:.1f} мс (бюджет {budget:.0f} мс), "
+          f"с обложкой {parallel['cover']:.1f} мс, по очереди было бы {parallel['sequential']:.0f} мс")
+    if parallel["first"] > budget:
+        failures.append(f"параллельный запуск {parallel['first']:.1f} мс > {budget:.0f} мс")
+    
+    results["failures"] = failures
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    
+    if failures:
+        print("\n✗ Регрессия:\n  " + "\n  ".join(failures))
+        return 1
+    print("\n✓ Все бюджеты соблюдены")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,238 @@
+"""
+Поддельные бэкенды для бенчмарков: медиа-сессия, Discord и Yandex Music
+Работают на любой ОС без сети, задержки задаются параметрами
+"""
+
+import asyncio
+import os
+import sys
+import time
+from collections import deque
+from types import SimpleNamespace
+from typing import List, Optional
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.insert(0, ROOT)
+
+from backends import InMemoryTrackSource
+from media_session import TrackInfo
+
+# Как часто меняется строка в поддельном тексте песни (с)
+LYRICS_LINE_SECONDS = 4
+
+
+def make_track(index: int = 0, is_playing: bool = True, duration: int = 180, position: int = 0) -> TrackInfo:
+    """Трек с предсказуемыми полями"""
+    return TrackInfo(
+        title=f"Трек {index}",
+        artist=f"Исполнитель {index % 7}",
+        album=f"Альбом {index % 3}",
+        is_playing=is_playing,
+        duration=duration,
+        position=position
+    )
+
+
+class FakeMediaSource(InMemoryTrackSource):
+    """Источник трека в памяти с задержкой чтения и счётчиками"""
+    
+    def __init__(self, track: Optional[TrackInfo] = None, latency: float = 0.0):
+        super().__init__(track)
+        self.latency = latency
+        self.reads = 0
+        self.changed_at: Optional[float] = None
+        self.read_times: List[float] = []
+    
+    def set_track(self, track: Optional[TrackInfo]):
+        self.track = track
+        self.changed_at = time.perf_counter()
+    
+    async def get_current_track(self) -> Optional[TrackInfo]:
+        self.reads += 1
+        self.read_times.append(time.perf_counter())
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self.track
+
+
+class StuckMediaSource(InMemoryTrackSource):
+    """Медиа-сессия, которая после hang_after чтений зависает намертво, как застрявший WinRT"""
+    
+    def __init__(self, track: Optional[TrackInfo] = None, hang_after: int = 3):
+        super().__init__(track)
+        self.hang_after = hang_after
+        self.reads = 0
+    
+    async def get_current_track(self) -> Optional[TrackInfo]:
+        self.reads += 1
+        if self.reads > self.hang_after:
+            # Блокирующий вызов: стоит весь поток, а не только корутина
+            time.sleep(3600)
+        return self.track
+
+
+class FakeDiscordRPC:
+    """Discord с тем же отсевом повторов, что и DiscordRPC, но без IPC"""
+    
+    def __init__(self, connect_latency: float = 0.0, update_latency: float = 0.0,
+                 available: bool = True, history: Optional[int] = None):
+        """history — сколько последних отправок помнить (None — все)"""
+        self.connect_latency = connect_latency
+        self.update_latency = update_latency
+        self.available = available
+        self.connected = False
+        self.connects = 0
+        # (time.perf_counter(), track_key); при ограниченной истории — deque
+        self.sent = [] if history is None else deque(maxlen=history)
+        self.sent_count = 0
+        self.calls = 0
+        self.call_times = [] if history is None else deque(maxlen=history)
+        self._last_track_key = None
+    
+    def connect(self) -> bool:
+        self.connects += 1
+        if self.connect_latency:
+            time.sleep(self.connect_latency)
+        self.connected = self.available
+        return self.connected
+    
+    def disconnect(self):
+        self.connected = False
+    
+    def invalidate(self):
+        self._last_track_key = None
+    
+    def set_template(self, key: str, value):
+        self.invalidate()
+    
+    def rate_limit_delay(self, now: Optional[float] = None) -> float:
+        # Лимит Discord не моделируется: бенчмарки меряют сам конвейер
+        return 0.0
+    
+    def update_presence(self, track, show_timestamp: bool = True, cover_url: Optional[str] = None,
+                        lyric: Optional[str] = None, lyric_field: str = "state") -> bool:
+        self.calls += 1
+        self.call_times.append(time.perf_counter())
+        if not self.connected:
+            return False
+        track_key = f"{track.title}|{track.artist}|{track.is_playing}|{cover_url}|{lyric}" if track else None
+        if track_key == self._last_track_key:
+            return True
+        self._last_track_key = track_key
+        if self.update_latency:
+            time.sleep(self.update_latency)
+        self.sent.append((time.perf_counter(), track_key))
+        self.sent_count += 1
+        return True
+
+
+class FakeYandexAPI:
+    """Yandex Music API с кэшем обложек и задержкой поиска"""
+    
+    def __init__(self, search_latency: float = 0.0, init_latency: float = 0.0):
+        self.search_latency = search_latency
+        # Создание клиента (импорт yandex_music и init) — один раз, до первого поиска
+        self.init_latency = init_latency
+        self.initialized = False
+        self.searches = 0
+        self._cover_cache: dict = {}
+    
+    def set_token(self, token):
+        pass
+    
+    def warm_up(self):
+        if not self.initialized:
+            if self.init_latency:
+                time.sleep(self.init_latency)
+            self.initialized = True
+    
+    def get_cover_uri(self, title: str, artist: str) -> Optional[str]:
+        cache_key = f"{artist}|{title}"
+        if cache_key in self._cover_cache:
+            return self._cover_cache[cache_key]
+        self.warm_up()
+        self.searches += 1
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        cover_uri = f"avatars.example/{abs(hash(cache_key))}/%%"
+        self._cover_cache[cache_key] = cover_uri
+        return cover_uri
+    
+    def get_cover_url(self, title: str, artist: str, size: str = "400x400") -> Optional[str]:
+        cover_uri = self.get_cover_uri(title, artist)
+        return f"https://{cover_uri.replace('%%', size)}" if cover_uri else None
+
+
+class FakeYandexClient:
+    """Клиент yandex_music: поиск всегда находит один трек"""
+    
+    def __init__(self, search_latency: float = 0.0):
+        self.search_latency = search_latency
+        self.searches = 0
+    
+    def search(self, query: str, type_: str = "track"):
+        self.searches += 1
+        if self.search_latency:
+            time.sleep(self.search_latency)
+        artist, _, title = query.partition(" - ")
+        track = SimpleNamespace(
+            id=abs(hash(query)) % 10 ** 8,
+            title=title,
+            artists=[SimpleNamespace(name=artist)],
+            albums=[SimpleNamespace(title="Альбом")],
+            cover_uri=f"avatars.example/get-music-content/{abs(hash(query))}/%%",
+            duration_ms=180000,
+        )
+        return SimpleNamespace(tracks=SimpleNamespace(results=[track]))
+    
+    def tracks_lyrics(self, track_id, format: str = "LRC"):
+        # Строка каждые LYRICS_LINE_SECONDS секунд на 3 минуты трека
+        lines = (f"[{t // 60:02d}:{t % 60:02d}.00]Строка {t // LYRICS_LINE_SECONDS}"
+                 for t in range(0, 180, LYRICS_LINE_SECONDS))
+        text = "\n".join(lines)
+        return SimpleNamespace(fetch_lyrics=lambda: text)
+
+
+def make_yandex_api(search_latency: float = 0.0):
+    """Настоящий YandexMusicAPI (с его кэшем) поверх поддельного клиента"""
+    from yandex_api import YandexMusicAPI
+    api = YandexMusicAPI()
+    api._client = FakeYandexClient(search_latency)
+    return api
+
+
+def accelerate(pipeline, factor: float):
+    """
+    Ускорить все таймеры конвейера в factor раз
+    (интервалы опроса, watchdog), чтобы симулировать часы за секунды
+    """
+    scheduler = pipeline.scheduler
+    scheduler.fast_interval /= factor
+    scheduler.paused_interval /= factor
+    scheduler.idle_interval /= factor
+    scheduler.action_window /= factor
+    scheduler.track_end_margin /= factor
+    scheduler.wakeup_window /= factor
+    pipeline.update_interval /= factor
+    pipeline.supervisor.watchdog_interval /= factor
+
+
+async def run_until(pipeline, predicate, timeout: float = 10.0, poll: float = 0.001) -> bool:
+    """
+    Запустить конвейер и остановить, когда predicate() станет истинным.
+    
+    Returns:
+        True если условие выполнилось до таймаута
+    """
+    task = asyncio.create_task(pipeline.run())
+    deadline = time.perf_counter() + timeout
+    ok = False
+    while time.perf_counter() < deadline:
+        if predicate():
+            ok = True
+            break
+        await asyncio.sleep(poll)
+    pipeline.stop()
+    await task
+    return ok
@@ -0,0 +1,196 @@
+"""
+Воспроизведение трасс медиа-сессии через весь конвейер
+Discord и Yandex Music подменены поддельными, время ускоряется в --speed раз.
+Отчёт: сколько статусов отправлено, сколько поисков сделано, задержки смены трека
+
+Трассу пишет MediaSessionManager.start_recording() (python daemon.py --record-trace файл.jsonl),
+синтетические сценарии: --scenario session|rapid_skips|long_pause
+
+Запуск: python benchmarks/replay.py трасса.jsonl [--speed 10] [--discord-outage 60:120] [--json]
+"""
+
+import argparse
+import asyncio
+import json
+import sys
+import time
+from typing import List, Optional, Tuple
+
+from fakes import FakeDiscordRPC, FakeYandexAPI, accelerate, make_track
+
+from media_session import TrackInfo
+from media_trace import TraceReplayer, load_trace, save_trace
+from pipeline import PresencePipeline
+from bench_pipeline import percentiles
+
+# Сколько секунд трассы ждать после последнего события
+TAIL = 5.0
+
+
+# === Синтетические сценарии ===
+
+def scenario_session(tracks: int = 20, duration: int = 180) -> List[Tuple[float, Optional[TrackInfo]]]:
+    """Обычное прослушивание: треки целиком подряд"""
+    return [(i * duration, make_track(i, duration=duration)) for i in range(tracks)]
+
+
+def scenario_rapid_skips(skips: int = 60, gap: float = 0.4) -> List[Tuple[float, Optional[TrackInfo]]]:
+    """Быстрое перелистывание треков, затем прослушивание последнего"""
+    events = [(i * gap, make_track(i)) for i in range(skips)]
+    events.append((skips * gap + 30, make_track(skips - 1, position=30)))
+    return events
+
+
+def scenario_long_pause(pause: int = 1800) -> List[Tuple[float, Optional[TrackInfo]]]:
+    """Пауза посреди трека, потом продолжение и закрытие плеера"""
+    return [
+        (0, make_track(0)),
+        (60, make_track(0, is_playing=False, position=60)),
+        (60 + pause, make_track(0, position=60)),
+        (180 + pause, None),
+    ]
+
+
+SCENARIOS = {
+    "session": scenario_session,
+    "rapid_skips": scenario_rapid_skips,
+    "long_pause": scenario_long_pause,
+}
+
+
+# === Воспроизведение ===
+
+def _track_changes(events) -> List[Tuple[float, Optional[str]]]:
+    """Моменты, когда статус в Discord должен поменяться: (время трассы, префикс ключа)"""
+    changes = []
+    last = object()
+    for offset, track in events:
+        key = f"{track.title}|{track.artist}|{track.is_playing}|" if track else None
+        if key != last:
+            changes.append((offset, key))
+            last = key
+    return changes
+
+
+async def _discord_outage(replayer: TraceReplayer, discord: FakeDiscordRPC, start: float, end: float):
+    """Discord закрывается на отрезке трассы [start, end]"""
+    await asyncio.sleep(max(0.0, start - replayer.trace_time()) / replayer.speed)
+    discord.available = False
+    discord.disconnect()
+    discord.invalidate()
+    await asyncio.sleep(max(0.0, end - replayer.trace_time()) / replayer.speed)
+    discord.available = True
+
+
+def replay(events, speed: float = 10.0, outages: List[Tuple[float, float]] = (),
+           search_latency: float = 0.2, update_latency: float = 0.05) -> dict:
+    """
+    Прогнать трассу через конвейер.
+    
+    Args:
+        events: События трассы
+        speed: Ускорение времени
+        outages: Отрезки трассы (с), когда Discord недоступен
+        search_latency: Задержка поиска в Yandex Music (секунды трассы)
+        update_latency: Задержка отправки в Discord (секунды трассы)
+    """
+    replayer = TraceReplayer(events, speed)
+    discord = FakeDiscordRPC(update_latency=update_latency / speed)
+    yandex = FakeYandexAPI(search_latency=search_latency / speed)
+    pipeline = PresencePipeline(replayer, discord, yandex)
+    accelerate(pipeline, speed)
+    
+    async def drive():
+        replayer.start()
+        started = time.perf_counter()
+        task = asyncio.create_task(pipeline.run())
+        outage_tasks = [asyncio.create_task(_discord_outage(replayer, discord, start, end))
+                        for start, end in outages]
+        await asyncio.sleep((replayer.duration + TAIL) / speed)
+        pipeline.stop()
+        await task
+        for outage in outage_tasks:
+            outage.cancel()
+        return started
+    
+    wall_started = time.perf_counter()
+    started = asyncio.run(drive())
+    wall = time.perf_counter() - wall_started
+    
+    # Задержки считаем в секундах трассы: от смены до первого статуса с новым треком
+    sent = [((sent_at - started) * speed, key) for sent_at, key in discord.sent]
+    latencies = []
+    missed = 0
+    for offset, prefix in _track_changes(events):
+        delivered = next((t for t, key in sent if t >= offset and
+                          (key == prefix if prefix is None else key and key.startswith(prefix))), None)
+        if delivered is None:
+            missed += 1
+        else:
+            latencies.append(delivered - offset)
+    
+    changes = len(latencies) + missed
+    return {
+        "trace": {"events": len(events), "duration_s": round(replayer.duration, 1), "changes": changes},
+        "speed": speed,
+        "wall_s": round(wall, 2),
+        "media_reads": replayer.reads,
+        "presence_updates": len(discord.sent),
+        "update_calls": discord.calls,
+        "discord_connects": discord.connects,
+        "yandex_lookups": yandex.searches,
+        "missed_changes": missed,
+        "change_latency": percentiles(latencies),
+    }
+
+
+def _parse_outage(value: str) -> Tuple[float, float]:
+    start, _, end = value.partition(":")
+    return float(start), float(end)
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Воспроизведение трасс медиа-сессии")
+    parser.add_argument("trace", nargs="?", help="Файл трассы (JSON Lines)")
+    parser.add_argument("--scenario", help=f"Синтетический сценарий: {', '.join(SCENARIOS)}")
+    parser.add_argument("--speed", type=float, default=10.0, help="Ускорение времени (1 — реальное время)")
+    parser.add_argument("--discord-outage", action="append", type=_parse_outage, default=[],
+                        metavar="НАЧАЛО:КОНЕЦ", help="Discord недоступен на отрезке трассы (с)")
+    parser.add_argument("--save-trace", help="Сохранить сценарий в файл трассы")
+    parser.add_argument("--json", action="store_true", help="Вывести отчёт в JSON")
+    args = parser.parse_args()
+    
+    if args.scenario:
+        if args.scenario not in SCENARIOS:
+            parser.error(f"Неизвестный сценарий: {args.scenario}")
+        events = SCENARIOS[args.scenario]()
+        if args.save_trace:
+            save_trace(args.save_trace, events)
+    elif args.trace:
+        events = load_trace(args.trace)
+    else:
+        parser.error("Укажите файл трассы или --scenario")
+    
+    report = replay(events, args.speed, args.discord_outage)
+    
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+        return 0
+    
+    latency = report["change_latency"]
+    print(f"Трасса: {report['trace']['events']} событий, {report['trace']['duration_s']} с, "
+          f"смен статуса {report['trace']['changes']}")
+    print(f"Прогон: x{report['speed']:g}, {report['wall_s']} с")
+    print(f"  Чтений медиа:        {report['media_reads']}")
+    print(f"  Статусов отправлено: {report['presence_updates']} (вызовов {report['update_calls']})")
+    print(f"  Подключений Discord: {report['discord_connects']}")
+    print(f"  Поисков Yandex:      {report['yandex_lookups']}")
+    print(f"  Пропущено смен:      {report['missed_changes']}")
+    if latency["count"]:
+        print(f"  Задержка смены:      p50 {latency['p50_ms']:.0f} мс, p95 {latency['p95_ms']:.0f} мс, "
+              f"max {latency['max_ms']:.0f} мс")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
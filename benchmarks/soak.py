@@ -0,0 +1,242 @@
+"""
+Длительный прогон (soak): дни прослушивания за минуты
+Конвейер работает на поддельных бэкендах с ускоренным временем,
+каждый симулированный час снимаются tracemalloc и RSS.
+Отчёт: рост памяти за симулированный час и места, где растут аллокации.
+Код выхода 1, если рост превышает порог
+
+Запуск: python benchmarks/soak.py [--hours 48] [--speed 3600] [--threshold-kb 64] [--json файл.json]
+"""
+
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+import tracemalloc
+from typing import List, Optional, Tuple
+
+from fakes import FakeDiscordRPC, accelerate, make_track, make_yandex_api
+
+from media_session import TrackInfo
+from metrics import process_rss_bytes
+from pipeline import PresencePipeline
+
+# Порог роста по умолчанию (КБ за симулированный час)
+TRACED_THRESHOLD_KB = 64
+RSS_THRESHOLD_KB = 1024
+
+# Первые часы не учитываем: кэши и пулы заполняются
+WARMUP_HOURS = 2
+
+# Watchdog при сильном ускорении не должен крутиться чаще этого (с)
+MIN_WATCHDOG_INTERVAL = 0.05
+
+
+class ListeningSimulator:
+    """
+    Бесконечная сессия прослушивания с ускоренным временем:
+    ночью плеер закрыт, днём треки из большого каталога, пропуски и паузы.
+    Состояние генерируется по ходу, чтобы сам симулятор не копил память
+    """
+    
+    def __init__(self, speed: float, catalogue: int = 20000, seed: int = 1,
+                 day_hours: int = 16, skip_chance: float = 0.3, pause_chance: float = 0.05):
+        self.speed = speed
+        self.catalogue = catalogue
+        self.day_hours = day_hours
+        self.skip_chance = skip_chance
+        self.pause_chance = pause_chance
+        self._rng = random.Random(seed)
+        self._started: Optional[float] = None
+        # Текущий отрезок: (трек, начало, конец, позиция в начале, играет ли)
+        self._segment: Tuple[Optional[TrackInfo], float, float, int, bool] = (None, 0.0, 0.0, 0, False)
+        self.reads = 0
+        self.tracks = 0
+    
+    def start(self):
+        self._started = time.perf_counter()
+    
+    def sim_time(self) -> float:
+        """Симулированное время (с)"""
+        return (time.perf_counter() - self._started) * self.speed
+    
+    def _next_segment(self, now: float):
+        track, _, _, position, playing = self._segment
+        rng = self._rng
+        if track is not None and playing and rng.random() < self.pause_chance:
+            # Пауза посреди трека
+            length = rng.uniform(60, 1800)
+            self._segment = (track, now, now + length, position, False)
+            return
+        if track is not None and not playing:
+            # Продолжение после паузы
+            self._segment = (track, now, now + max(1, track.duration - position), position, True)
+            return
+        index = rng.randrange(self.catalogue)
+        track = make_track(index, duration=rng.randint(120, 300))
+        length = rng.uniform(3, 30) if rng.random() < self.skip_chance else track.duration
+        self._segment = (track, now, now + length, 0, True)
+        self.tracks += 1
+    
+    async def get_current_track(self) -> Optional[TrackInfo]:
+        if self._started is None:
+            self.start()
+        self.reads += 1
+        now = self.sim_time()
+        if (now / 3600) % 24 >= self.day_hours:
+            self._segment = (None, now, now, 0, False)
+            return None
+        
+        # Отрезок мог закончиться давно (тик пропущен), переходим сразу к текущему
+        if now >= self._segment[2]:
+            self._next_segment(now)
+        
+        track, started, _, position, playing = self._segment
+        if playing:
+            position += int(now - started)
+            # Позиция в следующем отрезке (пауза) считается от этой
+            self._segment = (track, now, self._segment[2], position, playing)
+        return TrackInfo(title=track.title, artist=track.artist, album=track.album,
+                         is_playing=playing, duration=track.duration, position=position)
+
+
+def _slope(points: List[Tuple[float, float]]) -> float:
+    """Наклон прямой по методу наименьших квадратов"""
+    if len(points) < 2:
+        return 0.0
+    n = len(points)
+    mean_x = sum(x for x, _ in points) / n
+    mean_y = sum(y for _, y in points) / n
+    var = sum((x - mean_x) ** 2 for x, _ in points)
+    if not var:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in points) / var
+
+
+async def _discord_restarts(simulator: ListeningSimulator, discord: FakeDiscordRPC,
+                            every_hours: float, downtime: float):
+    """Discord перезапускается каждые every_hours симулированных часов"""
+    while True:
+        await asyncio.sleep(every_hours * 3600 / simulator.speed)
+        discord.available = False
+        discord.disconnect()
+        discord.invalidate()
+        await asyncio.sleep(downtime / simulator.speed)
+        discord.available = True
+
+
+def soak(hours: float = 48, speed: float = 3600, top: int = 10,
+         restart_every_hours: float = 6, seed: int = 1) -> dict:
+    """
+    Прогнать hours симулированных часов и собрать замеры памяти.
+    
+    Returns:
+        Отчёт: выборки по часам, наклон роста, места роста аллокаций
+    """
+    tracemalloc.start()
+    simulator = ListeningSimulator(speed, seed=seed)
+    discord = FakeDiscordRPC(history=100)
+    yandex = make_yandex_api()
+    pipeline = PresencePipeline(simulator, discord, yandex)
+    accelerate(pipeline, speed)
+    pipeline.supervisor.watchdog_interval = max(pipeline.supervisor.watchdog_interval, MIN_WATCHDOG_INTERVAL)
+    
+    samples = []
+    baseline = None
+    
+    async def drive():
+        nonlocal baseline
+        simulator.start()
+        task = asyncio.create_task(pipeline.run())
+        restarts = asyncio.create_task(_discord_restarts(simulator, discord, restart_every_hours, 120))
+        for hour in range(1, int(hours) + 1):
+            await asyncio.sleep(max(0.0, hour * 3600 - simulator.sim_time()) / speed)
+            traced, _ = tracemalloc.get_traced_memory()
+            samples.append({"hour": hour, "traced_kb": traced // 1024,
+                            "rss_kb": process_rss_bytes() // 1024})
+            if hour == WARMUP_HOURS:
+                baseline = tracemalloc.take_snapshot()
+        restarts.cancel()
+        pipeline.stop()
+        await task
+    
+    started = time.perf_counter()
+    asyncio.run(drive())
+    wall = time.perf_counter() - started
+    
+    final = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    
+    growth = []
+    if baseline is not None:
+        filters = [tracemalloc.Filter(False, tracemalloc.__file__),
+                   tracemalloc.Filter(False, "<frozen importlib._bootstrap*>")]
+        stats = final.filter_traces(filters).compare_to(baseline.filter_traces(filters), "lineno")
+        growth = [
+            {"site": str(stat.traceback[0]), "size_diff_kb": round(stat.size_diff / 1024, 1),
+             "count_diff": stat.count_diff}
+            for stat in stats[:top] if stat.size_diff > 0
+        ]
+    
+    measured = [s for s in samples if s["hour"] >= WARMUP_HOURS]
+    return {
+        "simulated_hours": hours,
+        "speed": speed,
+        "wall_s": round(wall, 1),
+        "tracks": simulator.tracks,
+        "media_reads": simulator.reads,
+        "presence_updates": discord.sent_count,
+        "discord_connects": discord.connects,
+        "cover_cache_size": len(yandex._cover_cache),
+        "traced_kb_per_hour": round(_slope([(s["hour"], s["traced_kb"]) for s in measured]), 2),
+        "rss_kb_per_hour": round(_slope([(s["hour"], s["rss_kb"]) for s in measured]), 2),
+        "samples": samples,
+        "top_growth": growth,
+    }
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Длительный прогон с замером роста памяти")
+    parser.add_argument("--hours", type=float, default=48, help="Сколько симулированных часов")
+    parser.add_argument("--speed", type=float, default=3600, help="Ускорение времени")
+    parser.add_argument("--threshold-kb", type=float, default=TRACED_THRESHOLD_KB,
+                        help="Допустимый рост tracemalloc, КБ за симулированный час")
+    parser.add_argument("--rss-threshold-kb", type=float, default=RSS_THRESHOLD_KB,
+                        help="Допустимый рост RSS, КБ за симулированный час")
+    parser.add_argument("--top", type=int, default=10, help="Сколько мест роста показать")
+    parser.add_argument("--json", help="Сохранить отчёт в файл")
+    args = parser.parse_args()
+    
+    if args.hours <= WARMUP_HOURS + 1:
+        parser.error(f"нужно больше {WARMUP_HOURS + 1} часов: первые {WARMUP_HOURS} — прогрев")
+    
+    report = soak(args.hours, args.speed, args.top)
+    
+    print(f"Симулировано {report['simulated_hours']:g} ч за {report['wall_s']} с (x{report['speed']:g})")
+    print(f"  Треков: {report['tracks']}, чтений: {report['media_reads']}, "
+          f"статусов: {report['presence_updates']}, подключений Discord: {report['discord_connects']}")
+    print(f"  Кэш обложек: {report['cover_cache_size']}")
+    print(f"  tracemalloc: {report['traced_kb_per_hour']:+.1f} КБ/ч (порог {args.threshold_kb:g})")
+    print(f"  RSS:         {report['rss_kb_per_hour']:+.1f} КБ/ч (порог {args.rss_threshold_kb:g})")
+    if report["top_growth"]:
+        print(f"  Рост с {WARMUP_HOURS}-го часа:")
+        for site in report["top_growth"]:
+            print(f"    {site['size_diff_kb']:+8.1f} КБ {site['count_diff']:+6d}  {site['site']}")
+    
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    failed = (report["traced_kb_per_hour"] > args.threshold_kb or
+              report["rss_kb_per_hour"] > args.rss_threshold_kb)
+    if failed:
+        print("✗ Память растёт быстрее порога")
+        return 1
+    print("✓ Память стабильна")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,104 @@
+"""
+Профиль времени импорта при запуске
+Запускает чистый интерпретатор с -X importtime и показывает,
+сколько стоит каждый модуль
+
+Запуск: python benchmarks/startup_profile.py [модуль ...] [--top N] [--json]
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+from dataclasses import asdict, dataclass
+from typing import List
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+@dataclass
+class ImportCost:
+    """Стоимость импорта одного модуля (микросекунды)"""
+    module: str
+    self_us: int
+    cumulative_us: int
+    depth: int
+
+
+def profile_imports(module: str, python: str = sys.executable) -> List[ImportCost]:
+    """Импортировать module в новом процессе и разобрать вывод -X importtime"""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    result = subprocess.run(
+        [python, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, env=env, capture_output=True, text=True
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"Не удалось импортировать {module}:\n{result.stderr[-2000:]}")
+    
+    costs = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        try:
+            self_us, cumulative_us, name = line[len("import time:"):].split("|")
+            depth = (len(name) - len(name.lstrip(" ")) - 1) // 2
+            costs.append(ImportCost(name.strip(), int(self_us), int(cumulative_us), depth))
+        except ValueError:
+            continue
+    return costs
+
+
+def import_time_ms(module: str, runs: int = 5) -> float:
+    """Медианное время импорта модуля (мс) по нескольким запускам"""
+    samples = []
+    for _ in range(runs):
+        costs = profile_imports(module)
+        top = next((c for c in costs if c.module == module), None)
+        if top:
+            samples.append(top.cumulative_us / 1000)
+    samples.sort()
+    return samples[len(samples) // 2] if samples else 0.0
+
+
+def loaded_modules(module: str, candidates, python: str = sys.executable) -> List[str]:
+    """Какие из candidates оказались загружены после import module"""
+    env = dict(os.environ, PYTHONPATH=ROOT + os.pathsep + os.environ.get("PYTHONPATH", ""))
+    code = (
+        f"import sys, {module}; "
+        f"print(' '.join(m for m in {list(candidates)!r} if m in sys.modules))"
+    )
+    result = subprocess.run([python, "-c", code], cwd=ROOT, env=env, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"Не удалось импортировать {module}:\n{result.stderr[-2000:]}")
+    return result.stdout.split()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Время импорта модулей при запуске")
+    parser.add_argument("modules", nargs="*", default=["daemon", "tray_app"])
+    parser.add_argument("--top", type=int, default=15, help="Сколько самых дорогих модулей показать")
+    parser.add_argument("--json", action="store_true", help="Вывод в JSON")
+    args = parser.parse_args()
+    
+    report = {}
+    for module in args.modules:
+        costs = profile_imports(module)
+        costs.sort(key=lambda c: c.self_us, reverse=True)
+        report[module] = costs
+    
+    if args.json:
+        print(json.dumps({m: [asdict(c) for c in costs] for m, costs in report.items()},
+                         ensure_ascii=False, indent=2))
+        return
+    
+    for module, costs in report.items():
+        total = next((c.cumulative_us for c in costs if c.module == module), 0)
+        print(f"\n=== import {module}: {total / 1000:.1f} мс ===")
+        print(f"{'собственное, мс':>16} {'суммарное, мс':>14}  модуль")
+        for cost in costs[:args.top]:
+            print(f"{cost.self_us / 1000:>16.2f} {cost.cumulative_us / 1000:>14.2f}  {cost.module}")
+
+
+if __name__ == "__main__":
+    main()
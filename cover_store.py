@@ -0,0 +1,333 @@
+"""
+Локальное хранилище обложек
+Каждая обложка скачивается один раз в исходном размере и хранится на диске
+под хэшем содержимого. Нужные размеры делает Pillow в пуле потоков,
+готовые файлы читаются через mmap, в памяти держится ограниченный LRU
+"""
+
+import hashlib
+import mmap
+import os
+import threading
+import urllib.request
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Dict, Iterable, Optional, Tuple
+
+from lifecycle import DaemonThreadExecutor
+from settings import APPDATA_FOLDER
+from yandex_api import cover_url
+from logger import get_logger
+
+log = get_logger("covers")
+
+COVERS_FOLDER = os.path.join(APPDATA_FOLDER, "covers")
+INDEX_FILE = "index.tsv"
+
+# Размер, в котором скачивается исходник; из него делаются все варианты
+ORIGINAL_SIZE = "1000x1000"
+# Варианты, которые готовятся заранее при смене трека
+DEFAULT_VARIANTS: Tuple[Tuple[int, int], ...] = ((64, 64), (200, 200), (400, 400))
+
+# Сколько байт отображённых файлов держать открытыми
+MEMORY_LIMIT = 16 * 1024 * 1024
+WORKERS = 2
+DOWNLOAD_TIMEOUT = 15
+JPEG_QUALITY = 90
+
+
+class CoverStore:
+    """Хранилище обложек по cover_uri из Yandex Music"""
+    
+    def __init__(self, folder: str = COVERS_FOLDER, memory_limit: int = MEMORY_LIMIT,
+                 workers: int = WORKERS):
+        self.folder = folder
+        self.memory_limit = memory_limit
+        self.downloads = 0
+        self.resizes = 0
+        os.makedirs(folder, exist_ok=True)
+        
+        self._lock = threading.Lock()
+        # cover_uri -> хэш исходника (index.tsv дописывается по одной строке)
+        self._index: Dict[str, str] = self._load_index()
+        # Задачи в работе: повторный запрос того же файла ждёт ту же задачу
+        self._pending: Dict[str, Future] = {}
+        self._downloads: Dict[str, Future] = {}
+        # Путь -> mmap; вытесняются давно не читанные, пока не уложимся в memory_limit
+        self._memory: "OrderedDict[str, mmap.mmap]" = OrderedDict()
+        self._memory_bytes = 0
+        self._executor = DaemonThreadExecutor("covers", workers)
+    
+    # === Индекс и пути ===
+    
+    def _load_index(self) -> Dict[str, str]:
+        index = {}
+        try:
+            with open(os.path.join(self.folder, INDEX_FILE), "r", encoding="utf-8") as f:
+                for line in f:
+                    cover_uri, _, digest = line.rstrip("\n").partition("\t")
+                    if digest:
+                        index[cover_uri] = digest
+        except FileNotFoundError:
+            pass
+        return index
+    
+    def _path(self, digest: str, size: Optional[Tuple[int, int]] = None) -> str:
+        suffix = f"-{size[0]}x{size[1]}" if size else ""
+        return os.path.join(self.folder, digest[:2], f"{digest}{suffix}.jpg")
+    
+    @staticmethod
+    def _write_atomic(path: str, data: bytes):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        with open(temp, "wb") as f:
+            f.write(data)
+        os.replace(temp, path)
+    
+    # === Работа в пуле ===
+    
+    def _submit(self, key: str, fn, *args) -> Future:
+        """Запустить задачу в пуле, если такая же ещё не выполняется"""
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                future = self._executor.submit(fn, *args)
+                self._pending[key] = future
+                future.add_done_callback(lambda _: self._forget(key))
+        return future
+    
+    def _forget(self, key: str):
+        with self._lock:
+            self._pending.pop(key, None)
+    
+    def _original(self, cover_uri: str) -> str:
+        """
+        Хэш исходника, скачивая его при необходимости.
+        Скачивает первый пришедший поток, остальные ждут его результата
+        (не через пул: все его потоки могут быть заняты ожидающими)
+        """
+        with self._lock:
+            digest = self._index.get(cover_uri)
+            if digest is not None and os.path.exists(self._path(digest)):
+                return digest
+            future = self._downloads.get(cover_uri)
+            owner = future is None
+            if owner:
+                future = self._downloads[cover_uri] = Future()
+        if not owner:
+            return future.result()
+        try:
+            digest = self._download(cover_uri)
+            future.set_result(digest)
+            return digest
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                del self._downloads[cover_uri]
+    
+    def _download(self, cover_uri: str) -> str:
+        """Скачать исходник (блокирующий вызов в пуле), вернуть хэш содержимого"""
+        with urllib.request.urlopen(cover_url(cover_uri, ORIGINAL_SIZE), timeout=DOWNLOAD_TIMEOUT) as response:
+            data = response.read()
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        # Одна картинка у разных cover_uri (альбом и сингл) хранится один раз
+        if not os.path.exists(path):
+            self._write_atomic(path, data)
+        with self._lock:
+            self._index[cover_uri] = digest
+            with open(os.path.join(self.folder, INDEX_FILE), "a", encoding="utf-8") as f:
+                f.write(f"{cover_uri}\t{digest}\n")
+        self.downloads += 1
+        return digest
+    
+    def _resize(self, digest: str, size: Tuple[int, int]) -> str:
+        """Сделать вариант нужного размера (блокирующий вызов в пуле)"""
+        from PIL import Image, ImageOps
+        
+        path = self._path(digest, size)
+        if os.path.exists(path):
+            return path
+        with Image.open(self._path(digest)) as image:
+            variant = ImageOps.fit(image.convert("RGB"), size, Image.LANCZOS)
+        temp = f"{path}.{threading.get_ident()}.tmp"
+        variant.save(temp, "JPEG", quality=JPEG_QUALITY)
+        os.replace(temp, path)
+        self.resizes += 1
+        return path
+    
+    def _prepare(self, cover_uri: str, size: Optional[Tuple[int, int]]) -> str:
+        """Скачать при необходимости и сделать вариант; вернуть путь к файлу"""
+        digest = self._original(cover_uri)
+        if size is None:
+            return self._path(digest)
+        return self._resize(digest, size)
+    
+    # === Публичный интерфейс ===
+    
+    def prefetch(self, cover_uri: str, sizes: Iterable[Tuple[int, int]] = DEFAULT_VARIANTS):
+        """Подготовить варианты заранее, не дожидаясь (можно звать из цикла опроса)"""
+        for size in sizes:
+            if not self._ready(cover_uri, size):
+                self._submit(f"{cover_uri}|{size}", self._prepare_logged, cover_uri, size)
+    
+    def _prepare_logged(self, cover_uri: str, size: Optional[Tuple[int, int]]) -> Optional[str]:
+        try:
+            return self._prepare(cover_uri, size)
+        except Exception as e:
+            log.warning("covers.prepare", "Не удалось подготовить обложку", error=str(e), size=size)
+            return None
+    
+    def _ready(self, cover_uri: str, size: Optional[Tuple[int, int]]) -> bool:
+        digest = self._index.get(cover_uri)
+        return digest is not None and os.path.exists(self._path(digest, size))
+    
+    def path(self, cover_uri: str, size: Optional[Tuple[int, int]] = None,
+             timeout: Optional[float] = None) -> Optional[str]:
+        """
+        Путь к файлу обложки (для интерфейса, трея и т.п.).
+        
+        Args:
+            size: (ширина, высота) или None для исходника
+            timeout: Сколько ждать скачивания и обработки; 0 — только готовые
+        """
+        if self._ready(cover_uri, size):
+            return self._path(self._index[cover_uri], size)
+        future = self._submit(f"{cover_uri}|{size}", self._prepare_logged, cover_uri, size)
+        if timeout == 0:
+            return None
+        try:
+            return future.result(timeout)
+        except Exception:
+            return None
+    
+    def read(self, cover_uri: str, size: Optional[Tuple[int, int]] = None,
+             timeout: Optional[float] = None) -> Optional[mmap.mmap]:
+        """
+        Содержимое JPEG только для чтения (mmap, без копирования в память процесса).
+        Возвращённый объект остаётся годным и после вытеснения из кэша
+        """
+        path = self.path(cover_uri, size, timeout)
+        if path is None:
+            return None
+        with self._lock:
+            mapped = self._memory.get(path)
+            if mapped is not None:
+                self._memory.move_to_end(path)
+                return mapped
+        with open(path, "rb") as f:
+            mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        with self._lock:
+            if path not in self._memory:
+                self._memory[path] = mapped
+                self._memory_bytes += len(mapped)
+                # Вытесненные mmap закроются сами, когда на них не останется ссылок
+                while self._memory_bytes > self.memory_limit and len(self._memory) > 1:
+                    _, evicted = self._memory.popitem(last=False)
+                    self._memory_bytes -= len(evicted)
+        return mapped
+    
+    @property
+    def memory_bytes(self) -> int:
+        """Сколько байт сейчас держит кэш в памяти"""
+        return self._memory_bytes
+    
+    def close(self):
+        """Остановить пул (недоделанные задачи брошены, файлы пишутся атомарно)"""
+        self._executor.shutdown(wait=False)
+        with self._lock:
+            self._memory.clear()
+            self._memory_bytes = 0
+
+
+class CoverPrefetcher:
+    """
+    Слушатель обложек конвейера (add_cover_listener): при смене трека готовит
+    варианты его обложки. cover_uri приходит уже найденным, поиска здесь нет
+    """
+    
+    def __init__(self, store: Optional[CoverStore] = None):
+        self.store = store or get_cover_store()
+        self._last_uri = None
+    
+    def __call__(self, track, cover_uri: Optional[str]):
+        if not cover_uri or cover_uri == self._last_uri:
+            return
+        self._last_uri = cover_uri
+        self.store.prefetch(cover_uri)
+
+
+# Синглтон для использования во всём приложении
+_store_instance: Optional[CoverStore] = None
+
+
+def get_cover_store() -> CoverStore:
+    """Получить инстанс хранилища обложек"""
+    global _store_instance
+    if _store_instance is None:
+        _store_instance = CoverStore()
+    return _store_instance
+
+
+def close_cover_store():
+    """Остановить хранилище обложек"""
+    global _store_instance
+    if _store_instance is not None:
+        _store_instance.close()
+        _store_instance = None
+
+
+if __name__ == "__main__":
+    # Тест модуля на локальном сервере с картинкой вместо CDN Yandex Music
+    import io
+    import tempfile
+    import time
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from PIL import Image
+    
+    buffer = io.BytesIO()
+    Image.new("RGB", (1000, 1000), (255, 204, 0)).save(buffer, "JPEG")
+    image_bytes = buffer.getvalue()
+    requests_seen = []
+    
+    class ImageHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            requests_seen.append(self.path)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/jpeg")
+            self.send_header("Content-Length", str(len(image_bytes)))
+            self.end_headers()
+            self.wfile.write(image_bytes)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ImageHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    # cover_url() добавляет https://, для теста подменяем схему
+    cover_url = lambda uri, size: f"http://{uri.replace('%%', size)}"
+    
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+        store = CoverStore(folder, memory_limit=20000)
+        uri = f"127.0.0.1:{server.server_address[1]}/get-music-content/test/%%"
+        
+        started = time.perf_counter()
+        store.prefetch(uri)
+        for size in DEFAULT_VARIANTS:
+            data = store.read(uri, size, timeout=10)
+            with Image.open(io.BytesIO(data)) as image:
+                print(f"  {size}: {len(data)} байт, {image.size}")
+        print(f"Подготовка: {(time.perf_counter() - started) * 1000:.0f} мс")
+        print(f"Скачиваний: {store.downloads} (запросов к серверу {len(requests_seen)}), "
+              f"уменьшений: {store.resizes}")
+        print(f"В памяти: {store.memory_bytes} байт (лимит {store.memory_limit})")
+        
+        # Повторно уже с диска, без сети
+        again = CoverStore(folder)
+        print(f"После перезапуска готово без сети: {again.path(uri, (200, 200), timeout=0) is not None}")
+        store.close()
+        again.close()
+    
+    server.shutdown()
@@ -0,0 +1,118 @@
+"""
+Yandex Music Discord RPC - фоновый режим без интерфейса
+Только конвейер медиа -> обложка -> Discord, без tkinter и трея.
+Вывод в консоль и лог, остановка по сигналу (Ctrl+C, SIGTERM),
+профиль CPU по SIGUSR1 (см. profiler.py)
+
+Запуск: python daemon.py  или  python app.py --daemon
+Запись трассы медиа-сессии: --record-trace файл.jsonl (см. benchmarks/replay.py)
+"""
+
+import time
+
+_import_started = time.perf_counter()
+
+import asyncio
+import signal
+import sys
+
+from logger import get_logger, setup_logging, shutdown_logging
+from settings import load_settings, subscribe
+from pipeline import LIVE_SETTINGS, create_pipeline
+from metrics import process_rss_bytes
+from single_instance import acquire_instance, release_instance, set_command_handler
+
+log = get_logger("daemon")
+
+
+def _install_signal_handlers(loop: asyncio.AbstractEventLoop, pipeline):
+    """
+    Остановка по SIGINT/SIGTERM (и SIGBREAK на Windows), перечитывание настроек
+    по SIGHUP, профилирование по SIGUSR1
+    """
+    def reload_settings():
+        pipeline.reload_settings()
+        log.info("daemon.reload", "Настройки перечитаны")
+    
+    def profile():
+        from profiler import start_profiling
+        if not start_profiling(load_settings().get("profile_seconds", 30)):
+            log.info("daemon.profile", "Профилирование уже идёт")
+    
+    handlers = {"SIGINT": pipeline.stop, "SIGTERM": pipeline.stop,
+                "SIGBREAK": pipeline.stop, "SIGHUP": reload_settings, "SIGUSR1": profile}
+    
+    for name, handler in handlers.items():
+        sig = getattr(signal, name, None)
+        if sig is None:
+            continue
+        try:
+            loop.add_signal_handler(sig, handler)
+        except (NotImplementedError, RuntimeError):
+            # Windows: обычный обработчик, переносим вызов в цикл событий
+            signal.signal(sig, lambda signum, frame, h=handler: loop.call_soon_threadsafe(h))
+
+
+async def _run(pipeline):
+    loop = asyncio.get_running_loop()
+    _install_signal_handlers(loop, pipeline)
+    await pipeline.run()
+
+
+def _option(name: str):
+    """Значение параметра командной строки вида --name значение"""
+    if name in sys.argv:
+        index = sys.argv.index(name)
+        if index + 1 < len(sys.argv):
+            return sys.argv[index + 1]
+    return None
+
+
+def main() -> int:
+    """Точка входа фонового режима"""
+    setup_logging()
+    try:
+        # Второй экземпляр не запускаем: пусть работающий перечитает настройки
+        if acquire_instance("reload") is None:
+            log.info("daemon.handoff", "Уже запущен другой экземпляр, настройки перечитаны в нём")
+            return 0
+        
+        pipeline = create_pipeline()
+        set_command_handler(lambda command: pipeline.reload_settings() if command == "reload" else None)
+        trace_path = _option("--record-trace")
+        if trace_path:
+            if hasattr(pipeline.media_manager, "start_recording"):
+                pipeline.media_manager.start_recording(trace_path)
+            else:
+                log.warning("daemon.trace", "Источник трека не поддерживает запись трассы")
+        unsubscribe = subscribe(LIVE_SETTINGS, pipeline.apply_setting)
+        
+        log.info(
+            "daemon.start", "Фоновый режим запущен",
+            startup_ms=round((time.perf_counter() - _import_started) * 1000),
+            rss_mb=round(process_rss_bytes() / (1024 * 1024), 1)
+        )
+        
+        try:
+            asyncio.run(_run(pipeline))
+        finally:
+            unsubscribe()
+            if trace_path:
+                if hasattr(pipeline.media_manager, "stop_recording"):
+                    pipeline.media_manager.stop_recording()
+        
+        log.info("daemon.stop", "Фоновый режим остановлен",
+                 rss_mb=round(process_rss_bytes() / (1024 * 1024), 1))
+        return 0
+    except Exception:
+        log.exception("daemon.error", "Ошибка фонового режима")
+        return 1
+    finally:
+        from pipeline import close_services
+        close_services()
+        release_instance()
+        shutdown_logging()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -3,9 +3,18 @@
 """
 
 import time
+from collections import deque
 from typing import Optional
-from pypresence import Presence, DiscordNotFound, PipeClosed, ActivityType
 from media_session import TrackInfo
+from presence_template import PresenceTemplates, truncate
+from metrics import DISCORD_CONNECT, DISCORD_RECONNECTS, DISCORD_UPDATE, ERRORS
+from logger import get_logger
+
+log = get_logger("discord")
+
+# Discord принимает не больше RATE_LIMIT_UPDATES обновлений за RATE_LIMIT_WINDOW секунд
+RATE_LIMIT_UPDATES = 5
+RATE_LIMIT_WINDOW = 20.0
 
 
 class DiscordRPC:
@@ -13,25 +22,41 @@ class DiscordRPC:
     
     def __init__(self, client_id: str):
         self.client_id = client_id
-        self.rpc: Optional[Presence] = None
+        self.rpc = None  # pypresence.Presence, импортируется при подключении
         self.connected = False
         self._last_track_key = None
+        self._was_connected = False
+        # Время последних отправок (time.monotonic) для соблюдения лимита Discord
+        self._sent_at: deque = deque(maxlen=RATE_LIMIT_UPDATES)
+        # Скомпилированные шаблоны статуса; заменяются целиком (см. set_template)
+        self.templates = PresenceTemplates()
     
     def connect(self) -> bool:
         """Подключиться к Discord"""
+        from pypresence import Presence, DiscordNotFound
+        
         try:
-            self.rpc = Presence(self.client_id)
-            self.rpc.connect()
+            with DISCORD_CONNECT.time():
+                # Объект Presence (и его цикл событий) переиспользуем между переподключениями
+                if self.rpc is None:
+                    self.rpc = Presence(self.client_id)
+                self.rpc.connect()
+            # Считаем удачные переподключения, а не попытки, пока Discord закрыт
+            if self._was_connected:
+                DISCORD_RECONNECTS.inc()
             self.connected = True
-            print("✓ Подключено к Discord")
+            self._was_connected = True
+            log.info("discord.connect", "✓ Подключено к Discord")
             return True
         except DiscordNotFound:
-            print("✗ Discord не найден. Убедитесь, что Discord запущен.")
+            log.warning("discord.connect", "✗ Discord не найден. Убедитесь, что Discord запущен.")
             self.connected = False
             return False
         except Exception as e:
-            print(f"✗ Ошибка подключения к Discord: {e}")
+            log.warning("discord.connect", "✗ Ошибка подключения к Discord", error=str(e))
             self.connected = False
+            # Состояние объекта неизвестно — в следующий раз создадим новый
+            self.rpc = None
             return False
     
     def disconnect(self):
@@ -42,30 +67,61 @@ class DiscordRPC:
                 self.rpc.close()
             except Exception:
                 pass
+            # close() закрывает цикл событий pypresence, объект больше не годится
+            self.rpc = None
             self.connected = False
-            print("Отключено от Discord")
+            log.info("discord.disconnect", "Отключено от Discord")
+    
+    def rate_limit_delay(self, now: Optional[float] = None) -> float:
+        """Сколько секунд подождать, чтобы следующее обновление уложилось в лимит Discord"""
+        if len(self._sent_at) < RATE_LIMIT_UPDATES:
+            return 0.0
+        now = time.monotonic() if now is None else now
+        return max(0.0, self._sent_at[0] + RATE_LIMIT_WINDOW - now)
     
     def update_presence(self, track: Optional[TrackInfo], show_timestamp: bool = True, 
-                        cover_url: Optional[str] = None) -> bool:
-        """Обновить статус в Discord"""
+                        cover_url: Optional[str] = None, lyric: Optional[str] = None,
+                        lyric_field: str = "state") -> bool:
+        """
+        Обновить статус в Discord
+        
+        Args:
+            lyric: Текущая строка текста песни (None — не показывать)
+            lyric_field: Какое поле она заменяет: "state" или "details"
+        """
         if not self.connected or not self.rpc:
             return False
         
+        from pypresence import PipeClosed, ActivityType
+        
         try:
             if track is None:
                 # Нет трека - очищаем статус
                 if self._last_track_key is not None:
                     self.rpc.clear()
+                    self._sent_at.append(time.monotonic())
                     self._last_track_key = None
-                    print("Статус очищен (нет активного трека)")
+                    log.info("discord.clear", "Статус очищен (нет активного трека)")
                 return True
             
-            # Формируем ключ для проверки изменений
-            # НЕ включаем position, чтобы не спамить обновлениями
-            track_key = f"{track.title}|{track.artist}|{track.is_playing}"
+            # Строки статуса по шаблонам пользователя (шаблоны скомпилированы заранее)
+            texts = self.templates.render(track)
+            
+            # Строка текста песни вместо исполнителя или названия
+            if lyric:
+                texts["details" if lyric_field == "details" else "state"] = truncate(f"♪ {lyric}")
+            
+            # Используем обложку трека или дефолтную иконку
+            large_image = cover_url if cover_url else "yandex_music"
+            
+            # Ключ — то, что увидит пользователь: если шаблон не использует позицию,
+            # статус не переотправляется на каждом тике.
+            # Обложка входит в ключ: она может найтись позже самого трека
+            track_key = (texts["details"], texts["state"], texts["large_text"], texts["small_text"],
+                         track.is_playing, large_image)
             
             # Обновляем если:
-            # 1. Трек изменился
+            # 1. Трек или строки статуса изменились
             # 2. Статус воспроизведения изменился  
             # 3. Каждые 15 секунд для обновления таймера
             should_update = (
@@ -79,33 +135,17 @@ class DiscordRPC:
             
             self._last_track_key = track_key
             
-            # Формируем данные для Discord
-            details = track.title[:128] if len(track.title) > 128 else track.title
-            
-            # Если на паузе - добавляем статус к исполнителю
-            if track.is_playing:
-                state = track.artist[:128] if len(track.artist) > 128 else track.artist
-            else:
-                state = f"{track.artist} • На паузе"
-                state = state[:128]
-            
-            # Используем обложку трека или дефолтную иконку
-            large_image = cover_url if cover_url else "yandex_music"
-            
-            # Маленький текст статуса
-            small_text = "Играет" if track.is_playing else "На паузе"
             small_image = "play" if track.is_playing else "pause"
             
-            # Параметры для Discord
+            # Параметры для Discord (пустые строки не отправляем — Discord их отвергает)
             presence_data = {
-                "details": details,
-                "state": state,
                 "large_image": large_image,
-                "large_text": track.album if track.album else "Yandex Music",
                 "small_image": small_image,
-                "small_text": "by @nevercr7 | t.me/nevercr7",
                 "activity_type": ActivityType.LISTENING,  # Listening to...
             }
+            for field, text in texts.items():
+                if text:
+                    presence_data[field] = text
             
             # Добавляем время только если трек играет
             if show_timestamp and track.is_playing and track.duration > 0:
@@ -116,29 +156,38 @@ class DiscordRPC:
                 presence_data["start"] = start_time
                 presence_data["end"] = end_time
             
-            # Добавляем кнопки с ссылками на создателя
-            presence_data["buttons"] = [
-                {"label": "Telegram", "url": "https://t.me/nevercr7dev"},
-                {"label": "GitHub", "url": "https://github.com/Nevercr7/YandexMusicRPC"}
-            ]
+            # Кнопки из настроек (по умолчанию — ссылки на создателя)
+            if self.templates.buttons:
+                presence_data["buttons"] = self.templates.buttons
             
-            self.rpc.update(**presence_data)
+            with DISCORD_UPDATE.time():
+                self.rpc.update(**presence_data)
+            self._sent_at.append(time.monotonic())
             
             status = "▶" if track.is_playing else "⏸"
-            print(f"{status} {track.artist} - {track.title}")
-            if cover_url:
-                print(f"  🖼 Обложка: {cover_url[:50]}...")
+            log.info("discord.update", f"{status} {track.artist} - {track.title}", cover=cover_url)
             
             return True
             
         except PipeClosed:
-            print("Соединение с Discord потеряно")
+            ERRORS.inc()
+            log.warning("discord.pipe", "Соединение с Discord потеряно")
             self.connected = False
             return False
         except Exception as e:
-            print(f"Ошибка обновления статуса: {e}")
+            ERRORS.inc()
+            log.error("discord.update", "Ошибка обновления статуса", error=str(e))
             return False
     
+    def set_template(self, key: str, value):
+        """Изменить шаблон или кнопки (presence_*); перекомпилируется только эта настройка"""
+        self.templates = self.templates.with_setting(key, value)
+        self.invalidate()
+    
+    def invalidate(self):
+        """Сбросить ключ последнего трека, чтобы следующее обновление ушло принудительно"""
+        self._last_track_key = None
+    
     def clear_presence(self):
         """Очистить статус"""
         if self.connected and self.rpc:
@@ -0,0 +1,306 @@
+"""
+История прослушивания
+Прослушанные треки копятся в памяти и пачками дописываются
+в SQLite (режим WAL) в AppData фоновым потоком — цикл опроса не ждёт диска
+"""
+
+import os
+import sqlite3
+import threading
+import time
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, List, Optional, Tuple
+
+from media_session import TrackInfo
+from settings import APPDATA_FOLDER, ensure_appdata_folder
+from logger import get_logger
+
+log = get_logger("history")
+
+HISTORY_FILE = os.path.join(APPDATA_FOLDER, "history.db")
+
+# Запись на диск: не реже раза в FLUSH_INTERVAL секунд или при FLUSH_BATCH прослушиваниях
+FLUSH_INTERVAL = 60.0
+FLUSH_BATCH = 50
+
+# Прослушивание короче MIN_PLAY_SECONDS не считается
+MIN_PLAY_SECONDS = 5
+# Больший промежуток между опросами (сон компьютера) не засчитывается целиком
+MAX_OBSERVATION_GAP = 60.0
+# Трек на повторе: позиция перескочила из последних REPEAT_MARGIN секунд в первые
+REPEAT_MARGIN = 30
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS plays (
+    id INTEGER PRIMARY KEY,
+    started_at REAL NOT NULL,
+    title TEXT NOT NULL,
+    artist TEXT NOT NULL,
+    album TEXT NOT NULL,
+    duration INTEGER NOT NULL,
+    listened INTEGER NOT NULL
+);
+-- Покрывающий индекс: все запросы за период читают только его
+CREATE INDEX IF NOT EXISTS plays_by_time ON plays (started_at, artist, title, listened);
+"""
+
+
+@dataclass
+class Play:
+    """Одно прослушивание трека"""
+    started_at: float  # time.time()
+    title: str
+    artist: str
+    album: str = ""
+    duration: int = 0  # в секундах
+    listened: int = 0  # сколько секунд трек реально играл
+
+
+class PlayTracker:
+    """
+    Превращает поток прочитанных треков в прослушивания.
+    Вызывается из цикла опроса, поэтому только считает в памяти
+    """
+    
+    def __init__(self, on_play: Callable[[Play], None], min_listened: float = MIN_PLAY_SECONDS):
+        self.on_play = on_play
+        self.min_listened = min_listened
+        self._track: Optional[TrackInfo] = None
+        self._started_at = 0.0
+        self._listened = 0.0
+        self._observed_at: Optional[float] = None
+    
+    def observe(self, track: Optional[TrackInfo], now: Optional[float] = None):
+        """Учесть очередное чтение трека (None — плеер закрыт)"""
+        now = time.time() if now is None else now
+        previous = self._track
+        
+        if previous is not None and previous.is_playing and self._observed_at is not None:
+            self._listened += min(max(0.0, now - self._observed_at), MAX_OBSERVATION_GAP)
+        
+        same = (track is not None and previous is not None and
+                (track.title, track.artist) == (previous.title, previous.artist))
+        # Трек поставлен на повтор: позиция вернулась в начало после конца
+        repeated = (same and previous.duration > REPEAT_MARGIN * 2 and
+                    previous.position >= previous.duration - REPEAT_MARGIN and
+                    track.position < REPEAT_MARGIN)
+        
+        if not same or repeated:
+            self.finish()
+            self._started_at = now - (track.position if track and not repeated else 0)
+        self._track = track
+        self._observed_at = now
+    
+    def finish(self):
+        """Закончить текущее прослушивание (например, при выходе)"""
+        track = self._track
+        if track is not None and self._listened >= self.min_listened:
+            self.on_play(Play(
+                started_at=self._started_at,
+                title=track.title,
+                artist=track.artist,
+                album=track.album,
+                duration=track.duration,
+                listened=int(self._listened)
+            ))
+        self._track = None
+        self._listened = 0.0
+        self._observed_at = None
+
+
+class ListeningHistory:
+    """Хранилище истории: буфер в памяти, запись пачками, запросы по индексу"""
+    
+    def __init__(self, path: str = HISTORY_FILE, flush_interval: float = FLUSH_INTERVAL,
+                 flush_batch: int = FLUSH_BATCH):
+        self.path = path
+        self.flush_interval = flush_interval
+        self.flush_batch = flush_batch
+        self._buffer: List[Play] = []
+        self._lock = threading.Lock()
+        self._flush_requested = threading.Event()
+        self._closed = False
+        self._query_local = threading.local()
+        
+        # Схему создаём сразу, чтобы запросы работали до первой записи
+        connection = self._connect()
+        connection.executescript(SCHEMA)
+        connection.close()
+        
+        self._thread = threading.Thread(target=self._writer, name="history", daemon=True)
+        self._thread.start()
+    
+    def _connect(self) -> sqlite3.Connection:
+        connection = sqlite3.connect(self.path, timeout=5)
+        connection.execute("PRAGMA journal_mode=WAL")
+        # В WAL synchronous=NORMAL не теряет целостность, но не ждёт fsync на каждой записи
+        connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+    
+    # === Запись ===
+    
+    def record(self, play: Play):
+        """Добавить прослушивание (только в память, без обращения к диску)"""
+        with self._lock:
+            self._buffer.append(play)
+            full = len(self._buffer) >= self.flush_batch
+        if full:
+            self._flush_requested.set()
+    
+    def flush(self):
+        """Попросить фоновый поток записать буфер сейчас"""
+        self._flush_requested.set()
+    
+    def _writer(self):
+        """Фоновый поток: пачками переносит буфер в базу"""
+        connection = self._connect()
+        try:
+            while True:
+                self._flush_requested.wait(self.flush_interval)
+                self._flush_requested.clear()
+                self._write_buffer(connection)
+                if self._closed:
+                    return
+        finally:
+            connection.close()
+    
+    def _write_buffer(self, connection: sqlite3.Connection):
+        with self._lock:
+            plays, self._buffer = self._buffer, []
+        if not plays:
+            return
+        try:
+            with connection:
+                connection.executemany(
+                    "INSERT INTO plays (started_at, title, artist, album, duration, listened) "
+                    "VALUES (?, ?, ?, ?, ?, ?)",
+                    [(p.started_at, p.title, p.artist, p.album, p.duration, p.listened) for p in plays]
+                )
+        except sqlite3.Error as e:
+            log.error("history.write", "Не удалось записать историю", error=str(e), plays=len(plays))
+            # Вернём в буфер, попробуем в следующий раз
+            with self._lock:
+                self._buffer[:0] = plays
+    
+    def close(self, timeout: float = 2.0):
+        """Дописать буфер и остановить фоновый поток"""
+        if self._closed:
+            return
+        self._closed = True
+        self._flush_requested.set()
+        self._thread.join(timeout)
+    
+    # === Запросы ===
+    
+    def _query(self, sql: str, params: tuple = ()) -> list:
+        # Своё соединение на каждый читающий поток: WAL позволяет читать во время записи
+        connection = getattr(self._query_local, "connection", None)
+        if connection is None:
+            connection = self._query_local.connection = self._connect()
+        return connection.execute(sql, params).fetchall()
+    
+    def top_artists(self, since: float = 0, until: Optional[float] = None,
+                    limit: int = 10) -> List[Tuple[str, int, int]]:
+        """Топ исполнителей за период: (исполнитель, прослушиваний, секунд)"""
+        return self._query(
+            "SELECT artist, COUNT(*), SUM(listened) FROM plays "
+            "WHERE started_at >= ? AND started_at < ? "
+            "GROUP BY artist ORDER BY SUM(listened) DESC LIMIT ?",
+            (since, until or float("inf"), limit)
+        )
+    
+    def top_tracks(self, since: float = 0, until: Optional[float] = None,
+                   limit: int = 10) -> List[Tuple[str, str, int, int]]:
+        """Топ треков за период: (исполнитель, название, прослушиваний, секунд)"""
+        return self._query(
+            "SELECT artist, title, COUNT(*), SUM(listened) FROM plays "
+            "WHERE started_at >= ? AND started_at < ? "
+            "GROUP BY artist, title ORDER BY COUNT(*) DESC, SUM(listened) DESC LIMIT ?",
+            (since, until or float("inf"), limit)
+        )
+    
+    def listening_time(self, since: float = 0, until: Optional[float] = None) -> int:
+        """Сколько секунд слушали за период"""
+        rows = self._query(
+            "SELECT COALESCE(SUM(listened), 0) FROM plays WHERE started_at >= ? AND started_at < ?",
+            (since, until or float("inf"))
+        )
+        return rows[0][0]
+    
+    def listening_time_by_day(self, since: float = 0,
+                              until: Optional[float] = None) -> List[Tuple[str, int]]:
+        """Секунды прослушивания по дням (местное время): (ГГГГ-ММ-ДД, секунд)"""
+        return self._query(
+            "SELECT date(started_at, 'unixepoch', 'localtime') AS day, SUM(listened) FROM plays "
+            "WHERE started_at >= ? AND started_at < ? GROUP BY day ORDER BY day",
+            (since, until or float("inf"))
+        )
+    
+    def recent(self, limit: int = 20) -> List[Play]:
+        """Последние прослушивания (включая ещё не записанные на диск)"""
+        with self._lock:
+            pending = self._buffer[-limit:]
+        rows = self._query(
+            "SELECT started_at, title, artist, album, duration, listened FROM plays "
+            "ORDER BY started_at DESC LIMIT ?", (limit,)
+        )
+        plays = list(reversed(pending)) + [Play(*row) for row in rows]
+        return plays[:limit]
+
+
+def today_start() -> float:
+    """Начало сегодняшнего дня (местное время) в секундах эпохи"""
+    now = datetime.now()
+    return now.replace(hour=0, minute=0, second=0, microsecond=0).timestamp()
+
+
+def days_ago(days: int) -> float:
+    """Начало дня days дней назад"""
+    return today_start() - timedelta(days=days).total_seconds()
+
+
+# Синглтон для использования во всём приложении
+_history_instance: Optional[ListeningHistory] = None
+
+
+def get_history() -> ListeningHistory:
+    """Получить инстанс истории"""
+    global _history_instance
+    if _history_instance is None:
+        ensure_appdata_folder()
+        _history_instance = ListeningHistory()
+    return _history_instance
+
+
+def close_history():
+    """Дописать историю на диск (при выходе из приложения)"""
+    global _history_instance
+    if _history_instance is not None:
+        _history_instance.close()
+        _history_instance = None
+
+
+if __name__ == "__main__":
+    # Сводка по истории
+    history = get_history()
+    
+    def fmt(seconds: int) -> str:
+        return f"{seconds // 3600} ч {seconds % 3600 // 60} мин"
+    
+    print(f"Сегодня: {fmt(history.listening_time(today_start()))}")
+    print(f"За неделю: {fmt(history.listening_time(days_ago(7)))}")
+    
+    print("\nТоп исполнителей за неделю:")
+    for artist, plays, seconds in history.top_artists(days_ago(7)):
+        print(f"  {artist} — {plays} раз, {fmt(seconds)}")
+    
+    print("\nТоп треков за неделю:")
+    for artist, title, plays, seconds in history.top_tracks(days_ago(7)):
+        print(f"  {artist} - {title} — {plays} раз")
+    
+    print("\nПоследние треки:")
+    for play in history.recent(10):
+        print(f"  {datetime.fromtimestamp(play.started_at):%d.%m %H:%M} {play.artist} - {play.title}")
+    
+    close_history()
@@ -0,0 +1,170 @@
+"""
+Жизненный цикл компонентов конвейера
+Запуск и остановка с дедлайнами, watchdog перезапускает зависшие компоненты
+"""
+
+import asyncio
+import queue
+import threading
+import time
+from concurrent.futures import Executor, Future
+from contextlib import contextmanager
+from typing import Awaitable, Callable, Dict, Optional
+
+from logger import get_logger
+
+log = get_logger("lifecycle")
+
+
+class DaemonThreadExecutor(Executor):
+    """
+    Исполнитель на daemon-потоках (по умолчанию на одном).
+    В отличие от ThreadPoolExecutor, зависший вызов не держит процесс
+    при выходе: интерпретатор не ждёт daemon-потоки.
+    """
+    
+    def __init__(self, name: str, workers: int = 1):
+        self._queue: queue.SimpleQueue = queue.SimpleQueue()
+        self._shutdown = False
+        self._threads = [
+            threading.Thread(target=self._worker, name=name if workers == 1 else f"{name}-{index}", daemon=True)
+            for index in range(workers)
+        ]
+        for thread in self._threads:
+            thread.start()
+    
+    def submit(self, fn, *args, **kwargs) -> Future:
+        if self._shutdown:
+            raise RuntimeError("Исполнитель остановлен")
+        future: Future = Future()
+        self._queue.put((future, fn, args, kwargs))
+        return future
+    
+    def shutdown(self, wait: bool = True, *, cancel_futures: bool = False):
+        self._shutdown = True
+        for _ in self._threads:
+            self._queue.put(None)
+        if wait:
+            for thread in self._threads:
+                thread.join()
+    
+    def _worker(self):
+        while True:
+            work = self._queue.get()
+            if work is None:
+                return
+            future, fn, args, kwargs = work
+            if not future.set_running_or_notify_cancel():
+                continue
+            try:
+                future.set_result(fn(*args, **kwargs))
+            except BaseException as e:
+                future.set_exception(e)
+
+
+class Component:
+    """Компонент конвейера: долгоживущая задача с пульсом"""
+    
+    def __init__(self, name: str, run: Callable[["Component"], Awaitable],
+                 heartbeat_timeout: Optional[float] = None,
+                 on_restart: Optional[Callable[[], None]] = None):
+        """
+        Args:
+            name: Имя компонента
+            run: Корутина-функция, получает сам компонент
+            heartbeat_timeout: Через сколько секунд без пульса компонент считается зависшим
+            on_restart: Вызывается перед перезапуском (например, чтобы заменить зависший поток)
+        """
+        self.name = name
+        self.run = run
+        self.heartbeat_timeout = heartbeat_timeout
+        self.on_restart = on_restart
+        self.task: Optional[asyncio.Task] = None
+        self.restarts = 0
+        self.last_beat = time.monotonic()
+        self._idle_depth = 0
+    
+    def beat(self):
+        """Отметить, что компонент жив"""
+        self.last_beat = time.monotonic()
+    
+    @contextmanager
+    def idle(self):
+        """Компонент ждёт входных данных — это не зависание"""
+        self._idle_depth += 1
+        try:
+            yield
+        finally:
+            self._idle_depth -= 1
+            self.beat()
+    
+    def is_stalled(self, now: float) -> bool:
+        """Завис ли компонент (занят работой дольше heartbeat_timeout)"""
+        if self.heartbeat_timeout is None or self._idle_depth:
+            return False
+        return now - self.last_beat > self.heartbeat_timeout
+
+
+class Supervisor:
+    """Запускает компоненты, следит за пульсом и останавливает их с дедлайном"""
+    
+    def __init__(self, watchdog_interval: float = 1.0):
+        self.watchdog_interval = watchdog_interval
+        self.components: Dict[str, Component] = {}
+        self._watchdog_task: Optional[asyncio.Task] = None
+    
+    def add(self, name: str, run: Callable[[Component], Awaitable],
+            heartbeat_timeout: Optional[float] = None,
+            on_restart: Optional[Callable[[], None]] = None) -> Component:
+        """Зарегистрировать компонент"""
+        component = Component(name, run, heartbeat_timeout, on_restart)
+        self.components[name] = component
+        return component
+    
+    def start(self):
+        """Запустить все компоненты и watchdog (внутри работающего цикла)"""
+        for component in self.components.values():
+            self._start_component(component)
+        self._watchdog_task = asyncio.create_task(self._watchdog(), name="watchdog")
+    
+    def _start_component(self, component: Component):
+        component.beat()
+        component.task = asyncio.create_task(component.run(component), name=component.name)
+    
+    async def stop(self, timeout: float):
+        """Остановить все компоненты, ожидая не дольше timeout секунд"""
+        tasks = [c.task for c in self.components.values() if c.task]
+        if self._watchdog_task:
+            tasks.append(self._watchdog_task)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            # Задачи, застрявшие дольше дедлайна, бросаем — их потоки daemon
+            await asyncio.wait(tasks, timeout=timeout)
+    
+    def restart(self, component: Component):
+        """Перезапустить компонент"""
+        if component.task:
+            component.task.cancel()
+        if component.on_restart:
+            try:
+                component.on_restart()
+            except Exception as e:
+                log.error("lifecycle.restart", "Ошибка перезапуска", component=component.name, error=str(e))
+        component.restarts += 1
+        self._start_component(component)
+    
+    async def _watchdog(self):
+        """Перезапускать зависшие и упавшие компоненты"""
+        while True:
+            await asyncio.sleep(self.watchdog_interval)
+            now = time.monotonic()
+            for component in self.components.values():
+                task = component.task
+                crashed = task is not None and task.done() and not task.cancelled()
+                if crashed:
+                    task.exception()  # Забираем исключение, чтобы asyncio не ругался
+                if crashed or component.is_stalled(now):
+                    reason = "упал" if crashed else "завис"
+                    log.warning("lifecycle.watchdog", f"⟳ Компонент {component.name} {reason}, перезапуск")
+                    self.restart(component)
@@ -0,0 +1,192 @@
+"""
+Структурированное логирование
+Ограничение частоты по ключу сообщения, схлопывание повторов
+и запись в ротируемый файл в AppData фоновым потоком
+"""
+
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from typing import Dict, Optional
+
+from settings import APPDATA_FOLDER, ensure_appdata_folder
+
+LOG_FILE = os.path.join(APPDATA_FOLDER, "yandex_music_rpc.log")
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUP_COUNT = 3
+
+# Не больше RATE_LIMIT_BURST сообщений с одним ключом за RATE_LIMIT_PERIOD секунд
+RATE_LIMIT_BURST = 5
+RATE_LIMIT_PERIOD = 60.0
+
+ROOT_LOGGER_NAME = "ymrpc"
+
+_listener: Optional[logging.handlers.QueueListener] = None
+
+
+class _KeyState:
+    """Состояние ограничителя для одного ключа"""
+    
+    __slots__ = ("tokens", "updated_at", "last_message", "emitted_at", "suppressed")
+    
+    def __init__(self, now: float):
+        self.tokens = float(RATE_LIMIT_BURST)
+        self.updated_at = now
+        self.last_message = None
+        self.emitted_at = now
+        self.suppressed = 0
+
+
+class RateLimitFilter(logging.Filter):
+    """
+    Ограничивает частоту сообщений с одинаковым ключом (token bucket)
+    и схлопывает подряд идущие одинаковые сообщения.
+    Пропущенные сообщения учитываются в следующем пропущенном через фильтр.
+    """
+    
+    def __init__(self, burst: int = RATE_LIMIT_BURST, period: float = RATE_LIMIT_PERIOD):
+        super().__init__()
+        self.burst = burst
+        self.period = period
+        self._states: Dict[str, _KeyState] = {}
+        self._lock = threading.Lock()
+    
+    def filter(self, record: logging.LogRecord) -> bool:
+        key = getattr(record, "key", None) or f"{record.name}:{record.msg}"
+        message = record.getMessage()
+        now = time.monotonic()
+        
+        with self._lock:
+            state = self._states.get(key)
+            if state is None:
+                state = self._states[key] = _KeyState(now)
+            
+            # Пополняем токены
+            state.tokens = min(self.burst, state.tokens + (now - state.updated_at) * self.burst / self.period)
+            state.updated_at = now
+            
+            repeated = message == state.last_message
+            # Ошибки не ограничиваем по частоте, только схлопываем повторы
+            limited = state.tokens < 1 and record.levelno < logging.ERROR
+            if (repeated and now - state.emitted_at < self.period) or limited:
+                state.suppressed += 1
+                return False
+            
+            state.tokens = max(0.0, state.tokens - 1)
+            record.repeated = state.suppressed
+            state.suppressed = 0
+            state.last_message = message
+            state.emitted_at = now
+            return True
+
+
+class StructuredFormatter(logging.Formatter):
+    """время уровень модуль ключ сообщение k=v ..."""
+    
+    def format(self, record: logging.LogRecord) -> str:
+        line = (
+            f"{self.formatTime(record, '%Y-%m-%d %H:%M:%S')} "
+            f"{record.levelname:<7} {record.name.split('.')[-1]} "
+            f"{getattr(record, 'key', '-')} {record.getMessage()}"
+        )
+        fields = getattr(record, "fields", None)
+        if fields:
+            line += " " + " ".join(f"{k}={v!r}" for k, v in fields.items())
+        repeated = getattr(record, "repeated", 0)
+        if repeated:
+            line += f" (предыдущие сообщения повторились {repeated} раз)"
+        if record.exc_info:
+            line += "\n" + self.formatException(record.exc_info)
+        return line
+
+
+class StructuredLogger:
+    """Логгер со структурированными полями: log.info("ключ", "сообщение", поле=значение)"""
+    
+    def __init__(self, name: str):
+        self._logger = logging.getLogger(f"{ROOT_LOGGER_NAME}.{name}")
+    
+    def _log(self, level: int, key: str, message: str, exc_info=None, **fields):
+        if self._logger.isEnabledFor(level):
+            self._logger.log(level, message, exc_info=exc_info,
+                             extra={"key": key, "fields": fields})
+    
+    def debug(self, key: str, message: str, **fields):
+        self._log(logging.DEBUG, key, message, **fields)
+    
+    def info(self, key: str, message: str, **fields):
+        self._log(logging.INFO, key, message, **fields)
+    
+    def warning(self, key: str, message: str, **fields):
+        self._log(logging.WARNING, key, message, **fields)
+    
+    def error(self, key: str, message: str, **fields):
+        self._log(logging.ERROR, key, message, **fields)
+    
+    def exception(self, key: str, message: str, **fields):
+        self._log(logging.ERROR, key, message, exc_info=True, **fields)
+
+
+def get_logger(name: str) -> StructuredLogger:
+    """Получить логгер модуля"""
+    return StructuredLogger(name)
+
+
+def setup_logging(level: int = logging.INFO, console: Optional[bool] = None):
+    """
+    Включить запись логов.
+    Вызывающий поток только кладёт запись в очередь, в файл (и консоль)
+    пишет фоновый поток QueueListener.
+    
+    Args:
+        level: Минимальный уровень
+        console: Дублировать в консоль; по умолчанию — если она есть (не pythonw)
+    """
+    global _listener
+    if _listener is not None:
+        return
+    
+    if console is None:
+        console = sys.stdout is not None
+    
+    formatter = StructuredFormatter()
+    handlers = []
+    
+    try:
+        ensure_appdata_folder()
+        file_handler = logging.handlers.RotatingFileHandler(
+            LOG_FILE, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8"
+        )
+        file_handler.setFormatter(formatter)
+        handlers.append(file_handler)
+    except OSError:
+        pass
+    
+    if console:
+        console_handler = logging.StreamHandler(sys.stdout)
+        console_handler.setFormatter(formatter)
+        handlers.append(console_handler)
+    
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+    queue_handler = logging.handlers.QueueHandler(log_queue)
+    queue_handler.addFilter(RateLimitFilter())
+    
+    root = logging.getLogger(ROOT_LOGGER_NAME)
+    root.setLevel(level)
+    root.propagate = False
+    root.addHandler(queue_handler)
+    
+    _listener = logging.handlers.QueueListener(log_queue, *handlers, respect_handler_level=True)
+    _listener.start()
+
+
+def shutdown_logging():
+    """Дописать очередь и остановить фоновый поток"""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
@@ -0,0 +1,144 @@
+"""
+Синхронизированный текст песни
+LRC из Yandex Music разбирается в отсортированную шкалу времени,
+текущая строка ищется двоичным поиском по позиции воспроизведения
+"""
+
+import re
+from bisect import bisect_right
+from collections import OrderedDict
+from typing import List, Optional
+
+from logger import get_logger
+
+log = get_logger("lyrics")
+
+# Где показывать строку: off — не показывать, state/details — поле статуса Discord
+LYRICS_MODES = ("off", "state", "details")
+
+# Сколько разобранных текстов держать в памяти (вытесняются давно не нужные)
+LYRICS_CACHE_SIZE = 64
+
+# Метка времени [мм:сс], [мм:сс.xx] или [мм:сс:xx]; у строки их может быть несколько
+_TIME_TAG = re.compile(r"\[(\d+):(\d+)(?:[.:](\d+))?\]")
+
+
+class LyricsTimeline:
+    """Строки текста по времени начала (отсортированы, для bisect)"""
+    
+    __slots__ = ("times", "lines")
+    
+    def __init__(self, times: List[float], lines: List[str]):
+        self.times = times
+        self.lines = lines
+    
+    def __len__(self) -> int:
+        return len(self.times)
+    
+    def index_at(self, position: float) -> int:
+        """Номер строки, звучащей на позиции (-1 — до первой строки)"""
+        return bisect_right(self.times, position) - 1
+    
+    def line_at(self, position: float) -> Optional[str]:
+        """Текст строки на позиции или None (вступление, проигрыш)"""
+        index = self.index_at(position)
+        if index < 0:
+            return None
+        return self.lines[index] or None
+    
+    def next_change(self, position: float) -> Optional[float]:
+        """Когда начнётся следующая строка (None — строк больше нет)"""
+        index = self.index_at(position) + 1
+        return self.times[index] if index < len(self.times) else None
+
+
+def parse_lrc(text: str) -> LyricsTimeline:
+    """Разобрать LRC; служебные теги ([ar:...], [offset:...]) пропускаются"""
+    entries = []
+    for raw in text.splitlines():
+        tags = []
+        rest = raw.strip()
+        while True:
+            match = _TIME_TAG.match(rest)
+            if match is None:
+                break
+            minutes, seconds, fraction = match.groups()
+            fraction_value = int(fraction) / 10 ** len(fraction) if fraction else 0.0
+            tags.append(int(minutes) * 60 + int(seconds) + fraction_value)
+            rest = rest[match.end():]
+        line = rest.strip()
+        for time_tag in tags:
+            entries.append((time_tag, line))
+    # Строки с несколькими метками (припев) расходятся по своим местам
+    entries.sort(key=lambda entry: entry[0])
+    return LyricsTimeline([entry[0] for entry in entries], [entry[1] for entry in entries])
+
+
+class LyricsProvider:
+    """Загрузка текстов через YandexMusicAPI с кэшем по id трека"""
+    
+    def __init__(self, yandex_api, cache_size: int = LYRICS_CACHE_SIZE):
+        self.yandex_api = yandex_api
+        self.cache_size = cache_size
+        # id трека -> шкала; None тоже кэшируется (у трека нет синхронного текста)
+        self._cache: "OrderedDict[str, Optional[LyricsTimeline]]" = OrderedDict()
+        self.fetches = 0
+    
+    def timeline(self, title: str, artist: str) -> Optional[LyricsTimeline]:
+        """Шкала текста для трека (блокирующий вызов)"""
+        track_info = self.yandex_api.find_track(title, artist)
+        if not track_info:
+            return None
+        return self.timeline_by_id(str(track_info["id"]))
+    
+    def timeline_by_id(self, track_id: str) -> Optional[LyricsTimeline]:
+        """Шкала текста по id трека в Yandex Music (блокирующий вызов)"""
+        if track_id in self._cache:
+            self._cache.move_to_end(track_id)
+            return self._cache[track_id]
+        
+        text = self.yandex_api.get_lyrics(track_id)
+        self.fetches += 1
+        timeline = parse_lrc(text) if text else None
+        if timeline is not None and not len(timeline):
+            timeline = None
+        self._cache[track_id] = timeline
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        log.debug("lyrics.fetch", "Текст загружен", track_id=track_id, lines=len(timeline) if timeline else 0)
+        return timeline
+    
+    def prefetch_next(self, title: str, artist: str):
+        """Заранее загрузить текст следующего трека в очереди (блокирующий вызов)"""
+        track_info = self.yandex_api.find_track(title, artist)
+        if not track_info:
+            return
+        next_id = self.yandex_api.get_next_track_id(str(track_info["id"]))
+        if next_id is not None:
+            self.timeline_by_id(next_id)
+
+
+if __name__ == "__main__":
+    # Тест модуля
+    import time
+    
+    sample = """[ar:Исполнитель]
+[ti:Песня]
+[00:12.00]Первая строка
+[00:17.20]Вторая строка
+[00:21.10][01:05.50]Припев
+[00:25.00]
+[00:31.75]Третья строка
+"""
+    timeline = parse_lrc(sample)
+    print(f"Строк: {len(timeline)}")
+    for position in (0, 12, 18.5, 22, 26, 40, 66):
+        print(f"  {position:>5}: {timeline.line_at(position)!r}, следующая на {timeline.next_change(position)}")
+    
+    # Скорость поиска строки на длинном тексте
+    long_timeline = parse_lrc("\n".join(f"[{i // 60:02d}:{i % 60:02d}.00]Строка {i}" for i in range(600)))
+    started = time.perf_counter()
+    for step in range(100000):
+        long_timeline.line_at(step % 600 + 0.5)
+    elapsed = time.perf_counter() - started
+    print(f"Поиск строки: {elapsed / 100000 * 1e6:.2f} мкс")
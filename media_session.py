@@ -6,10 +6,10 @@ import asyncio
 from dataclasses import dataclass
 from typing import Optional
 
-from winrt.windows.media.control import (
-    GlobalSystemMediaTransportControlsSessionManager,
-    GlobalSystemMediaTransportControlsSessionPlaybackStatus
-)
+from metrics import ERRORS, MEDIA_READ, SESSION_LOOKUP
+from logger import get_logger
+
+log = get_logger("media")
 
 
 @dataclass
@@ -30,28 +30,57 @@ class MediaSessionManager:
     def __init__(self, app_name: str = "Yandex Music"):
         self.app_name = app_name.lower()
         self._session_manager = None
+        self._recorder = None
+    
+    def start_recording(self, path: str):
+        """Записывать прочитанные треки в файл трассы (см. media_trace)"""
+        from media_trace import TraceRecorder
+        self.stop_recording()
+        self._recorder = TraceRecorder(path)
+        log.info("media.trace", "Запись трассы", path=path)
+    
+    def stop_recording(self):
+        """Остановить запись трассы"""
+        recorder, self._recorder = self._recorder, None
+        if recorder is not None:
+            recorder.close()
+            log.info("media.trace", "Запись трассы остановлена", path=recorder.path, records=recorder.records)
     
     async def _get_session_manager(self):
         """Получить менеджер сессий"""
         if self._session_manager is None:
+            # winrt импортируем при первом обращении к сессиям
+            from winrt.windows.media.control import GlobalSystemMediaTransportControlsSessionManager
             self._session_manager = await GlobalSystemMediaTransportControlsSessionManager.request_async()
         return self._session_manager
     
     async def _get_yandex_session(self):
         """Найти сессию Yandex Music"""
-        manager = await self._get_session_manager()
-        sessions = manager.get_sessions()
-        
-        for session in sessions:
-            source_app_id = session.source_app_user_model_id.lower()
-            # Проверяем разные варианты названия приложения
-            if any(name in source_app_id for name in ['yandex', 'яндекс', 'music']):
-                return session
-        
-        return None
+        with SESSION_LOOKUP.time():
+            manager = await self._get_session_manager()
+            sessions = manager.get_sessions()
+            
+            for session in sessions:
+                source_app_id = session.source_app_user_model_id.lower()
+                # Проверяем разные варианты названия приложения
+                if any(name in source_app_id for name in ['yandex', 'яндекс', 'music']):
+                    return session
+            
+            return None
     
     async def get_current_track(self) -> Optional[TrackInfo]:
         """Получить информацию о текущем треке"""
+        with MEDIA_READ.time():
+            track = await self._read_current_track()
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(track)
+        return track
+    
+    async def _read_current_track(self) -> Optional[TrackInfo]:
+        """Прочитать текущий трек из сессии"""
+        from winrt.windows.media.control import GlobalSystemMediaTransportControlsSessionPlaybackStatus
+        
         try:
             session = await self._get_yandex_session()
             if not session:
@@ -86,7 +115,8 @@ class MediaSessionManager:
             )
             
         except Exception as e:
-            print(f"Ошибка получения трека: {e}")
+            ERRORS.inc()
+            log.warning("media.read", "Ошибка получения трека", error=str(e))
             return None
     
     async def get_all_sessions(self) -> list:
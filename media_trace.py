@@ -0,0 +1,166 @@
+"""
+Запись и воспроизведение трасс медиа-сессии
+Трасса — JSON Lines: заголовок и компактные записи только при изменениях
+(смена трека, пауза, перемотка). Между записями позиция экстраполируется
+"""
+
+import json
+import threading
+import time
+from bisect import bisect_right
+from typing import List, Optional, Tuple
+
+from media_session import TrackInfo
+
+TRACE_VERSION = 1
+
+# Расхождение позиции (с), после которого пишем новую запись (перемотка)
+SEEK_THRESHOLD = 2
+
+
+def _encode(offset: float, track: Optional[TrackInfo]) -> list:
+    """Компактная запись: [t, title, artist, album, playing, duration, position] или [t]"""
+    if track is None:
+        return [round(offset, 3)]
+    return [round(offset, 3), track.title, track.artist, track.album,
+            int(track.is_playing), track.duration, track.position]
+
+
+def _decode(record: list) -> Tuple[float, Optional[TrackInfo]]:
+    if len(record) == 1:
+        return record[0], None
+    offset, title, artist, album, playing, duration, position = record
+    return offset, TrackInfo(title=title, artist=artist, album=album,
+                             is_playing=bool(playing), duration=duration, position=position)
+
+
+class TraceRecorder:
+    """Пишет поток TrackInfo в файл трассы"""
+    
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", encoding="utf-8")
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._last: Optional[Tuple[float, Optional[TrackInfo]]] = None
+        self.records = 0
+        self._write({"version": TRACE_VERSION, "started": time.time()})
+    
+    def _write(self, obj):
+        self._file.write(json.dumps(obj, ensure_ascii=False, separators=(",", ":")) + "\n")
+        self._file.flush()
+    
+    def _changed(self, offset: float, track: Optional[TrackInfo]) -> bool:
+        if self._last is None:
+            return True
+        last_offset, last = self._last
+        if (track is None) != (last is None):
+            return True
+        if track is None:
+            return False
+        if (track.title, track.artist, track.album, track.is_playing, track.duration) != \
+           (last.title, last.artist, last.album, last.is_playing, last.duration):
+            return True
+        expected = last.position + (offset - last_offset if last.is_playing else 0)
+        return abs(track.position - expected) > SEEK_THRESHOLD
+    
+    def record(self, track: Optional[TrackInfo]):
+        """Учесть прочитанный трек (пишется только если что-то изменилось)"""
+        offset = time.monotonic() - self._started
+        with self._lock:
+            if self._file.closed or not self._changed(offset, track):
+                return
+            self._last = (offset, track)
+            self._write(_encode(offset, track))
+            self.records += 1
+    
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._file.close()
+
+
+def load_trace(path: str) -> List[Tuple[float, Optional[TrackInfo]]]:
+    """Прочитать трассу: список (смещение в секундах, трек)"""
+    events = []
+    with open(path, "r", encoding="utf-8") as f:
+        header = json.loads(f.readline())
+        if header.get("version") != TRACE_VERSION:
+            raise ValueError(f"Неподдерживаемая версия трассы: {header.get('version')}")
+        for line in f:
+            line = line.strip()
+            if line:
+                events.append(_decode(json.loads(line)))
+    return events
+
+
+def save_trace(path: str, events: List[Tuple[float, Optional[TrackInfo]]]):
+    """Записать готовый список событий в файл трассы (для синтетических сценариев)"""
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(json.dumps({"version": TRACE_VERSION, "started": time.time()}) + "\n")
+        for offset, track in events:
+            f.write(json.dumps(_encode(offset, track), ensure_ascii=False, separators=(",", ":")) + "\n")
+
+
+class TraceReplayer:
+    """
+    Источник треков, воспроизводящий трассу.
+    Совместим с MediaSessionManager по get_current_track()
+    """
+    
+    def __init__(self, events: List[Tuple[float, Optional[TrackInfo]]], speed: float = 1.0):
+        """
+        Args:
+            events: События трассы (см. load_trace)
+            speed: Ускорение времени: 10 — трасса проигрывается в 10 раз быстрее
+        """
+        self.events = events
+        self.speed = speed
+        self._offsets = [offset for offset, _ in events]
+        self._started: Optional[float] = None
+        self.reads = 0
+    
+    @classmethod
+    def from_file(cls, path: str, speed: float = 1.0) -> "TraceReplayer":
+        return cls(load_trace(path), speed)
+    
+    @property
+    def duration(self) -> float:
+        """Длительность трассы в секундах трассы"""
+        return self._offsets[-1] if self._offsets else 0.0
+    
+    def start(self):
+        """Начать воспроизведение (иначе начнётся при первом чтении)"""
+        self._started = time.perf_counter()
+    
+    def trace_time(self) -> float:
+        """Текущее время трассы (с)"""
+        if self._started is None:
+            return 0.0
+        return (time.perf_counter() - self._started) * self.speed
+    
+    @property
+    def finished(self) -> bool:
+        return self._started is not None and self.trace_time() > self.duration
+    
+    def track_at(self, offset: float) -> Optional[TrackInfo]:
+        """Состояние трассы в момент offset (позиция экстраполирована)"""
+        index = bisect_right(self._offsets, offset) - 1
+        if index < 0:
+            return None
+        event_offset, track = self.events[index]
+        if track is None:
+            return None
+        position = track.position
+        if track.is_playing:
+            position = int(position + offset - event_offset)
+            if track.duration:
+                position = min(position, track.duration)
+        return TrackInfo(title=track.title, artist=track.artist, album=track.album,
+                         is_playing=track.is_playing, duration=track.duration, position=position)
+    
+    async def get_current_track(self) -> Optional[TrackInfo]:
+        if self._started is None:
+            self.start()
+        self.reads += 1
+        return self.track_at(self.trace_time())
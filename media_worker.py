@@ -0,0 +1,283 @@
+"""
+Чтение медиа-сессии в отдельном процессе
+Вызовы WinRT/GSMTC иногда зависают вместе с приложением Yandex Music.
+В этом режиме их делает дочерний процесс: он шлёт по каналу только изменения
+трека (компактными кортежами) и пульс. Если пульса нет STALL_TIMEOUT секунд,
+процесс убивается и запускается заново — зависание не доходит до конвейера
+"""
+
+import asyncio
+import multiprocessing
+import signal
+import threading
+import time
+from dataclasses import replace
+from typing import Callable, Optional, Tuple
+
+from media_session import TrackInfo
+from media_trace import SEEK_THRESHOLD
+from metrics import REGISTRY
+from logger import get_logger
+
+log = get_logger("media_worker")
+
+# Как часто дочерний процесс читает медиа-сессию (с); пульс — не реже
+POLL_INTERVAL = 1.0
+# Столько без сообщений — процесс завис (с)
+STALL_TIMEOUT = 5.0
+# Сколько ждать завершения убитого процесса (с) и пауза перед новым запуском (с)
+KILL_TIMEOUT = 1.0
+RESPAWN_DELAY = 0.5
+# Процесс, не приславший ни одного сообщения (падает при запуске), перезапускается
+# всё реже: пауза удваивается до MAX_RESPAWN_DELAY (с)
+MAX_RESPAWN_DELAY = 30.0
+# Первое чтение ждёт запуска процесса не дольше (с), чтобы не показать «Нет трека»
+FIRST_TRACK_TIMEOUT = 2.0
+
+WORKER_RESPAWNS = REGISTRY.counter("media_worker_respawns_total",
+                                   "Перезапуски процесса чтения медиа-сессии")
+
+
+def _encode(track: Optional[TrackInfo]) -> Optional[tuple]:
+    """Трек без миниатюры — кортеж из шести полей"""
+    if track is None:
+        return None
+    return (track.title, track.artist, track.album, track.is_playing, track.duration, track.position)
+
+
+def _decode(data: Optional[tuple]) -> Optional[TrackInfo]:
+    if data is None:
+        return None
+    title, artist, album, is_playing, duration, position = data
+    return TrackInfo(title=title, artist=artist, album=album, is_playing=is_playing,
+                     duration=duration, position=position)
+
+
+def _changed(last: Optional[Tuple[float, Optional[TrackInfo]]], track: Optional[TrackInfo], now: float) -> bool:
+    """Стоит ли слать трек: другой трек, пауза или перемотка (ход позиции родитель досчитает сам)"""
+    if last is None:
+        return True
+    sent_at, sent = last
+    if sent is None or track is None:
+        return sent is not track
+    if _encode(sent)[:5] != _encode(track)[:5]:
+        return True
+    expected = sent.position + (now - sent_at if sent.is_playing else 0)
+    return abs(track.position - expected) > SEEK_THRESHOLD
+
+
+def _worker_main(connection, factory: Callable, args: tuple, poll_interval: float):
+    """Точка входа дочернего процесса: читать трек, слать изменения и пульс"""
+    # Ctrl+C в консоли получает вся группа процессов — останавливает нас родитель
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    source = factory(*args)
+    loop = asyncio.new_event_loop()
+    last = None
+    try:
+        while True:
+            try:
+                track = loop.run_until_complete(source.get_current_track())
+            except Exception:
+                track = None
+            now = time.monotonic()
+            if _changed(last, track, now):
+                last = (now, track)
+                connection.send(("track", _encode(track)))
+            else:
+                connection.send(("beat",))
+            time.sleep(poll_interval)
+    except (OSError, EOFError):
+        pass  # Родитель закрыл канал — завершаемся
+
+
+class ProcessTrackSource:
+    """
+    Источник трека, читающий медиа-сессию в дочернем процессе.
+    get_current_track() не ждёт процесс: отдаёт последний присланный трек
+    с досчитанной позицией
+    """
+    
+    def __init__(self, factory: Optional[Callable] = None, args: tuple = (),
+                 poll_interval: float = POLL_INTERVAL, stall_timeout: float = STALL_TIMEOUT):
+        if factory is None:
+            from backends import create_track_source
+            factory = create_track_source
+        self.factory = factory
+        self.args = args
+        self.poll_interval = poll_interval
+        self.stall_timeout = stall_timeout
+        # (time.monotonic() получения, трек) — заменяется одним присваиванием
+        self._track: Tuple[float, Optional[TrackInfo]] = (0.0, None)
+        self._process = None
+        self._connection = None
+        self._closed = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._start_lock = threading.Lock()
+        self._recorder = None
+        self.respawns = 0
+        self.last_message_at: Optional[float] = None
+    
+    def start(self):
+        """Запустить процесс и поток присмотра (вызывается при первом чтении)"""
+        with self._start_lock:
+            if self._thread is None and not self._closed.is_set():
+                self._thread = threading.Thread(target=self._supervise, name="media-worker", daemon=True)
+                self._thread.start()
+    
+    async def get_current_track(self) -> Optional[TrackInfo]:
+        self.start()
+        if self.last_message_at is None:
+            deadline = time.monotonic() + FIRST_TRACK_TIMEOUT
+            while self.last_message_at is None and time.monotonic() < deadline:
+                await asyncio.sleep(0.02)
+        received_at, track = self._track
+        if track is not None and track.is_playing:
+            elapsed = int(time.monotonic() - received_at)
+            if elapsed:
+                position = track.position + elapsed
+                track = replace(track, position=min(position, track.duration) if track.duration else position)
+        recorder = self._recorder
+        if recorder is not None:
+            recorder.record(track)
+        return track
+    
+    def start_recording(self, path: str):
+        """Записывать прочитанные треки в файл трассы (см. media_trace)"""
+        from media_trace import TraceRecorder
+        self.stop_recording()
+        self._recorder = TraceRecorder(path)
+    
+    def stop_recording(self):
+        recorder, self._recorder = self._recorder, None
+        if recorder is not None:
+            recorder.close()
+    
+    # === Присмотр за процессом ===
+    
+    def _spawn(self):
+        # spawn везде, как на Windows: не копируем потоки родителя через fork
+        context = multiprocessing.get_context("spawn")
+        receiver, sender = context.Pipe(duplex=False)
+        process = context.Process(target=_worker_main, name="media-worker", daemon=True,
+                                  args=(sender, self.factory, self.args, self.poll_interval))
+        process.start()
+        sender.close()
+        self._process, self._connection = process, receiver
+    
+    def _kill(self):
+        process, connection = self._process, self._connection
+        if process is not None:
+            process.kill()
+            process.join(KILL_TIMEOUT)
+        if connection is not None:
+            connection.close()
+    
+    def _receive(self) -> str:
+        """Принимать сообщения, пока процесс жив; возвращает причину остановки"""
+        while not self._closed.is_set():
+            try:
+                if not self._connection.poll(self.stall_timeout):
+                    return "stall"
+                message = self._connection.recv()
+            except (OSError, EOFError):
+                return "exit"
+            self.last_message_at = time.monotonic()
+            if message[0] == "track":
+                self._track = (self.last_message_at, _decode(message[1]))
+        return "closed"
+    
+    def _supervise(self):
+        delay = RESPAWN_DELAY
+        while not self._closed.is_set():
+            started = time.monotonic()
+            self._spawn()
+            reason = self._receive()
+            self._kill()
+            if self._closed.is_set():
+                return
+            answered = self.last_message_at is not None and self.last_message_at >= started
+            if answered:
+                delay = RESPAWN_DELAY
+            self.respawns += 1
+            WORKER_RESPAWNS.inc()
+            log.warning("media_worker.respawn", "Процесс чтения медиа-сессии перезапускается",
+                        reason=reason, uptime=round(time.monotonic() - started, 1), delay=delay)
+            self._closed.wait(delay)
+            if not answered:
+                delay = min(delay * 2, MAX_RESPAWN_DELAY)
+    
+    def close(self, timeout: float = KILL_TIMEOUT):
+        """Остановить процесс (при выходе)"""
+        self._closed.set()
+        self._kill()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+        self.stop_recording()
+
+
+# Процесс чтения медиа-сессии приложения
+_worker: Optional[ProcessTrackSource] = None
+
+
+def get_media_worker(source: Optional[str] = None) -> ProcessTrackSource:
+    """Источник трека в отдельном процессе; source — имя бэкенда (см. backends.py)"""
+    global _worker
+    if _worker is None:
+        _worker = ProcessTrackSource(args=(source,))
+    return _worker
+
+
+def close_media_worker():
+    global _worker
+    if _worker is not None:
+        _worker.close()
+        _worker = None
+
+
+if __name__ == "__main__":
+    # Тест модуля: процесс с источником в памяти, затем зависший процесс
+    import os
+    import sys
+    sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "benchmarks"))
+    from fakes import StuckMediaSource, make_track
+    
+    async def read(source, until: Callable[[Optional[TrackInfo]], bool], timeout: float = 10):
+        deadline = time.monotonic() + timeout
+        while time.monotonic() < deadline:
+            track = await source.get_current_track()
+            if until(track):
+                return track
+            await asyncio.sleep(0.05)
+        return None
+    
+    started = time.perf_counter()
+    source = ProcessTrackSource(StuckMediaSource, args=(make_track(), 3), poll_interval=0.2, stall_timeout=1.0)
+    track = asyncio.run(read(source, lambda track: track is not None))
+    print(f"Первый трек из процесса: {track.title} через {(time.perf_counter() - started) * 1000:.0f} мс")
+    
+    # После 3 чтений процесс зависает: чтение в родителе продолжает отвечать сразу
+    hung_at = time.perf_counter()
+    slowest = 0.0
+    while source.respawns == 0 and time.perf_counter() - hung_at < 10:
+        read_started = time.perf_counter()
+        asyncio.run(source.get_current_track())
+        slowest = max(slowest, time.perf_counter() - read_started)
+        time.sleep(0.05)
+    print(f"Зависание обнаружено и процесс перезапущен: {source.respawns} раз, "
+          f"самое долгое чтение в родителе {slowest * 1000:.2f} мс")
+    
+    respawned_at = time.monotonic()
+    asyncio.run(read(source, lambda track: (source.last_message_at or 0) > respawned_at))
+    print(f"Новый процесс прислал данные через {(source.last_message_at - respawned_at) * 1000:.0f} мс")
+    source.close()
+    print(f"После close процесс остановлен: {not source._process.is_alive()}")
+    
+    # Процесс падает при запуске: перезапуски реже с каждым разом, а не каждые 0.5 с
+    started = time.monotonic()
+    broken = ProcessTrackSource(int, args=("не число",))
+    broken.start()
+    time.sleep(4)
+    broken.close()
+    print(f"Падающий процесс за {time.monotonic() - started:.0f} с перезапущен {broken.respawns} раз "
+          f"(паузы {RESPAWN_DELAY}, {RESPAWN_DELAY * 2}, {RESPAWN_DELAY * 4} с...)")
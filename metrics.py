@@ -0,0 +1,265 @@
+"""
+Метрики конвейера: гистограммы задержек и счётчики
+Дешёвые в записи, чтобы оставлять включёнными всегда.
+Опционально отдаются по HTTP на localhost в формате Prometheus
+"""
+
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from typing import Callable, Dict, Tuple
+
+from logger import get_logger
+
+log = get_logger("metrics")
+
+# Границы корзин гистограмм задержек (секунды)
+DEFAULT_BUCKETS: Tuple[float, ...] = (
+    0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0
+)
+
+PREFIX = "ymrpc_"
+
+
+class Counter:
+    """Монотонный счётчик"""
+    
+    def __init__(self, name: str, help_text: str):
+        self.name = name
+        self.help = help_text
+        self.value = 0
+        self._lock = threading.Lock()
+    
+    def inc(self, amount: int = 1):
+        with self._lock:
+            self.value += amount
+
+
+class Gauge:
+    """Текущее значение, вычисляемое при чтении"""
+    
+    def __init__(self, name: str, help_text: str, func: Callable[[], float]):
+        self.name = name
+        self.help = help_text
+        self.func = func
+    
+    @property
+    def value(self) -> float:
+        try:
+            return float(self.func())
+        except Exception:
+            return float("nan")
+
+
+class Histogram:
+    """Гистограмма с фиксированными корзинами"""
+    
+    def __init__(self, name: str, help_text: str, buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # последняя корзина — +Inf
+        self.sum = 0.0
+        self.count = 0
+        self._lock = threading.Lock()
+    
+    def observe(self, value: float):
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            self.counts[index] += 1
+            self.sum += value
+            self.count += 1
+    
+    @contextmanager
+    def time(self):
+        """Замерить длительность блока"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+    
+    @property
+    def average(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+
+class Registry:
+    """Набор метрик приложения"""
+    
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._lock = threading.Lock()
+    
+    def counter(self, name: str, help_text: str) -> Counter:
+        return self._get_or_create(name, lambda: Counter(PREFIX + name, help_text))
+    
+    def histogram(self, name: str, help_text: str,
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self._get_or_create(name, lambda: Histogram(PREFIX + name, help_text, buckets))
+    
+    def gauge(self, name: str, help_text: str, func: Callable[[], float]) -> Gauge:
+        """Зарегистрировать (или заменить) gauge"""
+        gauge = Gauge(PREFIX + name, help_text, func)
+        with self._lock:
+            self._metrics[name] = gauge
+        return gauge
+    
+    def get(self, name: str):
+        return self._metrics.get(name)
+    
+    def _get_or_create(self, name, factory):
+        metric = self._metrics.get(name)
+        if metric is None:
+            with self._lock:
+                metric = self._metrics.get(name)
+                if metric is None:
+                    metric = factory()
+                    self._metrics[name] = metric
+        return metric
+    
+    def render_prometheus(self) -> str:
+        """Текстовый формат Prometheus"""
+        lines = []
+        with self._lock:
+            metrics = list(self._metrics.values())
+        for metric in metrics:
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            if isinstance(metric, Counter):
+                lines.append(f"# TYPE {metric.name} counter")
+                lines.append(f"{metric.name} {metric.value}")
+            elif isinstance(metric, Gauge):
+                lines.append(f"# TYPE {metric.name} gauge")
+                lines.append(f"{metric.name} {metric.value}")
+            elif isinstance(metric, Histogram):
+                lines.append(f"# TYPE {metric.name} histogram")
+                with metric._lock:
+                    counts = list(metric.counts)
+                    total, count = metric.sum, metric.count
+                cumulative = 0
+                for bound, bucket_count in zip(metric.buckets, counts):
+                    cumulative += bucket_count
+                    lines.append(f'{metric.name}_bucket{{le="{bound}"}} {cumulative}')
+                lines.append(f'{metric.name}_bucket{{le="+Inf"}} {count}')
+                lines.append(f"{metric.name}_sum {total}")
+                lines.append(f"{metric.name}_count {count}")
+        return "\n".join(lines) + "\n"
+
+
+# Общий реестр приложения
+REGISTRY = Registry()
+
+# === Метрики конвейера ===
+
+MEDIA_READ = REGISTRY.histogram("media_read_seconds", "Чтение трека из медиа-сессии")
+SESSION_LOOKUP = REGISTRY.histogram("session_lookup_seconds", "Поиск сессии Yandex Music")
+YANDEX_SEARCH = REGISTRY.histogram("yandex_search_seconds", "Поиск трека в Yandex Music API")
+COVER_CACHE = REGISTRY.histogram("cover_cache_seconds", "Получение обложки через кэш")
+DISCORD_CONNECT = REGISTRY.histogram("discord_connect_seconds", "Подключение к Discord")
+DISCORD_UPDATE = REGISTRY.histogram("discord_update_seconds", "Отправка статуса в Discord")
+
+COVER_CACHE_HITS = REGISTRY.counter("cover_cache_hits_total", "Попадания в кэш обложек")
+COVER_CACHE_MISSES = REGISTRY.counter("cover_cache_misses_total", "Промахи кэша обложек")
+DISCORD_RECONNECTS = REGISTRY.counter("discord_reconnects_total", "Переподключения к Discord")
+COALESCED_UPDATES = REGISTRY.counter("coalesced_updates_total", "Обновления, вытесненные более свежими")
+ERRORS = REGISTRY.counter("errors_total", "Ошибки в конвейере")
+
+
+def snapshot_text() -> str:
+    """Короткая сводка для меню трея"""
+    lookups = COVER_CACHE_HITS.value + COVER_CACHE_MISSES.value
+    hit_rate = f"{COVER_CACHE_HITS.value * 100 // lookups}%" if lookups else "—"
+    return (
+        f"⏱ медиа {MEDIA_READ.average * 1000:.0f} мс · "
+        f"Discord {DISCORD_UPDATE.average * 1000:.0f} мс · "
+        f"кэш {hit_rate} · ошибок {ERRORS.value}"
+    )
+
+
+def process_rss_bytes() -> int:
+    """Резидентная память процесса (байты), 0 если узнать не удалось"""
+    try:
+        if sys.platform == "win32":
+            import ctypes
+            from ctypes import wintypes
+            
+            class PROCESS_MEMORY_COUNTERS(ctypes.Structure):
+                _fields_ = [
+                    ("cb", wintypes.DWORD),
+                    ("PageFaultCount", wintypes.DWORD),
+                    ("PeakWorkingSetSize", ctypes.c_size_t),
+                    ("WorkingSetSize", ctypes.c_size_t),
+                    ("QuotaPeakPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaPeakNonPagedPoolUsage", ctypes.c_size_t),
+                    ("QuotaNonPagedPoolUsage", ctypes.c_size_t),
+                    ("PagefileUsage", ctypes.c_size_t),
+                    ("PeakPagefileUsage", ctypes.c_size_t),
+                ]
+            
+            counters = PROCESS_MEMORY_COUNTERS()
+            counters.cb = ctypes.sizeof(counters)
+            handle = ctypes.windll.kernel32.GetCurrentProcess()
+            if ctypes.windll.psapi.GetProcessMemoryInfo(handle, ctypes.byref(counters), counters.cb):
+                return counters.WorkingSetSize
+            return 0
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except Exception:
+        return 0
+
+
+# === HTTP /metrics ===
+
+_server = None
+
+
+def start_http_server(port: int, host: str = "127.0.0.1") -> bool:
+    """
+    Запустить HTTP-сервер с /metrics на localhost (в daemon-потоке).
+    
+    Returns:
+        True если сервер запущен
+    """
+    global _server
+    if _server is not None or not port:
+        return _server is not None
+    
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = REGISTRY.render_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+        
+        def log_message(self, format, *args):
+            pass  # Без вывода на каждый запрос
+    
+    try:
+        _server = ThreadingHTTPServer((host, port), MetricsHandler)
+    except OSError as e:
+        log.error("metrics.http", "Не удалось запустить сервер метрик", port=port, error=str(e))
+        return False
+    _server.daemon_threads = True
+    threading.Thread(target=_server.serve_forever, name="metrics-http", daemon=True).start()
+    log.info("metrics.http", f"Метрики: http://{host}:{port}/metrics")
+    return True
+
+
+def stop_http_server():
+    """Остановить HTTP-сервер метрик"""
+    global _server
+    if _server is not None:
+        _server.shutdown()
+        _server.server_close()
+        _server = None
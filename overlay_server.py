@@ -0,0 +1,444 @@
+"""
+Локальный сервер для оверлеев стрима (OBS browser source, дашборды)
+HTTP: / — готовый оверлей, /now-playing.json — текущее состояние,
+/ws — WebSocket, по которому приходят изменения трека, обложки и таймлайна,
+/cover.jpg — обложка текущего трека из локального хранилища (cover_store).
+
+Каждое изменение сериализуется в кадр один раз, и один и тот же кадр
+уходит всем клиентам. У клиента одна ячейка «последний кадр»:
+медленный клиент пропускает промежуточные состояния, а не копит очередь
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import struct
+import threading
+import time
+from typing import Iterable, Optional, Set
+
+from media_session import TrackInfo
+from metrics import REGISTRY
+from logger import get_logger
+
+log = get_logger("overlay")
+
+OVERLAY_HOST = "127.0.0.1"
+# Имена, по которым к серверу обращаются браузер и OBS. Другой Host — чужая
+# страница через DNS rebinding: такие запросы отклоняем
+LOCAL_HOSTNAMES = ("127.0.0.1", "localhost")
+
+WS_GUID = "258EAFA5-E914-47DA-95CA-C5AB0DC85B11"
+# Сдвиг таймлайна меньше этого (с) не считаем изменением — это просто ход времени
+TIMELINE_TOLERANCE = 2.0
+# Ограничения на входящие данные от клиентов
+MAX_REQUEST_BYTES = 8192
+MAX_CLIENT_FRAME = 65536
+HANDSHAKE_TIMEOUT = 5.0
+# Размер обложки из хранилища (есть среди заранее готовящихся вариантов) и сколько её ждать (с)
+COVER_SIZE = (200, 200)
+COVER_TIMEOUT = 15.0
+
+OVERLAY_FRAMES = REGISTRY.counter("overlay_frames_total", "Кадров, сериализованных для оверлея")
+OVERLAY_SKIPPED = REGISTRY.counter("overlay_frames_skipped_total",
+                                   "Кадров, пропущенных медленными клиентами оверлея")
+
+OVERLAY_HTML = """<!DOCTYPE html>
+<html><head><meta charset="utf-8"><title>Yandex Music — сейчас играет</title>
+<style>
+body { margin: 0; background: transparent; font-family: sans-serif; color: #fff; }
+#card { display: none; align-items: center; gap: 12px; padding: 10px; width: 420px;
+        background: rgba(0, 0, 0, .6); border-radius: 10px; }
+#cover { width: 72px; height: 72px; border-radius: 6px; object-fit: cover; }
+#title { font-weight: bold; } #artist { opacity: .8; }
+#bar { height: 4px; margin-top: 6px; background: rgba(255, 255, 255, .25); }
+#progress { height: 100%; width: 0; background: #fc3; }
+</style></head><body>
+<div id="card"><img id="cover"><div style="flex:1">
+<div id="title"></div><div id="artist"></div><div id="bar"><div id="progress"></div></div></div></div>
+<script>
+let state = null;
+function render() {
+  const card = document.getElementById("card");
+  if (!state || !state.track) { card.style.display = "none"; return; }
+  const t = state.track;
+  card.style.display = "flex";
+  document.getElementById("title").textContent = t.title;
+  document.getElementById("artist").textContent = t.playing ? t.artist : t.artist + " • пауза";
+  document.getElementById("cover").src = t.cover || "";
+  const position = t.playing ? Date.now() / 1000 - t.started_at : t.position;
+  document.getElementById("progress").style.width =
+    t.duration ? Math.min(100, position * 100 / t.duration) + "%" : "0";
+}
+function connect() {
+  const ws = new WebSocket("ws://" + location.host + "/ws");
+  ws.onmessage = (e) => { state = JSON.parse(e.data); render(); };
+  ws.onclose = () => setTimeout(connect, 2000);
+}
+setInterval(render, 1000);
+connect();
+</script></body></html>
+"""
+
+
+def encode_frame(payload: bytes, opcode: int = 0x1) -> bytes:
+    """Кадр WebSocket от сервера (без маски, FIN=1)"""
+    length = len(payload)
+    if length < 126:
+        header = struct.pack("!BB", 0x80 | opcode, length)
+    elif length < 65536:
+        header = struct.pack("!BBH", 0x80 | opcode, 126, length)
+    else:
+        header = struct.pack("!BBQ", 0x80 | opcode, 127, length)
+    return header + payload
+
+
+def build_state(track: Optional[TrackInfo], cover_url: Optional[str], now: float) -> dict:
+    """Состояние для клиентов: то же, что уходит в Discord"""
+    if track is None:
+        return {"type": "now_playing", "track": None, "updated_at": now}
+    return {
+        "type": "now_playing",
+        "track": {
+            "title": track.title,
+            "artist": track.artist,
+            "album": track.album,
+            "cover": cover_url,
+            "playing": track.is_playing,
+            "duration": track.duration,
+            "position": track.position,
+            # Клиент сам двигает таймлайн от started_at, пока трек играет
+            "started_at": round(now - track.position, 3),
+        },
+        "updated_at": now,
+    }
+
+
+class _Client:
+    """Подписчик: одна ячейка с последним кадром вместо очереди"""
+    
+    __slots__ = ("writer", "pending", "ready", "sent")
+    
+    def __init__(self, writer: asyncio.StreamWriter):
+        self.writer = writer
+        self.pending: Optional[bytes] = None
+        self.ready = asyncio.Event()
+        self.sent = 0
+    
+    def offer(self, frame: bytes):
+        """Положить кадр; неотправленный предыдущий вытесняется"""
+        if self.pending is not None:
+            OVERLAY_SKIPPED.inc()
+        self.pending = frame
+        self.ready.set()
+
+
+class OverlayServer:
+    """HTTP + WebSocket на localhost в собственном потоке с циклом событий"""
+    
+    def __init__(self, port: int, host: str = OVERLAY_HOST, allowed_origins: Iterable[str] = (),
+                 cover_store=None):
+        self.host = host
+        self.port = port
+        self.cover_store = cover_store
+        # (ключ трека, cover_uri) — из потока Yandex, меняется одним присваиванием
+        self._cover = (None, None)
+        # Страницы (кроме собственной), которым можно подключаться к /ws и читать
+        # /now-playing.json из браузера. OBS присылает Origin: null или не присылает вовсе
+        self.allowed_origins = {origin.rstrip("/") for origin in allowed_origins}
+        self.clients: Set[_Client] = set()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._thread: Optional[threading.Thread] = None
+        self._frame: Optional[bytes] = None
+        self._state_json = b'{"type": "now_playing", "track": null}'
+        self._last_key = None
+        self._last_started_at = 0.0
+        REGISTRY.gauge("overlay_clients", "Подключённых клиентов оверлея", lambda: len(self.clients))
+    
+    # === Запуск и остановка ===
+    
+    def start(self, timeout: float = 5.0) -> bool:
+        """Запустить сервер; False если порт занят"""
+        started = threading.Event()
+        error = []
+        
+        def run():
+            loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(loop)
+            self._loop = loop
+            try:
+                self._server = loop.run_until_complete(
+                    asyncio.start_server(self._handle, self.host, self.port)
+                )
+            except OSError as e:
+                error.append(e)
+                started.set()
+                loop.close()
+                return
+            self.port = self._server.sockets[0].getsockname()[1]
+            started.set()
+            loop.run_forever()
+            # Доотменяем соединения, чтобы цикл закрылся без висящих задач
+            tasks = asyncio.all_tasks(loop)
+            for task in tasks:
+                task.cancel()
+            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
+            loop.close()
+        
+        self._thread = threading.Thread(target=run, name="overlay", daemon=True)
+        self._thread.start()
+        started.wait(timeout)
+        if error:
+            log.error("overlay.start", "Не удалось запустить сервер оверлея", port=self.port, error=str(error[0]))
+            return False
+        log.info("overlay.start", f"Оверлей: http://{self.host}:{self.port}/")
+        return True
+    
+    def stop(self, timeout: float = 1.0):
+        """Закрыть соединения и остановить поток"""
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        
+        async def shutdown():
+            self._server.close()
+            for client in list(self.clients):
+                client.writer.close()
+            loop.stop()
+        
+        try:
+            asyncio.run_coroutine_threadsafe(shutdown(), loop)
+        except RuntimeError:
+            return
+        self._thread.join(timeout)
+    
+    # === Публикация ===
+    
+    def set_cover(self, track: TrackInfo, cover_uri: Optional[str]):
+        """Слушатель обложек конвейера: запомнить cover_uri трека для /cover.jpg"""
+        self._cover = (f"{track.artist}|{track.title}", cover_uri)
+    
+    def publish(self, track: Optional[TrackInfo], cover_url: Optional[str]):
+        """
+        Сообщить новое состояние (из любого потока).
+        Дешёвая проверка без сериализации, кадр строится только при изменении
+        """
+        now = time.time()
+        if track is None:
+            key = None
+        else:
+            cover_key, cover_uri = self._cover
+            if cover_url and cover_uri and cover_key == f"{track.artist}|{track.title}":
+                # Своя ссылка вместо CDN; параметр меняется вместе с обложкой, чтобы браузер её перечитал
+                version = hashlib.sha1(cover_uri.encode("utf-8")).hexdigest()[:12]
+                cover_url = f"http://{self.host}:{self.port}/cover.jpg?v={version}"
+            key = (track.title, track.artist, track.album, track.is_playing, track.duration, cover_url,
+                   None if track.is_playing else track.position)
+            started_at = now - track.position
+            if key == self._last_key and (not track.is_playing or
+                                          abs(started_at - self._last_started_at) < TIMELINE_TOLERANCE):
+                return
+            self._last_started_at = started_at
+        if key == self._last_key and key is None:
+            return
+        self._last_key = key
+        
+        payload = json.dumps(build_state(track, cover_url, now), ensure_ascii=False).encode("utf-8")
+        frame = encode_frame(payload)
+        OVERLAY_FRAMES.inc()
+        if self._loop is not None and not self._loop.is_closed():
+            try:
+                self._loop.call_soon_threadsafe(self._broadcast, payload, frame)
+            except RuntimeError:
+                pass
+    
+    def _broadcast(self, payload: bytes, frame: bytes):
+        """Раздать один и тот же кадр всем клиентам (в потоке сервера)"""
+        self._state_json = payload
+        self._frame = frame
+        for client in self.clients:
+            client.offer(frame)
+    
+    # === Соединения ===
+    
+    async def _handle(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            request = await asyncio.wait_for(reader.readuntil(b"\r\n\r\n"), HANDSHAKE_TIMEOUT)
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError, asyncio.TimeoutError, ConnectionError):
+            writer.close()
+            return
+        if len(request) > MAX_REQUEST_BYTES:
+            writer.close()
+            return
+        
+        lines = request.decode("latin-1").split("\r\n")
+        parts = lines[0].split(" ")
+        path = parts[1].split("?", 1)[0] if len(parts) > 1 else "/"
+        headers = {}
+        for line in lines[1:]:
+            name, _, value = line.partition(":")
+            headers[name.strip().lower()] = value.strip()
+        
+        origin = headers.get("origin")
+        try:
+            if not self._is_local_host(headers.get("host", "")):
+                log.warning("overlay.reject", "Запрос с чужим Host отклонён", host=headers.get("host"))
+                await self._respond(writer, 403, "text/plain; charset=utf-8", b"Forbidden")
+            elif path == "/ws" and headers.get("upgrade", "").lower() == "websocket":
+                if origin is None or self._is_allowed_origin(origin):
+                    await self._serve_websocket(reader, writer, headers)
+                else:
+                    log.warning("overlay.reject", "WebSocket с чужой страницы отклонён", origin=origin)
+                    await self._respond(writer, 403, "text/plain; charset=utf-8", b"Forbidden")
+            elif path == "/":
+                await self._respond(writer, 200, "text/html; charset=utf-8", OVERLAY_HTML.encode("utf-8"))
+            elif path == "/now-playing.json":
+                cors = origin if origin is not None and origin in self.allowed_origins else None
+                await self._respond(writer, 200, "application/json; charset=utf-8", self._state_json, cors)
+            elif path == "/cover.jpg":
+                await self._serve_cover(writer)
+            else:
+                await self._respond(writer, 404, "text/plain; charset=utf-8", b"Not found")
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Клиент ушёл
+        except asyncio.CancelledError:
+            pass  # Остановка сервера: соединение закрываем ниже, не шумим в лог
+        finally:
+            writer.close()
+    
+    def _is_local_host(self, host: str) -> bool:
+        return host.lower() in (f"{name}:{self.port}" for name in LOCAL_HOSTNAMES)
+    
+    def _is_allowed_origin(self, origin: str) -> bool:
+        """Origin: null (OBS, локальный файл), собственная страница или из настройки"""
+        if origin == "null" or origin in self.allowed_origins:
+            return True
+        return origin.lower() in (f"http://{name}:{self.port}" for name in LOCAL_HOSTNAMES)
+    
+    @staticmethod
+    async def _respond(writer: asyncio.StreamWriter, status: int, content_type: str, body: bytes,
+                       allow_origin: Optional[str] = None):
+        reason = {200: "OK", 403: "Forbidden", 404: "Not Found"}[status]
+        cors = f"Access-Control-Allow-Origin: {allow_origin}\r\nVary: Origin\r\n" if allow_origin else ""
+        writer.write(
+            f"HTTP/1.1 {status} {reason}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(body)}\r\nCache-Control: no-store\r\n"
+            f"{cors}Connection: close\r\n\r\n".encode("latin-1")
+        )
+        # Тело отдельно: mmap из хранилища обложек уходит в сокет без склейки с заголовком
+        writer.write(body)
+        await writer.drain()
+    
+    async def _serve_cover(self, writer: asyncio.StreamWriter):
+        """Обложка текущего трека из хранилища; пока она скачивается, запрос ждёт"""
+        _, cover_uri = self._cover
+        data = None
+        if self.cover_store is not None and cover_uri:
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, self.cover_store.read, cover_uri, COVER_SIZE, COVER_TIMEOUT
+            )
+        if data is None:
+            await self._respond(writer, 404, "text/plain; charset=utf-8", b"Not found")
+        else:
+            await self._respond(writer, 200, "image/jpeg", memoryview(data))
+    
+    async def _serve_websocket(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter, headers: dict):
+        key = headers.get("sec-websocket-key", "")
+        accept = base64.b64encode(hashlib.sha1((key + WS_GUID).encode("latin-1")).digest()).decode("latin-1")
+        writer.write(
+            "HTTP/1.1 101 Switching Protocols\r\nUpgrade: websocket\r\nConnection: Upgrade\r\n"
+            f"Sec-WebSocket-Accept: {accept}\r\n\r\n".encode("latin-1")
+        )
+        
+        client = _Client(writer)
+        if self._frame is not None:
+            client.offer(self._frame)
+        self.clients.add(client)
+        sender = asyncio.create_task(self._send_frames(client))
+        try:
+            await self._read_frames(reader, writer)
+        finally:
+            self.clients.discard(client)
+            sender.cancel()
+    
+    @staticmethod
+    async def _send_frames(client: _Client):
+        """Отправлять клиенту последний кадр; пока ждём drain, новые кадры вытесняют старые"""
+        try:
+            while True:
+                await client.ready.wait()
+                client.ready.clear()
+                frame, client.pending = client.pending, None
+                if frame is None:
+                    continue
+                client.writer.write(frame)
+                await client.writer.drain()
+                client.sent += 1
+        except (ConnectionError, asyncio.CancelledError):
+            pass
+    
+    @staticmethod
+    async def _read_frames(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        """Читать кадры клиента: отвечать на ping, закрываться по close"""
+        while True:
+            head = await reader.readexactly(2)
+            opcode = head[0] & 0x0F
+            length = head[1] & 0x7F
+            if length == 126:
+                length = struct.unpack("!H", await reader.readexactly(2))[0]
+            elif length == 127:
+                length = struct.unpack("!Q", await reader.readexactly(8))[0]
+            if length > MAX_CLIENT_FRAME:
+                return
+            mask = await reader.readexactly(4) if head[1] & 0x80 else b"\0\0\0\0"
+            data = bytes(b ^ mask[i % 4] for i, b in enumerate(await reader.readexactly(length)))
+            
+            if opcode == 0x8:
+                writer.write(encode_frame(data[:2], 0x8))
+                return
+            if opcode == 0x9:
+                writer.write(encode_frame(data, 0xA))
+
+
+# Синглтон для использования во всём приложении
+_server: Optional[OverlayServer] = None
+
+
+def start_overlay_server(port: int, host: str = OVERLAY_HOST, allowed_origins: Iterable[str] = (),
+                         cover_store=None) -> Optional[OverlayServer]:
+    """
+    Запустить сервер оверлея, если порт задан; None если выключен или не запустился.
+    С cover_store обложки отдаются с /cover.jpg (подключите set_cover к конвейеру)
+    """
+    global _server
+    if _server is None and port:
+        server = OverlayServer(port, host, allowed_origins, cover_store)
+        if server.start():
+            _server = server
+    return _server
+
+
+def stop_overlay_server():
+    """Остановить сервер оверлея"""
+    global _server
+    if _server is not None:
+        _server.stop()
+        _server = None
+
+
+if __name__ == "__main__":
+    # Тест модуля: сервер с меняющимся треком, открыть http://127.0.0.1:8765/ в браузере
+    server = start_overlay_server(8765)
+    if server:
+        index = 0
+        try:
+            while True:
+                server.publish(TrackInfo(title=f"Тестовый трек {index}", artist="Тестовый исполнитель",
+                                         is_playing=True, duration=30), None)
+                print(f"Трек {index}, клиентов: {len(server.clients)}")
+                index += 1
+                time.sleep(30)
+        except KeyboardInterrupt:
+            stop_overlay_server()
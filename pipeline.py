@@ -0,0 +1,747 @@
+"""
+Конвейер обновления статуса на одном asyncio-рантайме
+Чтение трека, поиск обложки, отправка в Discord и обновление интерфейса
+работают отдельными задачами и связаны ограниченными очередями
+"""
+
+import asyncio
+import sys
+import time
+from typing import Callable, Dict, List, Optional
+
+from media_session import TrackInfo
+from media_trace import SEEK_THRESHOLD
+from discord_rpc import DiscordRPC
+from presence_template import PRESENCE_SETTINGS, PresenceTemplates
+from yandex_api import cover_url as build_cover_url, get_yandex_api
+from settings import DISCORD_CLIENT_ID, load_settings
+from state import AppState, StateStore
+from scheduler import AdaptiveScheduler, is_workstation_locked
+from lifecycle import Component, DaemonThreadExecutor, Supervisor
+from metrics import COALESCED_UPDATES, REGISTRY
+from logger import get_logger
+
+log = get_logger("pipeline")
+
+# Как часто писать в лог статистику пробуждений (с)
+SCHEDULER_REPORT_INTERVAL = 600
+
+# Дедлайн остановки конвейера (с): отмена стадий + отключение от Discord
+SHUTDOWN_TIMEOUT = 0.4
+
+# Сколько стадия может работать без пульса, прежде чем watchdog её перезапустит (с)
+MEDIA_HEARTBEAT_TIMEOUT = 15
+COVERS_HEARTBEAT_TIMEOUT = 30
+DISCORD_HEARTBEAT_TIMEOUT = 20
+UI_HEARTBEAT_TIMEOUT = 10
+LYRICS_HEARTBEAT_TIMEOUT = 30
+
+# Строку текста меняем чуть позже её метки, чтобы не попасть на предыдущую
+LYRICS_LINE_MARGIN = 0.05
+
+# Настройки, которые конвейер применяет на лету (см. PresencePipeline.apply_setting)
+LIVE_SETTINGS = ("update_interval", "show_timestamp", "yandex_token", "lyrics_mode") + PRESENCE_SETTINGS
+
+
+def put_latest(queue: asyncio.Queue, item) -> bool:
+    """
+    Положить элемент в ограниченную очередь.
+    Если очередь заполнена, самые старые элементы выбрасываются —
+    медленная стадия всегда получает самое свежее состояние.
+    
+    Returns:
+        True, если какой-то элемент был вытеснен
+    """
+    dropped = False
+    while queue.full():
+        try:
+            queue.get_nowait()
+            dropped = True
+        except asyncio.QueueEmpty:
+            break
+    queue.put_nowait(item)
+    if dropped:
+        COALESCED_UPDATES.inc()
+    return dropped
+
+
+class PresencePipeline:
+    """Конвейер: медиа-сессия -> обложка -> Discord -> интерфейс"""
+    
+    def __init__(self, media_manager, discord, yandex_api,
+                 update_interval: float = 5, show_timestamp: bool = True,
+                 on_status_change: Optional[Callable[[], None]] = None,
+                 lyrics_mode: str = "off", snapshot_path: Optional[str] = None):
+        self.media_manager = media_manager
+        self.discord = discord
+        self.yandex_api = yandex_api
+        self.update_interval = update_interval
+        self.show_timestamp = show_timestamp
+        self.lyrics_mode = lyrics_mode
+        # Файл снимка для тёплого перезапуска (None — не сохранять)
+        self.snapshot_path = snapshot_path
+        self._on_status_change = on_status_change
+        
+        # Интервал опроса подстраивается под состояние воспроизведения;
+        # update_interval — интервал при обычном воспроизведении
+        self.scheduler = AdaptiveScheduler()
+        self._last_scheduler_report = time.monotonic()
+        
+        # Состояние для отображения: неизменяемый снимок, заменяется целиком
+        self.store = StateStore()
+        
+        # Время запуска и первой отправки статуса (time.perf_counter)
+        self.started_at: Optional[float] = None
+        self.first_presence_at: Optional[float] = None
+        # Шаги запуска -> мс от started_at: media, discord, yandex, cover, presence
+        self.startup_timings: Dict[str, int] = {}
+        
+        # (ключ трека, URL обложки) — меняется одним присваиванием, без гонок между потоками
+        self._last_cover = (None, None)
+        self._requested_cover_key = None
+        self._discord_retry_count = 0
+        # Идущее подключение к Discord: прогрев при запуске и стадия отправки ждут одно и то же
+        self._discord_connecting: Optional[asyncio.Future] = None
+        # Снимок прошлого запуска — до первого чтения трека, которое его подтвердит или отбросит
+        self._snapshot = None
+        
+        # Текст песни: (ключ трека, шкала LyricsTimeline) и (ключ трека, текущая строка)
+        self._lyrics_provider = None
+        self._lyrics = (None, None)
+        self.current_lyric = (None, None)
+        # Когда прочитан current_track (time.monotonic) — от него экстраполируется позиция
+        self._track_read_at = 0.0
+        # (ключ трека, позиция) последнего расчёта строки — позиция не откатывается назад
+        self._lyric_position = (None, 0.0)
+        
+        # Слушатели прочитанных треков (история прослушивания и т.п.);
+        # вызываются в цикле событий, поэтому должны только считать в памяти
+        self._track_listeners: List[Callable[[Optional[TrackInfo]], None]] = []
+        # Слушатели отправляемого статуса (трек и обложка — то же, что получает Discord)
+        self._presence_listeners: List[Callable[[Optional[TrackInfo], Optional[str]], None]] = []
+        # Слушатели найденных обложек: вызываются в потоке Yandex, могут читать диск и сеть
+        self._cover_listeners: List[Callable[[TrackInfo, Optional[str]], None]] = []
+        
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._stop_requested = False
+        self._stop_event: Optional[asyncio.Event] = None
+        self._wake_event: Optional[asyncio.Event] = None
+        self._ui_event: Optional[asyncio.Event] = None
+        self._lyrics_event: Optional[asyncio.Event] = None
+        self._cover_queue: Optional[asyncio.Queue] = None
+        self._publish_queue: Optional[asyncio.Queue] = None
+        
+        # Блокирующие библиотеки — каждая в своём daemon-потоке, чтобы не ждать друг друга
+        # и не держать процесс при выходе. pypresence не потокобезопасен,
+        # поэтому у Discord ровно один поток.
+        self._discord_executor: Optional[DaemonThreadExecutor] = None
+        self._yandex_executor: Optional[DaemonThreadExecutor] = None
+        self._ui_executor: Optional[DaemonThreadExecutor] = None
+        
+        # Стадии — компоненты под присмотром watchdog
+        self.supervisor = Supervisor()
+        self.supervisor.add("media", self._watch_media, MEDIA_HEARTBEAT_TIMEOUT)
+        self.supervisor.add("covers", self._resolve_covers, COVERS_HEARTBEAT_TIMEOUT,
+                            on_restart=self._restart_yandex_executor)
+        self.supervisor.add("discord", self._publish_discord, DISCORD_HEARTBEAT_TIMEOUT,
+                            on_restart=self._restart_discord_executor)
+        self.supervisor.add("ui", self._refresh_ui, UI_HEARTBEAT_TIMEOUT,
+                            on_restart=self._restart_ui_executor)
+        self.supervisor.add("lyrics", self._follow_lyrics, LYRICS_HEARTBEAT_TIMEOUT,
+                            on_restart=self._restart_yandex_executor)
+        
+        REGISTRY.gauge("wakeups_per_minute", "Пробуждений опроса за минуту",
+                       self.scheduler.wakeups_per_minute)
+        REGISTRY.gauge("state_version", "Версия состояния для отображения",
+                       lambda: self.store.version)
+        REGISTRY.gauge("component_restarts", "Перезапусков компонентов watchdog'ом",
+                       lambda: sum(c.restarts for c in self.supervisor.components.values()))
+    
+    # === Управление из других потоков ===
+    
+    def wake(self):
+        """Разбудить чтение трека досрочно (потокобезопасно)"""
+        if self._loop and self._wake_event:
+            self._loop.call_soon_threadsafe(self._wake_event.set)
+    
+    def stop(self):
+        """Остановить конвейер (потокобезопасно)"""
+        self._stop_requested = True
+        if self._loop and self._stop_event:
+            try:
+                self._loop.call_soon_threadsafe(self._stop_event.set)
+            except RuntimeError:
+                pass  # Цикл уже закрыт
+    
+    def apply_setting(self, key, value):
+        """Применить изменённую настройку на лету (вызывается из потока, сохранившего настройки)"""
+        if key == "update_interval":
+            self.update_interval = value
+        elif key == "show_timestamp":
+            self.show_timestamp = value
+            # Переотправляем статус с новым видом таймера
+            self.discord.invalidate()
+        elif key == "yandex_token":
+            # Пересоздаём только клиент Yandex, кэши обложек остаются
+            self.yandex_api.set_token(value if value else None)
+        elif key in PRESENCE_SETTINGS:
+            # Перекомпилируется только изменённый шаблон, статус переотправится
+            self.discord.set_template(key, value)
+        elif key == "lyrics_mode":
+            # Строка пересчитается после чтения трека, которое запустит wake()
+            self.lyrics_mode = value
+        
+        # Будим конвейер, чтобы изменения применились сразу
+        self.wake()
+    
+    def reload_settings(self):
+        """Перечитать настройки из файла (правка вручную, повторный запуск) и применить на лету"""
+        settings = load_settings()
+        for key in LIVE_SETTINGS:
+            self.apply_setting(key, settings.get(key))
+    
+    def add_track_listener(self, listener: Callable[[Optional[TrackInfo]], None]):
+        """Вызывать listener(track) после каждого чтения трека и listener(None) при остановке"""
+        self._track_listeners.append(listener)
+    
+    def add_presence_listener(self, listener: Callable[[Optional[TrackInfo], Optional[str]], None]):
+        """Вызывать listener(track, cover_url) для каждого статуса, даже если Discord не подключен"""
+        self._presence_listeners.append(listener)
+    
+    def add_cover_listener(self, listener: Callable[[TrackInfo, Optional[str]], None]):
+        """
+        Вызывать listener(track, cover_uri), когда для нового трека найдена обложка.
+        cover_uri — шаблон ссылки с %% вместо размера (None — не нашлась).
+        Вызывается в потоке Yandex, а не в цикле событий
+        """
+        self._cover_listeners.append(listener)
+    
+    # === Состояние для отображения (чтение из любого потока) ===
+    
+    @property
+    def state(self) -> AppState:
+        """Текущий согласованный снимок состояния"""
+        return self.store.state
+    
+    @property
+    def current_track(self) -> Optional[TrackInfo]:
+        return self.store.state.track
+    
+    @property
+    def discord_status(self) -> str:
+        return self.store.state.discord_status
+    
+    @property
+    def music_status(self) -> str:
+        return self.store.state.music_status
+    
+    @property
+    def error_message(self) -> Optional[str]:
+        return self.store.state.error_message
+    
+    def status_color(self) -> str:
+        """Цвет иконки по текущему состоянию"""
+        return self.store.state.status_color()
+    
+    # === Запуск ===
+    
+    async def run(self):
+        """Запустить все стадии и работать до вызова stop()"""
+        self._loop = asyncio.get_running_loop()
+        self.started_at = time.perf_counter()
+        self._restore_snapshot()
+        self._stop_event = asyncio.Event()
+        self._wake_event = asyncio.Event()
+        self._ui_event = asyncio.Event()
+        self._lyrics_event = asyncio.Event()
+        self._cover_queue = asyncio.Queue(maxsize=1)
+        self._publish_queue = asyncio.Queue(maxsize=1)
+        self._discord_executor = DaemonThreadExecutor("discord")
+        self._yandex_executor = DaemonThreadExecutor("yandex")
+        self._ui_executor = DaemonThreadExecutor("ui")
+        if self._stop_requested:
+            self._stop_event.set()
+        
+        self.supervisor.start()
+        self._warm_up()
+        try:
+            await self._stop_event.wait()
+        finally:
+            await self._shutdown()
+    
+    async def _shutdown(self):
+        """Остановить стадии и отключиться от Discord не дольше SHUTDOWN_TIMEOUT"""
+        deadline = time.monotonic() + SHUTDOWN_TIMEOUT
+        await self.supervisor.stop(timeout=SHUTDOWN_TIMEOUT / 4)
+        self._notify_track_listeners(None)
+        if self.current_track:
+            self._save_snapshot(self.current_track, self._cached_cover_url(self.current_track))
+        
+        # Отключаемся при выходе, чтобы в Discord не остался старый статус
+        try:
+            await asyncio.wait_for(
+                self._loop.run_in_executor(self._discord_executor, self.discord.disconnect),
+                max(0.0, deadline - time.monotonic())
+            )
+        except Exception:
+            pass
+        self._discord_executor.shutdown(wait=False)
+        self._yandex_executor.shutdown(wait=False)
+        self._ui_executor.shutdown(wait=False)
+    
+    def _restart_discord_executor(self):
+        """Заменить поток Discord: зависший вызов остаётся в старом daemon-потоке"""
+        self._discord_executor.shutdown(wait=False)
+        self._discord_executor = DaemonThreadExecutor("discord")
+        self.discord.connected = False
+        self._discord_connecting = None
+        self.store.update(discord_connected=False)
+    
+    def _restart_yandex_executor(self):
+        """Заменить поток Yandex: зависший поиск остаётся в старом daemon-потоке"""
+        self._yandex_executor.shutdown(wait=False)
+        self._yandex_executor = DaemonThreadExecutor("yandex")
+        self._requested_cover_key = None
+    
+    def _restart_ui_executor(self):
+        """Заменить поток интерфейса"""
+        self._ui_executor.shutdown(wait=False)
+        self._ui_executor = DaemonThreadExecutor("ui")
+    
+    # === Параллельный запуск ===
+    
+    def _warm_up(self):
+        """
+        Подключение к Discord и создание клиента Yandex Music — одновременно
+        с первым чтением медиа-сессии (стадия media уже запущена), а не по очереди.
+        Первый статус ждёт только трек и Discord, обложка догоняет его
+        """
+        self._start_discord_connect()
+        self._loop.run_in_executor(self._yandex_executor, self._warm_up_yandex)
+    
+    def _warm_up_yandex(self):
+        """Создать клиент Yandex Music заранее (блокирующий вызов)"""
+        try:
+            self.yandex_api.warm_up()
+        except Exception as e:
+            log.warning("pipeline.warm_up", "Не удалось подготовить Yandex Music", error=str(e))
+            return
+        self._mark_startup("yandex")
+    
+    def _mark_startup(self, step: str):
+        """Запомнить, когда впервые завершился шаг запуска (потокобезопасно: одно присваивание)"""
+        if self.started_at is not None and step not in self.startup_timings:
+            self.startup_timings[step] = round((time.perf_counter() - self.started_at) * 1000)
+    
+    def _log_startup(self):
+        """Разбивка критического пути: первый статус ждал последнего из media и discord"""
+        timings = self.startup_timings
+        waited_for = max(("media", "discord"), key=lambda step: timings.get(step, 0))
+        log.info("pipeline.startup", "Разбивка запуска (мс от старта)",
+                 critical=waited_for, **timings)
+    
+    def _start_discord_connect(self) -> asyncio.Future:
+        """Начать подключение к Discord или вернуть уже идущее"""
+        if self._discord_connecting is None:
+            self._discord_retry_count += 1
+            self.store.update(discord_status=f"Подключение... (попытка {self._discord_retry_count})")
+            self._notify_ui()
+            future = self._loop.run_in_executor(self._discord_executor, self.discord.connect)
+            future.add_done_callback(self._on_discord_connect)
+            self._discord_connecting = future
+        return self._discord_connecting
+    
+    def _on_discord_connect(self, future: asyncio.Future):
+        if future is not self._discord_connecting:
+            return  # Поток Discord уже заменён watchdog'ом
+        self._discord_connecting = None
+        connected = not future.cancelled() and future.exception() is None and future.result()
+        if connected:
+            self.store.update(discord_connected=True, discord_status="✓ Подключен", error_message=None)
+            self._discord_retry_count = 0
+            # После переподключения Discord статуса не помнит — отправляем заново,
+            # не дожидаясь смены трека или таймера
+            self.discord.invalidate()
+            self._mark_startup("discord")
+        else:
+            self.store.update(discord_connected=False, discord_status="✗ Не подключен",
+                              error_message="Discord не запущен или недоступен")
+        self._notify_ui()
+    
+    async def _sleep(self, component: Component, timeout: float):
+        """Подождать timeout секунд; wake() и stop() прерывают ожидание"""
+        with component.idle():
+            try:
+                await asyncio.wait_for(self._wake_event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+        self._wake_event.clear()
+    
+    def _notify_ui(self):
+        """Пометить, что интерфейс нужно обновить"""
+        self._ui_event.set()
+    
+    def _notify_track_listeners(self, track: Optional[TrackInfo]):
+        for listener in self._track_listeners:
+            try:
+                listener(track)
+            except Exception as e:
+                log.error("pipeline.listener", "Ошибка слушателя трека", error=str(e))
+    
+    # === Стадии ===
+    
+    async def _watch_media(self, component: Component):
+        """Стадия 1: чтение текущего трека из медиа-сессии"""
+        while True:
+            component.beat()
+            
+            # Пока компьютер заблокирован — ничего не делаем
+            if is_workstation_locked():
+                self.store.update(music_status="Компьютер заблокирован")
+                self._notify_ui()
+                await self._sleep(component, self.scheduler.idle_interval)
+                continue
+            
+            now = time.monotonic()
+            self.scheduler.record_wakeup(now)
+            
+            try:
+                track = await self.media_manager.get_current_track()
+                self._track_read_at = time.monotonic()
+                
+                if track:
+                    music_status = f"✓ {track.artist} - {track.title}"[:40]
+                else:
+                    music_status = "Нет активного трека"
+                self._mark_startup("media")
+            except Exception as e:
+                track = None
+                music_status = f"✗ Ошибка: {str(e)[:20]}"
+            # Трек и строка статуса меняются одним снимком
+            self.store.update(track=track, music_status=music_status)
+            
+            if self._snapshot is not None:
+                log.info("pipeline.snapshot", "Снимок прошлого запуска",
+                         matched=self._snapshot.matches(track))
+                self._snapshot = None
+            
+            self._notify_track_listeners(track)
+            
+            # Обложку ищем только при смене трека
+            if track:
+                cover_key = self._cover_key(track)
+                if cover_key != self._requested_cover_key:
+                    self._requested_cover_key = cover_key
+                    put_latest(self._cover_queue, track)
+            
+            put_latest(self._publish_queue, track)
+            self._notify_ui()
+            # Позиция уточнилась (перемотка, пауза) — пересчитать строку текста
+            self._lyrics_event.set()
+            
+            self.scheduler.observe(track, now)
+            interval = self.scheduler.next_interval(track, self.discord.connected, self.update_interval, now)
+            self._report_scheduler(now)
+            await self._sleep(component, interval)
+    
+    async def _resolve_covers(self, component: Component):
+        """Стадия 2: поиск обложки в Yandex Music (в отдельном потоке)"""
+        while True:
+            with component.idle():
+                track = await self._cover_queue.get()
+            try:
+                await self._loop.run_in_executor(self._yandex_executor, self._get_cover_url, track)
+            except Exception:
+                continue
+            self._mark_startup("cover")
+            
+            # Переотправляем актуальный трек уже с обложкой
+            if self.current_track and self._cover_key(self.current_track) == self._last_cover[0]:
+                put_latest(self._publish_queue, self.current_track)
+    
+    async def _publish_discord(self, component: Component):
+        """Стадия 3: подключение к Discord и отправка статуса (в отдельном потоке)"""
+        while True:
+            with component.idle():
+                track = await self._publish_queue.get()
+            
+            cover_url = self._cached_cover_url(track) if track else None
+            lyric_key, lyric = self.current_lyric
+            if track is None or lyric_key != self._cover_key(track):
+                lyric = None
+            for listener in self._presence_listeners:
+                try:
+                    listener(track, cover_url)
+                except Exception as e:
+                    log.error("pipeline.listener", "Ошибка слушателя статуса", error=str(e))
+            
+            if not self.discord.connected:
+                # Подключение могло начаться ещё при запуске — тогда просто дожидаемся его.
+                # shield: перезапуск стадии не отменяет общее подключение
+                if not await asyncio.shield(self._start_discord_connect()):
+                    continue
+            
+            # Лимит Discord: ждём свободного места, а за это время в очередь
+            # могла прийти более свежая строка — тогда отправим её, а не эту
+            delay = self.discord.rate_limit_delay()
+            if delay > 0:
+                with component.idle():
+                    await asyncio.sleep(delay)
+                if not self._publish_queue.empty():
+                    continue
+            
+            try:
+                await self._loop.run_in_executor(
+                    self._discord_executor,
+                    self.discord.update_presence,
+                    track, self.show_timestamp if track else False, cover_url,
+                    lyric, self.lyrics_mode
+                )
+                connected = self.discord.connected
+                self.store.update(discord_connected=connected,
+                                  discord_status="✓ Подключен" if connected else "✗ Не подключен")
+                if track and self.discord.connected and self.first_presence_at is None:
+                    self.first_presence_at = time.perf_counter()
+                    log.info("pipeline.first_presence", "Первый статус отправлен",
+                             ms=round((self.first_presence_at - self.started_at) * 1000))
+                    self._mark_startup("presence")
+                    self._log_startup()
+            except Exception:
+                self.discord.connected = False
+                self.store.update(discord_connected=False, discord_status="✗ Ошибка отправки")
+                self._discord_retry_count = 0
+            
+            self._notify_ui()
+    
+    async def _refresh_ui(self, component: Component):
+        """Стадия 4: обновление интерфейса после изменений"""
+        while True:
+            with component.idle():
+                await self._ui_event.wait()
+            self._ui_event.clear()
+            
+            state = self.store.state
+            if state.error_message and (state.discord_connected or state.track):
+                self.store.update(error_message=None)
+            
+            if self._on_status_change:
+                try:
+                    # API трея может подвиснуть — не держим им цикл событий
+                    await self._loop.run_in_executor(self._ui_executor, self._on_status_change)
+                except Exception as e:
+                    self.store.update(error_message=f"Ошибка: {str(e)[:30]}")
+    
+    async def _follow_lyrics(self, component: Component):
+        """Стадия 5: текущая строка текста песни (если включён lyrics_mode)"""
+        while True:
+            component.beat()
+            track = self.current_track
+            key, line, timeout = None, None, None
+            
+            if track and track.is_playing and self.lyrics_mode != "off":
+                key = self._cover_key(track)
+                timeline = await self._lyrics_timeline(track, key)
+                if timeline is not None:
+                    position = self._lyric_position_of(track, key)
+                    line = timeline.line_at(position)
+                    next_change = timeline.next_change(position)
+                    if next_change is not None:
+                        timeout = next_change - position + LYRICS_LINE_MARGIN
+            
+            if (key, line) != self.current_lyric:
+                self.current_lyric = (key, line)
+                if track:
+                    put_latest(self._publish_queue, track)
+            
+            # Спим до следующей строки или до нового чтения трека
+            with component.idle():
+                try:
+                    await asyncio.wait_for(self._lyrics_event.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+            self._lyrics_event.clear()
+    
+    def _lyric_position_of(self, track: TrackInfo, key: str) -> float:
+        """
+        Позиция для строки текста. Медиа-сессия отдаёт целые секунды, поэтому
+        каждое чтение сдвигает экстраполированную позицию назад до 1 с — без
+        защиты строка на границе мигала бы на предыдущую и съедала лимит Discord.
+        Назад позиция идёт только при перемотке (больше SEEK_THRESHOLD)
+        """
+        position = track.position + (time.monotonic() - self._track_read_at)
+        last_key, last_position = self._lyric_position
+        if last_key == key and 0 < last_position - position <= SEEK_THRESHOLD:
+            position = last_position
+        self._lyric_position = (key, position)
+        return position
+    
+    async def _lyrics_timeline(self, track: TrackInfo, key: str):
+        """Шкала текста для трека (загружается один раз на трек в потоке Yandex)"""
+        if self._lyrics[0] == key:
+            return self._lyrics[1]
+        if self._lyrics_provider is None:
+            from lyrics import LyricsProvider
+            self._lyrics_provider = LyricsProvider(self.yandex_api)
+        provider = self._lyrics_provider
+        
+        try:
+            timeline = await self._loop.run_in_executor(
+                self._yandex_executor, provider.timeline, track.title, track.artist
+            )
+        except Exception:
+            timeline = None
+        self._lyrics = (key, timeline)
+        # Текст следующего трека в очереди загрузим, пока играет этот
+        self._yandex_executor.submit(provider.prefetch_next, track.title, track.artist)
+        return timeline
+    
+    # === Снимок для тёплого перезапуска ===
+    
+    def _restore_snapshot(self):
+        """
+        Подставить обложку из снимка прошлого запуска. Она привязана к ключу трека,
+        поэтому используется, только если в медиа-сессии играет тот же трек —
+        тогда первый статус уходит сразу с обложкой, без поиска в Yandex Music
+        """
+        if not self.snapshot_path:
+            return
+        from snapshot import load_snapshot
+        snapshot = load_snapshot(self.snapshot_path)
+        if snapshot is None:
+            return
+        self._snapshot = snapshot
+        if snapshot.cover_url:
+            cover_key = self._cover_key(snapshot.track)
+            self._last_cover = (cover_key, snapshot.cover_url)
+            self._requested_cover_key = cover_key
+    
+    def _save_snapshot(self, track: TrackInfo, cover_url: Optional[str]):
+        """Сохранить трек и обложку (блокирующий вызов, маленький файл)"""
+        if self.snapshot_path:
+            from snapshot import save_snapshot
+            save_snapshot(self.snapshot_path, track, cover_url)
+    
+    def _report_scheduler(self, now: float):
+        """Периодически писать в лог, сколько пробуждений сэкономлено"""
+        if now - self._last_scheduler_report < SCHEDULER_REPORT_INTERVAL:
+            return
+        self._last_scheduler_report = now
+        stats = self.scheduler.stats()
+        log.info("scheduler.stats", "Статистика опроса", **stats)
+    
+    # === Обложки ===
+    
+    @staticmethod
+    def _cover_key(track: TrackInfo) -> str:
+        return f"{track.artist}|{track.title}"
+    
+    def _cached_cover_url(self, track: TrackInfo) -> Optional[str]:
+        """Обложка, если она уже найдена для этого трека"""
+        cover_key, cover_url = self._last_cover
+        if self._cover_key(track) == cover_key:
+            return cover_url
+        return None
+    
+    def _get_cover_url(self, track: TrackInfo) -> Optional[str]:
+        """Получить URL обложки для трека (блокирующий вызов)"""
+        cover_key = self._cover_key(track)
+        
+        if cover_key == self._last_cover[0]:
+            return self._last_cover[1]
+        
+        try:
+            cover_uri = self.yandex_api.get_cover_uri(track.title, track.artist)
+        except Exception:
+            cover_uri = None
+        cover_url = build_cover_url(cover_uri) if cover_uri else None
+        self._last_cover = (cover_key, cover_url)
+        for listener in self._cover_listeners:
+            try:
+                listener(track, cover_uri)
+            except Exception as e:
+                log.error("pipeline.listener", "Ошибка слушателя обложки", error=str(e))
+        # Трек сменился — обновляем снимок (мы уже в потоке Yandex, цикл не ждёт диска)
+        self._save_snapshot(track, cover_url)
+        return cover_url
+
+
+def create_pipeline(on_status_change: Optional[Callable[[], None]] = None) -> PresencePipeline:
+    """Собрать конвейер из настроек пользователя"""
+    from backends import create_track_source
+    from snapshot import SNAPSHOT_FILE
+    
+    settings = load_settings()
+    token = settings.get("yandex_token", "")
+    # Источник трека по платформе: медиа-сессия Windows или трек в памяти.
+    # В режиме media_worker он работает в отдельном процессе под присмотром
+    source_name = settings.get("track_source") or None
+    if settings.get("media_worker"):
+        from media_worker import get_media_worker
+        media = get_media_worker(source_name)
+    else:
+        media = create_track_source(source_name)
+    discord = DiscordRPC(DISCORD_CLIENT_ID)
+    discord.templates = PresenceTemplates.from_settings(settings)
+    pipeline = PresencePipeline(
+        media,
+        discord,
+        get_yandex_api(token if token else None),
+        update_interval=settings.get("update_interval", 5),
+        show_timestamp=settings.get("show_timestamp", True),
+        on_status_change=on_status_change,
+        lyrics_mode=settings.get("lyrics_mode", "off"),
+        snapshot_path=SNAPSHOT_FILE
+    )
+    
+    if settings.get("history_enabled", True):
+        # История подключается только если включена: sqlite3 не грузим зря
+        from history import PlayTracker, get_history
+        pipeline.add_track_listener(PlayTracker(get_history().record).observe)
+    
+    if settings.get("scrobble_enabled"):
+        from history import PlayTracker
+        from scrobbler import get_scrobbler
+        scrobbler = get_scrobbler()
+        if scrobbler is not None:
+            pipeline.add_track_listener(PlayTracker(scrobbler.submit).observe)
+    
+    cover_store = None
+    if settings.get("cover_store_enabled"):
+        from cover_store import CoverPrefetcher, get_cover_store
+        cover_store = get_cover_store()
+        pipeline.add_cover_listener(CoverPrefetcher(cover_store))
+    
+    if settings.get("overlay_port"):
+        from overlay_server import start_overlay_server
+        overlay = start_overlay_server(settings["overlay_port"],
+                                       allowed_origins=settings.get("overlay_allowed_origins") or (),
+                                       cover_store=cover_store)
+        if overlay is not None:
+            pipeline.add_presence_listener(overlay.publish)
+            if cover_store is not None:
+                # Обложка для оверлея отдаётся из хранилища, а не скачивается клиентом заново
+                pipeline.add_cover_listener(overlay.set_cover)
+    
+    return pipeline
+
+
+# Сервисы, которые create_pipeline подключает по настройкам: модуль -> функция остановки
+_SERVICES = (
+    ("history", "close_history"),
+    ("scrobbler", "close_scrobbler"),
+    ("overlay_server", "stop_overlay_server"),
+    ("cover_store", "close_cover_store"),
+    ("profiler", "stop_profiling"),
+    ("media_worker", "close_media_worker"),
+)
+
+
+def close_services():
+    """Остановить подключённые сервисы при выходе (незагруженные модули не импортируются)"""
+    for module_name, function_name in _SERVICES:
+        module = sys.modules.get(module_name)
+        if module is not None:
+            try:
+                getattr(module, function_name)()
+            except Exception as e:
+                log.error("pipeline.services", "Ошибка остановки сервиса", service=module_name, error=str(e))
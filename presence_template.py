@@ -0,0 +1,248 @@
+"""
+Шаблоны статуса Discord
+Строки вида "{artist} — {title}" разбираются один раз и компилируются
+в список кусков; на каждом обновлении остаётся только склеить значения
+"""
+
+import unicodedata
+from functools import lru_cache
+from string import Formatter
+from typing import Dict, List, Optional, Tuple
+
+from media_session import TrackInfo
+from settings import DEFAULT_SETTINGS
+from logger import get_logger
+
+log = get_logger("template")
+
+# Discord обрезает (а иногда и отвергает) строки статуса длиннее 128 символов
+DISCORD_TEXT_LIMIT = 128
+# Подпись кнопки — не длиннее 32 символов, кнопок не больше двух
+BUTTON_LABEL_LIMIT = 32
+MAX_BUTTONS = 2
+ELLIPSIS = "…"
+
+# Поля, доступные в шаблонах
+FIELDS = ("title", "artist", "album", "status", "position", "duration", "progress")
+
+# Настройка -> поле статуса Discord. state_paused заменяет state на паузе
+TEMPLATE_SETTINGS = {
+    "presence_details": "details",
+    "presence_state": "state",
+    "presence_state_paused": "state_paused",
+    "presence_large_text": "large_text",
+    "presence_small_text": "small_text",
+}
+
+# Все настройки вида статуса (применяются на лету)
+PRESENCE_SETTINGS = tuple(TEMPLATE_SETTINGS) + ("presence_buttons",)
+
+# Шаблоны по умолчанию — тот же статус, что был до появления настроек
+DEFAULT_TEMPLATES = {key: DEFAULT_SETTINGS[key] for key in TEMPLATE_SETTINGS}
+
+# Если шаблон дал пустую строку — подставляется это (None — поле не отправляется)
+FALLBACKS = {"large_text": "Yandex Music"}
+
+
+class CompiledTemplate:
+    """Разобранный шаблон: чередование готового текста и полей трека"""
+    
+    __slots__ = ("source", "parts", "fields")
+    
+    def __init__(self, source: str, parts: Tuple[Tuple[str, Optional[str], str], ...]):
+        self.source = source
+        # (текст перед полем, поле или None, формат поля)
+        self.parts = parts
+        self.fields = frozenset(field for _, field, _ in parts if field)
+    
+    def render(self, values: Dict[str, str]) -> str:
+        chunks = []
+        for literal, field, spec in self.parts:
+            chunks.append(literal)
+            if field is not None:
+                value = values.get(field, "")
+                chunks.append(format(value, spec) if spec else value)
+        return "".join(chunks)
+
+
+@lru_cache(maxsize=64)
+def compile_template(source: str) -> CompiledTemplate:
+    """
+    Разобрать шаблон (результат кэшируется по строке шаблона).
+    
+    Raises:
+        ValueError: Синтаксическая ошибка, неизвестное поле или неверный формат
+    """
+    parts = []
+    for literal, field, spec, conversion in Formatter().parse(source):
+        if field is not None and field not in FIELDS:
+            raise ValueError(f"неизвестное поле {{{field}}}, доступны: {', '.join(FIELDS)}")
+        if conversion:
+            raise ValueError(f"преобразования вида !{conversion} не поддерживаются")
+        if spec:
+            # Все поля — строки: формат проверяем сразу, а не на каждом обновлении статуса
+            if "{" in spec:
+                raise ValueError(f"вложенные поля в формате :{spec} не поддерживаются")
+            format("", spec)
+        parts.append((literal, field, spec or ""))
+    return CompiledTemplate(source, tuple(parts))
+
+
+# === Обрезка по графемам ===
+
+def _is_extending(char: str) -> bool:
+    """Символ продолжает предыдущую графему (диакритика, ZWJ, селектор, тон кожи)"""
+    code = ord(char)
+    return (
+        unicodedata.category(char) in ("Mn", "Me", "Mc")
+        or code == 0x200D
+        or 0xFE00 <= code <= 0xFE0F
+        or 0x1F3FB <= code <= 0x1F3FF
+        or 0xE0020 <= code <= 0xE007F  # теги флагов регионов
+    )
+
+
+def _is_regional_indicator(char: str) -> bool:
+    return 0x1F1E6 <= ord(char) <= 0x1F1FF
+
+
+def truncate(text: str, limit: int = DISCORD_TEXT_LIMIT) -> str:
+    """
+    Обрезать до limit символов с многоточием, не разрывая графемы:
+    буква с диакритикой, эмодзи с ZWJ и тоном кожи, флаг остаются целыми
+    """
+    if len(text) <= limit:
+        return text
+    cut = limit - len(ELLIPSIS)
+    # Отступаем, пока разрез приходится внутрь графемы
+    while cut > 0 and (_is_extending(text[cut]) or text[cut - 1] == "\u200d"):
+        cut -= 1
+    # Флаг — пара региональных индикаторов: считаем, сколько их подряд до разреза
+    if cut > 0 and _is_regional_indicator(text[cut]):
+        run = 0
+        while cut - run > 0 and _is_regional_indicator(text[cut - run - 1]):
+            run += 1
+        if run % 2:
+            cut -= 1
+    return text[:cut].rstrip() + ELLIPSIS
+
+
+def _clock(seconds: int) -> str:
+    minutes, seconds = divmod(max(0, int(seconds)), 60)
+    if minutes >= 60:
+        return f"{minutes // 60}:{minutes % 60:02d}:{seconds:02d}"
+    return f"{minutes}:{seconds:02d}"
+
+
+def track_values(track: TrackInfo) -> Dict[str, str]:
+    """Значения полей шаблона для трека"""
+    position = _clock(track.position)
+    duration = _clock(track.duration) if track.duration > 0 else ""
+    return {
+        "title": track.title,
+        "artist": track.artist,
+        "album": track.album,
+        "status": "Играет" if track.is_playing else "На паузе",
+        "position": position,
+        "duration": duration,
+        "progress": f"{position} / {duration}" if duration else position,
+    }
+
+
+def parse_buttons(buttons) -> List[dict]:
+    """Проверить кнопки из настроек: не больше двух, подпись и ссылка http(s)"""
+    result = []
+    for button in buttons or []:
+        if not isinstance(button, dict):
+            continue
+        label = str(button.get("label", "")).strip()
+        url = str(button.get("url", "")).strip()
+        if not label or not url.startswith(("https://", "http://")):
+            log.warning("template.buttons", "Кнопка пропущена", label=label, url=url)
+            continue
+        result.append({"label": truncate(label, BUTTON_LABEL_LIMIT), "url": url})
+        if len(result) == MAX_BUTTONS:
+            break
+    return result
+
+
+class PresenceTemplates:
+    """Набор скомпилированных шаблонов статуса и кнопки"""
+    
+    def __init__(self, templates: Optional[Dict[str, CompiledTemplate]] = None,
+                 buttons: Optional[List[dict]] = None):
+        self.templates = templates or {
+            key: compile_template(source) for key, source in DEFAULT_TEMPLATES.items()
+        }
+        if buttons is None:
+            buttons = parse_buttons(DEFAULT_SETTINGS["presence_buttons"])
+        self.buttons = buttons
+    
+    @classmethod
+    def from_settings(cls, settings: dict) -> "PresenceTemplates":
+        """Собрать из настроек (ошибочные шаблоны заменяются шаблонами по умолчанию)"""
+        templates = cls()
+        for key in TEMPLATE_SETTINGS:
+            templates = templates.with_setting(key, settings.get(key, DEFAULT_TEMPLATES[key]))
+        return templates.with_setting("presence_buttons", settings.get("presence_buttons"))
+    
+    def with_setting(self, key: str, value) -> "PresenceTemplates":
+        """Копия с изменённой настройкой; компилируется только она"""
+        if key == "presence_buttons":
+            return PresenceTemplates(self.templates, parse_buttons(value))
+        templates = dict(self.templates)
+        try:
+            templates[key] = compile_template(value if isinstance(value, str) else DEFAULT_TEMPLATES[key])
+        except ValueError as e:
+            log.warning("template.compile", "Ошибка в шаблоне, используется шаблон по умолчанию",
+                        setting=key, template=value, error=str(e))
+            templates[key] = compile_template(DEFAULT_TEMPLATES[key])
+        return PresenceTemplates(templates, self.buttons)
+    
+    def render(self, track: TrackInfo) -> Dict[str, Optional[str]]:
+        """Поля статуса: details, state, large_text, small_text (пустые — None)"""
+        values = track_values(track)
+        result = {}
+        for key, field in TEMPLATE_SETTINGS.items():
+            if field == "state_paused":
+                continue
+            if field == "state" and not track.is_playing:
+                key = "presence_state_paused"
+            text = self.templates[key].render(values).strip() or FALLBACKS.get(field)
+            result[field] = truncate(text) if text else None
+        return result
+
+
+if __name__ == "__main__":
+    # Тест модуля
+    import timeit
+    
+    track = TrackInfo(title="Тестовый трек", artist="Исполнитель", album="Альбом",
+                      is_playing=True, duration=215, position=83)
+    templates = PresenceTemplates.from_settings({
+        "presence_details": "{artist} — {title}",
+        "presence_state": "{progress}",
+        "presence_large_text": "{album}",
+        "presence_small_text": "{status}",
+        "presence_buttons": [{"label": "Слушать", "url": "https://music.yandex.ru"}],
+    })
+    print(templates.render(track))
+    print(f"Кнопки: {templates.buttons}")
+    
+    broken = templates.with_setting("presence_details", "{nope}")
+    print(f"Ошибочный шаблон заменён: {broken.templates['presence_details'].source!r}")
+    for source in ("{title:d}", "{title:{artist}}"):
+        broken = templates.with_setting("presence_details", source)
+        print(f"Неверный формат {source!r} заменён: {broken.templates['presence_details'].source!r}")
+    print(f"Строковый формат принят: {templates.with_setting('presence_details', '{title:.8}').render(track)['details']!r}")
+    
+    for text in ("й" * 200, "a" * 126 + "é" + "b" * 10, "x" * 125 + "\U0001F469\u200d\U0001F469\u200d\U0001F467" * 3, "y" * 124 + "🇷🇺🇷🇺"):
+        cut = truncate(text)
+        print(f"  {len(text)} -> {len(cut)}: ...{cut[-6:]!r}")
+    
+    number = 100000
+    render = timeit.timeit(lambda: templates.render(track), number=number)
+    compile_cold = timeit.timeit(lambda: compile_template.__wrapped__("{artist} — {title} ({progress})"),
+                                 number=number // 10)
+    print(f"Рендер статуса: {render / number * 1e6:.2f} мкс, "
+          f"разбор шаблона: {compile_cold / (number // 10) * 1e6:.2f} мкс")
@@ -0,0 +1,183 @@
+"""
+Сэмплирующий профилировщик по запросу
+Отдельный поток раз в SAMPLE_INTERVAL снимает стеки всех потоков
+(sys._current_frames) и считает одинаковые стеки. Результат — файл
+collapsed stacks ("поток;функция;функция N"), который понимают flamegraph.pl,
+speedscope и inferno. Пока профилирование выключено, не работает ничего
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from typing import Callable, Dict, Optional
+
+from settings import APPDATA_FOLDER
+from logger import get_logger
+
+log = get_logger("profiler")
+
+PROFILES_FOLDER = os.path.join(APPDATA_FOLDER, "profiles")
+
+# Длительность по умолчанию (с) и интервал между снимками стеков (с)
+PROFILE_SECONDS = 30
+SAMPLE_INTERVAL = 0.01
+
+
+class SamplingProfiler:
+    """Снимки стеков всех потоков, кроме собственного, в течение seconds"""
+    
+    def __init__(self, seconds: float = PROFILE_SECONDS, interval: float = SAMPLE_INTERVAL):
+        self.seconds = seconds
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._labels: Dict[object, str] = {}
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+    
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+    
+    def start(self, on_done: Optional[Callable[["SamplingProfiler"], None]] = None):
+        self._thread = threading.Thread(target=self._run, args=(on_done,), name="profiler", daemon=True)
+        self._thread.start()
+    
+    def stop(self, timeout: float = 1.0):
+        """Остановить досрочно и дождаться on_done"""
+        self._stop.set()
+        thread = self._thread
+        if thread is not None and thread is not threading.current_thread():
+            thread.join(timeout)
+    
+    def _label(self, code) -> str:
+        # Подпись кадра без номера строки: иначе одна функция дробится на много узлов
+        label = self._labels.get(code)
+        if label is None:
+            label = f"{code.co_name} ({os.path.basename(code.co_filename)})"
+            self._labels[code] = label
+        return label
+    
+    def sample(self):
+        """Один снимок стеков"""
+        own = threading.get_ident()
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for ident, frame in sys._current_frames().items():
+            if ident == own:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(self._label(frame.f_code))
+                frame = frame.f_back
+            stack.append(names.get(ident, f"thread-{ident}"))
+            stack.reverse()
+            self.stacks[";".join(stack)] += 1
+        self.samples += 1
+    
+    def _run(self, on_done):
+        deadline = time.monotonic() + self.seconds
+        while not self._stop.wait(self.interval):
+            self.sample()
+            if time.monotonic() >= deadline:
+                break
+        if on_done is not None:
+            on_done(self)
+    
+    def write(self, path: str):
+        """Записать collapsed stacks: по строке на стек, самые частые сверху"""
+        with open(path, "w", encoding="utf-8") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+# Идущее профилирование (одно на процесс)
+_active: Optional[SamplingProfiler] = None
+_active_lock = threading.Lock()
+
+
+def is_profiling() -> bool:
+    return _active is not None
+
+
+def start_profiling(seconds: float = PROFILE_SECONDS,
+                    on_done: Optional[Callable[[Optional[str]], None]] = None) -> bool:
+    """
+    Профилировать seconds секунд и записать файл в PROFILES_FOLDER.
+    on_done(path) вызывается из потока профилировщика (path=None — не записалось).
+    
+    Returns:
+        False, если профилирование уже идёт
+    """
+    global _active
+    with _active_lock:
+        if _active is not None:
+            return False
+        _active = SamplingProfiler(seconds)
+    
+    def finish(profiler: SamplingProfiler):
+        global _active
+        path = os.path.join(PROFILES_FOLDER, f"profile-{datetime.now():%Y%m%d-%H%M%S}.folded")
+        try:
+            os.makedirs(PROFILES_FOLDER, exist_ok=True)
+            profiler.write(path)
+            log.info("profiler.done", "Профиль записан", path=path, samples=profiler.samples,
+                     stacks=len(profiler.stacks))
+        except OSError as e:
+            log.error("profiler.write", "Не удалось записать профиль", error=str(e))
+            path = None
+        with _active_lock:
+            _active = None
+        if on_done is not None:
+            on_done(path)
+    
+    log.info("profiler.start", "Профилирование запущено", seconds=seconds)
+    _active.start(finish)
+    return True
+
+
+def stop_profiling():
+    """Завершить идущее профилирование досрочно (профиль записывается)"""
+    profiler = _active
+    if profiler is not None:
+        profiler.stop()
+
+
+if __name__ == "__main__":
+    # Тест модуля: нагрузка в двух потоках, профиль во временную папку
+    import tempfile
+    
+    def busy(stop: threading.Event):
+        while not stop.is_set():
+            sum(i * i for i in range(2000))
+    
+    def work_seconds(seconds: float) -> int:
+        """Сколько итераций успевает рабочий цикл за seconds"""
+        count, deadline = 0, time.perf_counter() + seconds
+        while time.perf_counter() < deadline:
+            sum(i * i for i in range(2000))
+            count += 1
+        return count
+    
+    stop = threading.Event()
+    worker = threading.Thread(target=busy, args=(stop,), name="worker", daemon=True)
+    worker.start()
+    
+    baseline = work_seconds(1.0)
+    with tempfile.TemporaryDirectory() as folder:
+        PROFILES_FOLDER = folder
+        done = threading.Event()
+        written = []
+        start_profiling(1.0, on_done=lambda path: (written.append(path), done.set()))
+        print(f"Повторный запуск отклонён: {not start_profiling(1.0)}")
+        profiled = work_seconds(1.0)
+        done.wait(2)
+        stop.set()
+        with open(written[0], encoding="utf-8") as f:
+            lines = f.read().splitlines()
+        print(f"Профиль: {os.path.basename(written[0])}, стеков {len(lines)}")
+        for line in lines[:3]:
+            print(f"  {line[-100:]}")
+    print(f"Замедление под профилировщиком: {(1 - profiled / baseline) * 100:.1f}%")
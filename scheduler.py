@@ -0,0 +1,154 @@
+"""
+Адаптивный интервал опроса медиа-сессии
+Часто — около конца трека и сразу после действий пользователя,
+редко — на паузе и когда Yandex Music закрыт
+"""
+
+import sys
+import time
+from collections import deque
+from typing import Optional
+
+from media_session import TrackInfo
+
+
+class AdaptiveScheduler:
+    """Выбирает, через сколько секунд снова опрашивать медиа-сессию"""
+    
+    def __init__(self, fast_interval: float = 1, paused_interval: float = 15,
+                 idle_interval: float = 30, action_window: float = 10,
+                 track_end_margin: float = 0.5, seek_threshold: float = 3):
+        """
+        Args:
+            fast_interval: Интервал сразу после действий пользователя
+            paused_interval: Интервал на паузе и пока Discord недоступен
+            idle_interval: Интервал, когда сессии Yandex Music нет
+            action_window: Сколько секунд после действия опрашивать часто
+            track_end_margin: Запас после предсказанного конца трека
+            seek_threshold: Расхождение позиции (с), которое считаем перемоткой
+        """
+        self.fast_interval = fast_interval
+        self.paused_interval = paused_interval
+        self.idle_interval = idle_interval
+        self.action_window = action_window
+        self.track_end_margin = track_end_margin
+        self.seek_threshold = seek_threshold
+        
+        self.mode = "idle"
+        self.current_interval = 0.0
+        self._last_state = None
+        self._last_position = None
+        self._last_observed_at = None
+        self._last_action_at = None
+        self._last_wakeup_wall = None
+        self._expected_interval = 0.0
+        self._wakeups: deque = deque()
+        self.wakeup_window = 60.0  # Окно статистики пробуждений (с)
+    
+    # === Наблюдение ===
+    
+    def record_wakeup(self, now: Optional[float] = None):
+        """Отметить пробуждение цикла (для статистики и детекта сна)"""
+        now = time.monotonic() if now is None else now
+        self._wakeups.append(now)
+        while self._wakeups and now - self._wakeups[0] > self.wakeup_window:
+            self._wakeups.popleft()
+        
+        # Если по настенным часам прошло намного больше ожидаемого — компьютер спал
+        wall = time.time()
+        if self._last_wakeup_wall is not None:
+            if wall - self._last_wakeup_wall > self._expected_interval + 30:
+                self._last_action_at = now
+        self._last_wakeup_wall = wall
+    
+    def observe(self, track: Optional[TrackInfo], now: Optional[float] = None):
+        """Учесть прочитанный трек: смена трека, пауза и перемотка — действия пользователя"""
+        now = time.monotonic() if now is None else now
+        state = (track.title, track.artist, track.is_playing) if track else None
+        
+        if state != self._last_state:
+            self._last_action_at = now
+        elif track and track.is_playing and self._last_position is not None:
+            expected = self._last_position + (now - self._last_observed_at)
+            if abs(track.position - expected) > self.seek_threshold:
+                self._last_action_at = now
+        
+        self._last_state = state
+        self._last_position = track.position if track else None
+        self._last_observed_at = now
+    
+    # === Решение ===
+    
+    def next_interval(self, track: Optional[TrackInfo], discord_connected: bool,
+                      base_interval: float, now: Optional[float] = None) -> float:
+        """
+        Через сколько секунд снова опрашивать.
+        
+        Args:
+            track: Последний прочитанный трек
+            discord_connected: Подключен ли Discord
+            base_interval: Обычный интервал при воспроизведении (настройка update_interval)
+        """
+        now = time.monotonic() if now is None else now
+        
+        if track is None:
+            self.mode = "idle"
+            interval = self.idle_interval
+        elif self._last_action_at is not None and now - self._last_action_at < self.action_window:
+            self.mode = "action"
+            interval = self.fast_interval
+        elif not discord_connected or not track.is_playing:
+            self.mode = "paused"
+            interval = max(self.paused_interval, base_interval)
+        else:
+            self.mode = "playing"
+            interval = base_interval
+            # Просыпаемся сразу после предсказанного конца трека
+            if track.duration > 0:
+                remaining = track.duration - track.position
+                if 0 <= remaining < interval:
+                    self.mode = "track_end"
+                    interval = remaining + self.track_end_margin
+        
+        interval = max(self.fast_interval, min(interval, self.idle_interval))
+        self.current_interval = interval
+        self._expected_interval = interval
+        return interval
+    
+    # === Статистика ===
+    
+    def wakeups_per_minute(self) -> float:
+        """Пробуждений за последнюю минуту"""
+        return len(self._wakeups) * 60 / self.wakeup_window
+    
+    def stats(self, fixed_interval: float = 5) -> dict:
+        """Статистика пробуждений в сравнении с фиксированным интервалом"""
+        wakeups = self.wakeups_per_minute()
+        fixed = 60 / fixed_interval
+        return {
+            "mode": self.mode,
+            "interval": round(self.current_interval, 2),
+            "wakeups_per_minute": wakeups,
+            "fixed_wakeups_per_minute": fixed,
+            "savings_percent": round((1 - wakeups / fixed) * 100, 1) if fixed else 0.0,
+        }
+
+
+def is_workstation_locked() -> bool:
+    """Заблокирован ли компьютер (Windows); на других ОС всегда False"""
+    if sys.platform != "win32":
+        return False
+    try:
+        import ctypes
+        user32 = ctypes.windll.user32
+        # Когда экран заблокирован, переключиться на входной рабочий стол нельзя
+        DESKTOP_SWITCHDESKTOP = 0x0100
+        desktop = user32.OpenInputDesktop(0, False, DESKTOP_SWITCHDESKTOP)
+        if not desktop:
+            return True
+        try:
+            return not user32.SwitchDesktop(desktop)
+        finally:
+            user32.CloseDesktop(desktop)
+    except Exception:
+        return False
@@ -0,0 +1,437 @@
+"""
+Скробблинг в Last.fm и совместимые сервисы (Libre.fm и т.п.)
+Прослушивания попадают в очередь на диске и отправляются пачками
+фоновым потоком с повторами — цикл опроса не ждёт сети,
+а без интернета ничего не теряется
+"""
+
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from typing import Dict, List, Optional, Tuple
+
+from history import Play
+from settings import APPDATA_FOLDER, ensure_appdata_folder, load_settings, subscribe
+from logger import get_logger
+
+log = get_logger("scrobbler")
+
+LASTFM_API_URL = "https://ws.audioscrobbler.com/2.0/"
+QUEUE_FILE = os.path.join(APPDATA_FOLDER, "scrobbles.db")
+
+# Максимум скробблов в одном запросе track.scrobble
+BATCH_SIZE = 50
+REQUEST_TIMEOUT = 15
+
+# Правила Last.fm: трек длиннее 30 с, прослушан наполовину или 4 минуты
+MIN_TRACK_SECONDS = 30
+MAX_THRESHOLD_SECONDS = 240
+# Скробблы старше 14 дней сервис не принимает
+MAX_AGE_SECONDS = 14 * 86400
+
+# Повторы при временных ошибках: от RETRY_MIN до RETRY_MAX секунд
+RETRY_MIN = 5.0
+RETRY_MAX = 900.0
+
+# Коды ошибок Last.fm, после которых имеет смысл повторить
+TRANSIENT_ERRORS = {8, 11, 16, 29}
+
+# Настройка -> поле ScrobbleClient; их смена снимает блокировку после ошибки авторизации
+CREDENTIAL_SETTINGS = {
+    "scrobble_api_url": "api_url",
+    "scrobble_api_key": "api_key",
+    "scrobble_api_secret": "api_secret",
+    "scrobble_session_key": "session_key",
+}
+
+
+def should_scrobble(play: Play) -> bool:
+    """Засчитывается ли прослушивание по правилам Last.fm"""
+    if play.duration and play.duration <= MIN_TRACK_SECONDS:
+        return False
+    threshold = min(play.duration / 2, MAX_THRESHOLD_SECONDS) if play.duration else MAX_THRESHOLD_SECONDS
+    return play.listened >= threshold
+
+
+class ScrobbleError(Exception):
+    """Ошибка API скробблинга"""
+    
+    def __init__(self, message: str, code: int = 0, transient: bool = True):
+        super().__init__(message)
+        self.code = code
+        self.transient = transient
+
+
+class ScrobbleClient:
+    """Клиент Last.fm-совместимого API 2.0"""
+    
+    def __init__(self, api_key: str, api_secret: str, session_key: str = "",
+                 api_url: str = LASTFM_API_URL):
+        self.api_url = api_url
+        self.api_key = api_key
+        self.api_secret = api_secret
+        self.session_key = session_key
+    
+    def _sign(self, params: Dict[str, str]) -> str:
+        """api_sig: md5 от отсортированных пар ключ-значение и секрета"""
+        raw = "".join(f"{key}{params[key]}" for key in sorted(params) if key not in ("format", "callback"))
+        return hashlib.md5((raw + self.api_secret).encode("utf-8")).hexdigest()
+    
+    def _call(self, method: str, params: Dict[str, str]) -> dict:
+        """Подписанный POST-запрос к API"""
+        params = dict(params, method=method, api_key=self.api_key)
+        params["api_sig"] = self._sign(params)
+        params["format"] = "json"
+        data = urllib.parse.urlencode(params).encode("utf-8")
+        request = urllib.request.Request(self.api_url, data=data, method="POST")
+        
+        try:
+            with urllib.request.urlopen(request, timeout=REQUEST_TIMEOUT) as response:
+                body = response.read()
+        except urllib.error.HTTPError as e:
+            # Сервис отдаёт описание ошибки в теле и при статусе 4xx/5xx
+            body = e.read()
+            if not body:
+                raise ScrobbleError(f"HTTP {e.code}", transient=e.code >= 500 or e.code == 429)
+        except (urllib.error.URLError, OSError) as e:
+            raise ScrobbleError(f"Нет связи: {e}")
+        
+        try:
+            result = json.loads(body)
+        except ValueError:
+            raise ScrobbleError("Некорректный ответ сервиса")
+        if "error" in result:
+            code = int(result["error"])
+            raise ScrobbleError(result.get("message", f"Ошибка {code}"), code, code in TRANSIENT_ERRORS)
+        return result
+    
+    def get_mobile_session(self, username: str, password: str) -> str:
+        """Получить ключ сессии по логину и паролю (auth.getMobileSession)"""
+        result = self._call("auth.getMobileSession", {"username": username, "password": password})
+        self.session_key = result["session"]["key"]
+        return self.session_key
+    
+    def scrobble(self, plays: List[Play]) -> Tuple[int, int]:
+        """
+        Отправить до BATCH_SIZE прослушиваний одним запросом.
+        
+        Returns:
+            (принято, отклонено сервисом)
+        """
+        params = {"sk": self.session_key}
+        for index, play in enumerate(plays):
+            params[f"artist[{index}]"] = play.artist
+            params[f"track[{index}]"] = play.title
+            params[f"timestamp[{index}]"] = str(int(play.started_at))
+            if play.album:
+                params[f"album[{index}]"] = play.album
+            if play.duration:
+                params[f"duration[{index}]"] = str(play.duration)
+        result = self._call("track.scrobble", params)
+        attr = result.get("scrobbles", {}).get("@attr", {})
+        return int(attr.get("accepted", len(plays))), int(attr.get("ignored", 0))
+
+
+class ScrobbleQueue:
+    """Очередь скробблов в SQLite: переживает перезапуск и отсутствие сети"""
+    
+    def __init__(self, path: str = QUEUE_FILE):
+        self.path = path
+        self._connection = sqlite3.connect(path, timeout=5, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS scrobbles ("
+            "id INTEGER PRIMARY KEY, started_at REAL NOT NULL, title TEXT NOT NULL, "
+            "artist TEXT NOT NULL, album TEXT NOT NULL, duration INTEGER NOT NULL, "
+            "listened INTEGER NOT NULL)"
+        )
+        self._lock = threading.Lock()
+    
+    def put(self, plays: List[Play]):
+        with self._lock, self._connection:
+            self._connection.executemany(
+                "INSERT INTO scrobbles (started_at, title, artist, album, duration, listened) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                [(p.started_at, p.title, p.artist, p.album, p.duration, p.listened) for p in plays]
+            )
+    
+    def peek(self, limit: int) -> List[Tuple[int, Play]]:
+        """Самые старые limit скробблов: (id, прослушивание)"""
+        with self._lock:
+            rows = self._connection.execute(
+                "SELECT id, started_at, title, artist, album, duration, listened "
+                "FROM scrobbles ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [(row[0], Play(*row[1:])) for row in rows]
+    
+    def remove(self, ids: List[int]):
+        with self._lock, self._connection:
+            self._connection.executemany("DELETE FROM scrobbles WHERE id = ?", [(i,) for i in ids])
+    
+    def drop_older(self, timestamp: float) -> int:
+        """Удалить скробблы, которые сервис уже не примет"""
+        with self._lock, self._connection:
+            return self._connection.execute(
+                "DELETE FROM scrobbles WHERE started_at < ?", (timestamp,)
+            ).rowcount
+    
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM scrobbles").fetchone()[0]
+    
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class Scrobbler:
+    """Принимает прослушивания из цикла опроса и отправляет их в фоне"""
+    
+    def __init__(self, client: ScrobbleClient, queue: ScrobbleQueue, batch_size: int = BATCH_SIZE,
+                 retry_min: float = RETRY_MIN, retry_max: float = RETRY_MAX):
+        self.client = client
+        self.queue = queue
+        self.batch_size = batch_size
+        self.retry_min = retry_min
+        self.retry_max = retry_max
+        self.sent = 0
+        self.failures = 0
+        self._pending: List[Play] = []
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._retry_delay = 0.0
+        self._retry_at: Optional[float] = None  # time.monotonic() следующей попытки
+        # Сервис отклонил ключ или сессию: очередь копится, но не отправляется,
+        # пока не сменятся данные входа (apply_setting) или не вызовут flush()
+        self._disabled = False
+        self._thread = threading.Thread(target=self._worker, name="scrobbler", daemon=True)
+        self._thread.start()
+    
+    def submit(self, play: Play):
+        """Поставить прослушивание в очередь (без обращения к диску и сети)"""
+        if not should_scrobble(play):
+            return
+        with self._lock:
+            self._pending.append(play)
+        self._wake.set()
+    
+    def _persist_pending(self):
+        with self._lock:
+            plays, self._pending = self._pending, []
+        if plays:
+            self.queue.put(plays)
+    
+    def _worker(self):
+        """Фоновый поток: сохранить новые, отправить очередь, при ошибке подождать"""
+        while True:
+            retry_at = self._retry_at
+            self._wake.wait(None if retry_at is None else max(0.0, retry_at - time.monotonic()))
+            self._wake.clear()
+            try:
+                self._persist_pending()
+            except sqlite3.Error as e:
+                log.error("scrobbler.queue", "Не удалось сохранить скробблы", error=str(e))
+            if self._closed:
+                return
+            # Новые прослушивания во время паузы только сохраняем, сеть не дёргаем
+            if self._disabled:
+                continue
+            if self._retry_at is None or time.monotonic() >= self._retry_at:
+                self._send_queue()
+    
+    def _send_queue(self):
+        """Отправлять пачки, пока очередь не опустеет или не случится ошибка"""
+        dropped = self.queue.drop_older(time.time() - MAX_AGE_SECONDS)
+        if dropped:
+            log.warning("scrobbler.expired", "Устаревшие скробблы удалены", count=dropped)
+        
+        while not self._closed:
+            batch = self.queue.peek(self.batch_size)
+            if not batch:
+                self._retry_delay = 0.0
+                self._retry_at = None
+                return
+            try:
+                accepted, ignored = self.client.scrobble([play for _, play in batch])
+            except ScrobbleError as e:
+                self.failures += 1
+                if not e.transient:
+                    # Ключ или сессия неверны — повторять бесполезно, пока их не поменяют
+                    log.error("scrobbler.auth", "Скробблинг отклонён", code=e.code, error=str(e))
+                    self._retry_delay = 0.0
+                    self._retry_at = None
+                    self._disabled = True
+                    return
+                self._retry_delay = min(self.retry_max, max(self.retry_min, self._retry_delay * 2))
+                # Разброс, чтобы после сбоя сервиса клиенты не пришли одновременно
+                self._retry_at = time.monotonic() + self._retry_delay * random.uniform(0.8, 1.2)
+                log.warning("scrobbler.retry", "Ошибка отправки, повтор позже",
+                            error=str(e), retry_in=round(self._retry_delay), queued=len(self.queue))
+                return
+            self.queue.remove([scrobble_id for scrobble_id, _ in batch])
+            self._retry_delay = 0.0
+            self.sent += accepted
+            log.info("scrobbler.sent", "Скробблы отправлены", accepted=accepted, ignored=ignored)
+    
+    def flush(self):
+        """Отправить очередь сейчас, не дожидаясь таймера повтора (и после ошибки авторизации)"""
+        self._disabled = False
+        self._retry_at = None
+        self._wake.set()
+    
+    def apply_setting(self, key: str, value):
+        """Подписчик настроек: новые данные входа — снова пробуем отправить очередь"""
+        field = CREDENTIAL_SETTINGS.get(key)
+        if field is None:
+            return
+        if field == "api_url":
+            value = value or LASTFM_API_URL
+        if getattr(self.client, field) == value:
+            return
+        setattr(self.client, field, value or "")
+        log.info("scrobbler.credentials", "Данные входа изменены", setting=key)
+        self.flush()
+    
+    def close(self, timeout: float = 2.0):
+        """Сохранить несохранённое на диск и остановить поток"""
+        if self._closed:
+            return
+        self._closed = True
+        self._wake.set()
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.queue.close()
+
+
+# Синглтон для использования во всём приложении
+_scrobbler_instance: Optional[Scrobbler] = None
+_unsubscribe = None
+
+
+def get_scrobbler() -> Optional[Scrobbler]:
+    """Получить скробблер, если он настроен (иначе None)"""
+    global _scrobbler_instance, _unsubscribe
+    if _scrobbler_instance is None:
+        settings = load_settings()
+        if not (settings.get("scrobble_enabled") and settings.get("scrobble_session_key")):
+            return None
+        ensure_appdata_folder()
+        client = ScrobbleClient(
+            settings.get("scrobble_api_key", ""),
+            settings.get("scrobble_api_secret", ""),
+            settings.get("scrobble_session_key", ""),
+            settings.get("scrobble_api_url") or LASTFM_API_URL
+        )
+        _scrobbler_instance = Scrobbler(client, ScrobbleQueue())
+        _unsubscribe = subscribe(CREDENTIAL_SETTINGS, _scrobbler_instance.apply_setting)
+        # Отправляем то, что осталось в очереди с прошлого запуска
+        _scrobbler_instance.flush()
+    return _scrobbler_instance
+
+
+def close_scrobbler():
+    """Сохранить очередь на диск (при выходе из приложения)"""
+    global _scrobbler_instance, _unsubscribe
+    if _unsubscribe is not None:
+        _unsubscribe()
+        _unsubscribe = None
+    if _scrobbler_instance is not None:
+        _scrobbler_instance.close()
+        _scrobbler_instance = None
+
+
+if __name__ == "__main__":
+    # Тест модуля на локальном сервере, изображающем Last.fm
+    import tempfile
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    
+    received = []
+    requests_seen = []
+    
+    class StandInHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length", 0))
+            params = dict(urllib.parse.parse_qsl(self.rfile.read(length).decode("utf-8")))
+            requests_seen.append(params)
+            signature = params.pop("api_sig", "")
+            client = ScrobbleClient(params["api_key"], "secret")
+            if signature != client._sign(params):
+                body, status = {"error": 13, "message": "Invalid method signature"}, 403
+            elif len(requests_seen) == 1:
+                body, status = {"error": 16, "message": "Service temporarily unavailable"}, 503
+            else:
+                count = sum(1 for key in params if key.startswith("artist["))
+                received.extend(params[f"track[{i}]"] for i in range(count))
+                body, status = {"scrobbles": {"@attr": {"accepted": count, "ignored": 0}}}, 200
+            data = json.dumps(body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        
+        def log_message(self, format, *args):
+            pass
+    
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_address[1]}/2.0/"
+    
+    print("Правила засчитывания:")
+    for duration, listened in [(200, 100), (200, 99), (600, 240), (25, 25)]:
+        play = Play(time.time(), "Трек", "Исполнитель", duration=duration, listened=listened)
+        print(f"  {duration} с, прослушано {listened} с: {'да' if should_scrobble(play) else 'нет'}")
+    
+    with tempfile.TemporaryDirectory(ignore_cleanup_errors=True) as folder:
+        path = os.path.join(folder, "scrobbles.db")
+        client = ScrobbleClient("key", "secret", "session", url)
+        scrobbler = Scrobbler(client, ScrobbleQueue(path), retry_min=0.2)
+        
+        now = time.time()
+        for index in range(120):
+            scrobbler.submit(Play(now - 3600 + index, f"Трек {index}", "Исполнитель",
+                                  duration=180, listened=180))
+        
+        deadline = time.time() + 5
+        while len(received) < 120 and time.time() < deadline:
+            time.sleep(0.05)
+        
+        batches = [sum(1 for key in r if key.startswith("artist[")) for r in requests_seen]
+        print(f"\nЗапросов: {len(requests_seen)}, размеры пачек: {batches}")
+        print(f"Принято сервером: {len(received)}, в очереди осталось: {len(scrobbler.queue)}")
+        print("✓ Всё отправлено" if len(received) == 120 else "✗ Не всё отправлено")
+        scrobbler.close()
+        
+        # Офлайн: очередь переживает перезапуск
+        offline = Scrobbler(ScrobbleClient("key", "secret", "session", "http://127.0.0.1:9/"),
+                            ScrobbleQueue(path), retry_min=60)
+        offline.submit(Play(now, "Офлайн", "Исполнитель", duration=180, listened=180))
+        time.sleep(0.5)
+        offline.close()
+        print(f"Офлайн, после перезапуска в очереди: {len(ScrobbleQueue(path))}")
+        
+        # Неверный секрет: после отказа новые прослушивания не отправляются, пока его не сменят
+        rejected = Scrobbler(ScrobbleClient("key", "wrong", "session", url), ScrobbleQueue(path))
+        rejected.flush()
+        time.sleep(0.3)
+        before = len(requests_seen)
+        for index in range(3):
+            rejected.submit(Play(now + index, f"После отказа {index}", "Исполнитель", duration=180, listened=180))
+        time.sleep(0.3)
+        print(f"После отказа запросов: {len(requests_seen) - before}, в очереди: {len(rejected.queue)}")
+        rejected.apply_setting("scrobble_api_secret", "secret")
+        deadline = time.time() + 5
+        while len(rejected.queue) and time.time() < deadline:
+            time.sleep(0.05)
+        print(f"После смены секрета в очереди: {len(rejected.queue)}")
+        rejected.close()
+    
+    server.shutdown()
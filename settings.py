@@ -5,7 +5,8 @@
 
 import os
 import json
-from typing import Optional
+import threading
+from typing import Any, Callable, Dict, Iterable, List, Optional
 
 # Захардкоженный Discord Client ID для всех пользователей
 DISCORD_CLIENT_ID = "1456892713621258319"
@@ -21,9 +22,42 @@ DEFAULT_SETTINGS = {
     "show_timestamp": True,
     "autostart": False,
     "minimize_to_tray": True,
-    "first_run": True
+    "first_run": True,
+    "metrics_port": 0,  # 0 — HTTP /metrics выключен
+    "history_enabled": True,  # История прослушивания в history.db
+    # Скробблинг в Last.fm-совместимый сервис (пустой адрес — Last.fm)
+    "scrobble_enabled": False,
+    "scrobble_api_url": "",
+    "scrobble_api_key": "",
+    "scrobble_api_secret": "",
+    "scrobble_session_key": "",
+    "overlay_port": 0,  # 0 — сервер оверлея для стрима выключен
+    "overlay_allowed_origins": [],  # Сторонние страницы с доступом к оверлею, например "https://example.com"
+    "cover_store_enabled": False,  # Хранить обложки локально (covers/ в AppData)
+    "lyrics_mode": "off",  # Строка текста песни в статусе: off, state или details
+    # Бэкенды (см. backends.py); пусто — выбрать по платформе
+    "track_source": "",  # gsmtc (Windows) или memory
+    "tray_backend": "",  # pystray или headless (без иконки)
+    "media_worker": False,  # Читать медиа-сессию в отдельном процессе (см. media_worker.py)
+    "profile_seconds": 30,  # Длительность профилирования из трея или по SIGUSR1
+    # Шаблоны строк статуса: поля {title}, {artist}, {album}, {status},
+    # {position}, {duration}, {progress} (см. presence_template.py)
+    "presence_details": "{title}",
+    "presence_state": "{artist}",
+    "presence_state_paused": "{artist} • На паузе",
+    "presence_large_text": "{album}",
+    "presence_small_text": "by @nevercr7 | t.me/nevercr7",
+    # Кнопки под статусом (не больше двух); [] — без кнопок
+    "presence_buttons": [
+        {"label": "Telegram", "url": "https://t.me/nevercr7dev"},
+        {"label": "GitHub", "url": "https://github.com/Nevercr7/YandexMusicRPC"}
+    ]
 }
 
+# Подписчики на изменения настроек: ключ -> список callback(key, value)
+_subscribers: Dict[str, List[Callable[[str, Any], None]]] = {}
+_subscribers_lock = threading.Lock()
+
 
 def ensure_appdata_folder():
     """Создать папку в AppData если её нет"""
@@ -61,15 +95,87 @@ def load_settings() -> dict:
     return DEFAULT_SETTINGS.copy()
 
 
+def _read_settings_file() -> dict:
+    """Прочитать файл настроек как есть (без дефолтов и уведомлений)"""
+    try:
+        with open(SETTINGS_FILE, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    except Exception:
+        return {}
+
+
 def save_settings(settings: dict):
-    """Сохранить настройки в файл"""
+    """Сохранить настройки в файл и уведомить подписчиков об изменённых ключах"""
     ensure_appdata_folder()
     
+    old_settings = _read_settings_file()
+    
     try:
         with open(SETTINGS_FILE, 'w', encoding='utf-8') as f:
             json.dump(settings, f, indent=2, ensure_ascii=False)
     except Exception as e:
         print(f"Ошибка сохранения настроек: {e}")
+        return
+    
+    _notify_subscribers(old_settings, settings)
+
+
+def subscribe(keys: Iterable[str], callback: Callable[[str, Any], None]) -> Callable[[], None]:
+    """
+    Подписаться на изменения настроек.
+    
+    Args:
+        keys: Ключи настроек, за которыми следим
+        callback: Вызывается как callback(key, new_value) в потоке, сохранившем настройки
+        
+    Returns:
+        Функция для отписки
+    """
+    keys = list(keys)
+    with _subscribers_lock:
+        for key in keys:
+            _subscribers.setdefault(key, []).append(callback)
+    
+    def unsubscribe():
+        with _subscribers_lock:
+            for key in keys:
+                callbacks = _subscribers.get(key, [])
+                if callback in callbacks:
+                    callbacks.remove(callback)
+    
+    return unsubscribe
+
+
+def _notify_subscribers(old_settings: dict, new_settings: dict):
+    """Вызвать подписчиков для ключей, значение которых изменилось"""
+    with _subscribers_lock:
+        pending = [
+            (key, list(callbacks))
+            for key, callbacks in _subscribers.items()
+            if callbacks and old_settings.get(key, DEFAULT_SETTINGS.get(key))
+            != new_settings.get(key, DEFAULT_SETTINGS.get(key))
+        ]
+    
+    for key, callbacks in pending:
+        value = new_settings.get(key, DEFAULT_SETTINGS.get(key))
+        for callback in callbacks:
+            try:
+                callback(key, value)
+            except Exception as e:
+                print(f"Ошибка обработчика настройки {key}: {e}")
+
+
+def get_setting(key: str) -> Any:
+    """Получить значение одной настройки"""
+    settings = load_settings()
+    return settings.get(key, DEFAULT_SETTINGS.get(key))
+
+
+def set_setting(key: str, value: Any):
+    """Изменить одну настройку (подписчики получат уведомление)"""
+    settings = load_settings()
+    settings[key] = value
+    save_settings(settings)
 
 
 def get_token() -> str:
@@ -0,0 +1,295 @@
+"""
+Один экземпляр приложения
+Первый запуск держит локальный канал (именованный канал Windows или
+Unix-сокет) и принимает по нему команды. Повторный запуск передаёт
+команду ("show" — показать окно, "reload" — перечитать настройки)
+и сразу завершается, не загружая интерфейс и конвейер
+"""
+
+import getpass
+import os
+import sys
+import tempfile
+import threading
+import time
+from typing import Callable, Optional
+
+from logger import get_logger
+
+log = get_logger("instance")
+
+APP_ID = "YandexMusicRPC"
+
+# Команды, которые понимает запущенный экземпляр
+COMMANDS = ("show", "reload")
+
+# Сколько ждать ответа запущенного экземпляра (с), включая рукопожатие
+HANDOFF_TIMEOUT = 2.0
+
+
+def _user_id() -> str:
+    try:
+        return getpass.getuser()
+    except Exception:
+        return str(os.getuid()) if hasattr(os, "getuid") else "user"
+
+
+def _address() -> str:
+    """Адрес канала: свой для каждого пользователя"""
+    name = f"{APP_ID}-{_user_id()}"
+    if sys.platform == "win32":
+        return rf"\\.\pipe\{name}"
+    folder = os.environ.get("XDG_RUNTIME_DIR") or tempfile.gettempdir()
+    return os.path.join(folder, f"{name}.sock")
+
+
+def _authkey() -> bytes:
+    # Не секрет, а метка протокола: чужой процесс на том же канале не пройдёт рукопожатие
+    return f"{APP_ID}:{_user_id()}".encode()
+
+
+class SingleInstance:
+    """Блокировка единственного экземпляра и приём команд от повторных запусков"""
+    
+    def __init__(self, address: Optional[str] = None):
+        self.address = address or _address()
+        self._listener = None
+        self._lock_file = None
+        self._thread: Optional[threading.Thread] = None
+        self._handler: Optional[Callable[[str], None]] = None
+        # Команда, пришедшая до установки обработчика (окно ещё создаётся)
+        self._pending: Optional[str] = None
+        self._handler_lock = threading.Lock()
+        # Команды выполняются по одной, хотя подключения обслуживают разные потоки
+        self._command_lock = threading.Lock()
+    
+    # === Повторный запуск ===
+    
+    def send(self, command: str, timeout: float = HANDOFF_TIMEOUT) -> bool:
+        """
+        Передать команду запущенному экземпляру; False — его нет или он не ответил.
+        Подключение и рукопожатие у multiprocessing.connection без таймаута,
+        поэтому идут в отдельном потоке: зависший экземпляр держит его, а не запуск
+        """
+        result = []
+        thread = threading.Thread(target=self._send, args=(command, timeout, result),
+                                  name="instance-send", daemon=True)
+        thread.start()
+        thread.join(timeout)
+        return bool(result) and result[0]
+    
+    def _send(self, command: str, timeout: float, result: list):
+        from multiprocessing.connection import AuthenticationError, Client
+        try:
+            connection = Client(self.address, authkey=_authkey())
+        except (OSError, EOFError, AuthenticationError):
+            return
+        try:
+            connection.send(command)
+            # Ответ — подтверждение, что команда принята (или экземпляр завис)
+            result.append(connection.poll(timeout) and connection.recv() == "ok")
+        except (OSError, EOFError):
+            pass
+        finally:
+            connection.close()
+    
+    # === Первый запуск ===
+    
+    def acquire(self) -> bool:
+        """Стать единственным экземпляром; False — канал уже занят другим"""
+        if not self._lock():
+            return False
+        from multiprocessing.connection import Listener
+        if sys.platform != "win32" and os.path.exists(self.address):
+            # Сокет остался от упавшего процесса: блокировка наша, значит он ничей
+            os.unlink(self.address)
+        try:
+            # Именованный канал Windows создаётся как первый экземпляр —
+            # второй процесс получит ошибку, это и есть блокировка.
+            # Без authkey: рукопожатие делает поток подключения, а не accept()
+            self._listener = Listener(self.address)
+        except OSError:
+            self._unlock()
+            return False
+        self._thread = threading.Thread(target=self._serve, name="instance", daemon=True)
+        self._thread.start()
+        return True
+    
+    def _lock(self) -> bool:
+        """На POSIX сокет не блокирует сам по себе — держим flock на файле рядом"""
+        if sys.platform == "win32":
+            return True
+        import fcntl
+        lock_file = open(f"{self.address}.lock", "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+    
+    def _unlock(self):
+        if self._lock_file is not None:
+            self._lock_file.close()
+            self._lock_file = None
+    
+    def _serve(self):
+        """Поток приёма подключений"""
+        while True:
+            try:
+                connection = self._listener.accept()
+            except (OSError, EOFError):
+                # Канал закрыт (release) — выходим; оборванное подключение — ждём дальше
+                if self._listener is None:
+                    return
+                continue
+            # Рукопожатие читает без таймаута: зависший клиент держит только свой поток
+            threading.Thread(target=self._handle, args=(connection,), name="instance-client",
+                             daemon=True).start()
+    
+    def _handle(self, connection):
+        """Рукопожатие и команда одного подключения"""
+        from multiprocessing.connection import AuthenticationError, answer_challenge, deliver_challenge
+        try:
+            deliver_challenge(connection, _authkey())
+            answer_challenge(connection, _authkey())
+            if not connection.poll(HANDOFF_TIMEOUT):
+                return
+            command = connection.recv()
+            if command not in COMMANDS:
+                connection.send("unknown")
+                return
+            connection.send("ok")
+        except (OSError, EOFError, AuthenticationError):
+            # AuthenticationError: к каналу подключился не наш процесс
+            return
+        finally:
+            connection.close()
+        log.info("instance.command", "Команда от повторного запуска", command=command)
+        self._dispatch(command)
+    
+    def _dispatch(self, command: str):
+        with self._handler_lock:
+            handler = self._handler
+            if handler is None:
+                self._pending = command
+                return
+        try:
+            with self._command_lock:
+                handler(command)
+        except Exception as e:
+            log.error("instance.command", "Ошибка обработки команды", command=command, error=str(e))
+    
+    def set_handler(self, handler: Optional[Callable[[str], None]]):
+        """Обработчик команд handler(command); вызывается из потока канала"""
+        with self._handler_lock:
+            self._handler = handler
+            pending, self._pending = self._pending, None
+        if handler is not None and pending is not None:
+            self._dispatch(pending)
+    
+    def release(self):
+        """Освободить канал (при выходе)"""
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            try:
+                listener.close()
+            except OSError:
+                pass
+        self._unlock()
+
+
+# Экземпляр, владеющий каналом в этом процессе
+_instance: Optional[SingleInstance] = None
+
+
+def acquire_instance(command: str = "show") -> Optional[SingleInstance]:
+    """
+    Захватить единственный экземпляр или передать команду уже запущенному.
+    
+    Returns:
+        SingleInstance, если этот процесс первый; None — команда передана,
+        процессу нужно завершиться
+    """
+    global _instance
+    if _instance is not None:
+        return _instance
+    instance = SingleInstance()
+    # Сначала пробуем запущенный экземпляр: это самый частый путь повторного запуска
+    if instance.send(command):
+        return None
+    if instance.acquire():
+        _instance = instance
+        return instance
+    # Канал занят, но не ответил: экземпляр только запускается — даём ему время
+    deadline = time.monotonic() + HANDOFF_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(0.05)
+        if instance.send(command):
+            return None
+    log.warning("instance.acquire", "Не удалось захватить канал, работаем без блокировки")
+    return instance
+
+
+def set_command_handler(handler: Optional[Callable[[str], None]]):
+    """Установить обработчик команд от повторных запусков (если канал наш)"""
+    if _instance is not None:
+        _instance.set_handler(handler)
+
+
+def release_instance():
+    """Освободить канал при выходе"""
+    global _instance
+    if _instance is not None:
+        _instance.release()
+        _instance = None
+
+
+if __name__ == "__main__":
+    # Тест модуля: первый экземпляр в этом процессе, повторные запуски — дочерние процессы
+    import subprocess
+    
+    received = []
+    instance = acquire_instance()
+    print(f"Первый экземпляр: {instance is not None}, канал {instance.address}")
+    set_command_handler(received.append)
+    
+    second = ("import sys, time; sys.path.insert(0, %r); started = time.perf_counter();"
+              "from single_instance import acquire_instance;"
+              "result = acquire_instance(sys.argv[1]);"
+              "print(f'{(time.perf_counter() - started) * 1000:.1f}', result is None)") % os.getcwd()
+    for command in ("show", "reload"):
+        started = time.perf_counter()
+        output = subprocess.run([sys.executable, "-c", second, command],
+                                capture_output=True, text=True).stdout.split()
+        total = (time.perf_counter() - started) * 1000
+        print(f"Повторный запуск ({command}): передан {output[1]}, "
+              f"проверка {output[0]} мс, процесс целиком {total:.0f} мс")
+    
+    # Клиент, который подключился и молчит, не мешает следующим запускам
+    import socket
+    if sys.platform != "win32":
+        stalled = socket.socket(socket.AF_UNIX)
+        stalled.connect(instance.address)
+        started = time.perf_counter()
+        print(f"Команда при зависшем клиенте: {SingleInstance().send('show')}, "
+              f"{(time.perf_counter() - started) * 1000:.1f} мс")
+        # Экземпляр, который принимает подключения, но не отвечает
+        hung = socket.socket(socket.AF_UNIX)
+        hung_address = f"{instance.address}.hung"
+        if os.path.exists(hung_address):
+            os.unlink(hung_address)
+        hung.bind(hung_address)
+        hung.listen()
+        started = time.perf_counter()
+        sent = SingleInstance(hung_address).send("show", timeout=0.5)
+        print(f"Зависший экземпляр: передано {sent}, ожидание {(time.perf_counter() - started) * 1000:.0f} мс")
+        stalled.close()
+        hung.close()
+        os.unlink(hung_address)
+    
+    time.sleep(0.1)
+    print(f"Получены команды: {received}")
+    release_instance()
+    print(f"После release канал свободен: {SingleInstance().acquire()}")
@@ -0,0 +1,107 @@
+"""
+Снимок состояния для тёплого перезапуска
+Последний трек и найденная для него обложка сохраняются на диск
+(при смене трека и при выходе). После перезапуска, если в медиа-сессии
+играет тот же трек, статус уходит сразу, без повторного поиска обложки
+"""
+
+import json
+import os
+import tempfile
+import time
+from dataclasses import asdict, dataclass
+from typing import Optional
+
+from media_session import TrackInfo
+from settings import APPDATA_FOLDER
+from logger import get_logger
+
+log = get_logger("snapshot")
+
+SNAPSHOT_FILE = os.path.join(APPDATA_FOLDER, "snapshot.json")
+
+# Более старый снимок не используется: за это время трек наверняка сменился
+MAX_SNAPSHOT_AGE = 12 * 3600
+
+
+@dataclass
+class Snapshot:
+    """Последнее отправленное состояние"""
+    track: TrackInfo
+    cover_url: Optional[str]
+    saved_at: float  # time.time()
+    
+    def matches(self, track: Optional[TrackInfo]) -> bool:
+        """Тот же ли трек сейчас в медиа-сессии"""
+        return (track is not None and
+                (track.title, track.artist) == (self.track.title, self.track.artist))
+
+
+def save_snapshot(path: str, track: TrackInfo, cover_url: Optional[str]):
+    """
+    Записать снимок атомарно: при падении посреди записи останется прежний.
+    Пишут поток Yandex (смена трека) и цикл событий (выход) — у каждой записи
+    свой временный файл, так что одновременные записи не смешиваются
+    """
+    fields = asdict(track)
+    # Миниатюра из медиа-сессии — байты картинки, в снимке не нужна
+    fields.pop("thumbnail", None)
+    data = {"track": fields, "cover_url": cover_url, "saved_at": time.time()}
+    temp = None
+    try:
+        fd, temp = tempfile.mkstemp(prefix=f"{os.path.basename(path)}.", suffix=".tmp",
+                                    dir=os.path.dirname(path) or ".")
+        with open(fd, "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp, path)
+    except OSError as e:
+        log.warning("snapshot.save", "Не удалось сохранить снимок", error=str(e))
+        if temp is not None:
+            try:
+                os.remove(temp)
+            except OSError:
+                pass
+
+
+def load_snapshot(path: str, max_age: float = MAX_SNAPSHOT_AGE) -> Optional[Snapshot]:
+    """Прочитать снимок; None — его нет, он повреждён или устарел"""
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        snapshot = Snapshot(TrackInfo(**data["track"]), data.get("cover_url"), float(data["saved_at"]))
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        log.warning("snapshot.load", "Снимок повреждён, игнорируем", error=str(e))
+        return None
+    if time.time() - snapshot.saved_at > max_age:
+        return None
+    return snapshot
+
+
+if __name__ == "__main__":
+    # Тест модуля
+    import threading
+    
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "snapshot.json")
+        track = TrackInfo(title="Трек", artist="Исполнитель", album="Альбом",
+                          thumbnail=b"...", is_playing=True, duration=200, position=42)
+        save_snapshot(path, track, "https://avatars.example/cover/400x400")
+        snapshot = load_snapshot(path)
+        print(f"Снимок: {snapshot}")
+        print(f"Совпадает с тем же треком: {snapshot.matches(track)}")
+        print(f"Устаревший отбрасывается: {load_snapshot(path, max_age=-1) is None}")
+        
+        # Смена трека (поток Yandex) и выход (цикл событий) пишут одновременно
+        def writer(index: int):
+            for _ in range(200):
+                save_snapshot(path, TrackInfo(title=f"Трек {index}", artist="Исполнитель" * 50), None)
+        
+        threads = [threading.Thread(target=writer, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        print(f"После одновременных записей снимок цел: {load_snapshot(path) is not None}, "
+              f"временных файлов: {len(os.listdir(folder)) - 1}")
@@ -0,0 +1,112 @@
+"""
+Состояние приложения для отображения
+Неизменяемый снимок AppState, который конвейер целиком заменяет при каждом
+изменении. Читатели из других потоков (трей, окно, метрики) берут ссылку
+на снимок без блокировок — все поля в нём согласованы между собой
+"""
+
+import threading
+from dataclasses import dataclass, replace
+from typing import Optional
+
+from media_session import TrackInfo
+
+
+@dataclass(frozen=True)
+class AppState:
+    """Согласованный снимок: трек и статусы из одного и того же момента"""
+    version: int = 0
+    track: Optional[TrackInfo] = None
+    discord_connected: bool = False
+    discord_status: str = "Подключение..."
+    music_status: str = "Поиск музыки..."
+    error_message: Optional[str] = None
+    
+    def status_color(self) -> str:
+        """Цвет иконки по состоянию"""
+        if not self.discord_connected:
+            return "red"
+        if self.track:
+            return "green" if self.track.is_playing else "yellow"
+        return "gray"
+
+
+class StateStore:
+    """
+    Хранилище текущего AppState с номером версии.
+    Чтение — одно обращение к атрибуту (присваивание ссылки атомарно),
+    запись и ожидание новой версии — через Condition
+    """
+    
+    def __init__(self, initial: Optional[AppState] = None):
+        self._state = initial or AppState()
+        self._changed = threading.Condition()
+    
+    @property
+    def state(self) -> AppState:
+        """Текущий снимок (без блокировок)"""
+        return self._state
+    
+    @property
+    def version(self) -> int:
+        return self._state.version
+    
+    def update(self, **changes) -> AppState:
+        """
+        Заменить снимок копией с изменёнными полями.
+        Если ничего не изменилось, версия не растёт и ожидающие не будят
+        """
+        with self._changed:
+            current = self._state
+            if all(getattr(current, name) == value for name, value in changes.items()):
+                return current
+            state = replace(current, version=current.version + 1, **changes)
+            self._state = state
+            self._changed.notify_all()
+        return state
+    
+    def wait_for_version(self, version: int, timeout: Optional[float] = None) -> AppState:
+        """
+        Дождаться снимка новее version (блокирующий вызов, без опроса).
+        По таймауту возвращается текущий снимок — сравните его version
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self._state.version > version, timeout)
+            return self._state
+
+
+if __name__ == "__main__":
+    # Тест модуля: писатель меняет пару полей, читатели проверяют согласованность
+    import time
+    
+    store = StateStore()
+    seen = []
+    
+    def reader():
+        version = 0
+        while version < 1000:
+            state = store.wait_for_version(version, timeout=1)
+            # Писатель всегда меняет статус и трек вместе
+            assert state.track is None or state.music_status.endswith(state.track.title)
+            seen.append(state.version)
+            version = state.version
+    
+    readers = [threading.Thread(target=reader) for _ in range(3)]
+    for thread in readers:
+        thread.start()
+    started = time.perf_counter()
+    for index in range(1000):
+        track = TrackInfo(title=f"Трек {index}", artist="Исполнитель", is_playing=True)
+        store.update(track=track, music_status=f"✓ Исполнитель - {track.title}")
+    for thread in readers:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    print(f"Версия: {store.version}, читатели увидели {len(seen)} снимков, все согласованы")
+    print(f"Без изменений версия не растёт: {store.update(music_status=store.state.music_status).version}")
+    print(f"Запись: {elapsed / 1000 * 1e6:.1f} мкс, цвет: {store.state.status_color()}")
+    
+    reads = 1000000
+    started = time.perf_counter()
+    for _ in range(reads):
+        store.state
+    print(f"Чтение снимка: {(time.perf_counter() - started) / reads * 1e9:.0f} нс")
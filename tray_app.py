@@ -4,118 +4,163 @@ Yandex Music Discord Rich Presence - Tray Version
 by @nevercr7
 """
 
-import time
 import threading
 import asyncio
+import time
 from typing import Optional, Callable
 import os
 import sys
 
-# Для трея
-from PIL import Image, ImageDraw
-import pystray
-from pystray import MenuItem as item
+# PIL и трей (pystray, см. backends.py) импортируются при первом использовании:
+# конвейер успевает начать подключение к Discord, пока они грузятся
+
+from settings import load_settings, subscribe
+from backends import get_tray
+from pipeline import LIVE_SETTINGS, SHUTDOWN_TIMEOUT, create_pipeline
+import metrics
+from logger import setup_logging, shutdown_logging
+from single_instance import acquire_instance, release_instance, set_command_handler
+
+
+# Цвета иконки по статусу
+ICON_COLORS = {
+    "green": (76, 175, 80, 255),
+    "yellow": (255, 193, 7, 255),
+    "red": (244, 67, 54, 255),
+    "gray": (158, 158, 158, 255),
+}
+
+# Кэш готовых иконок: цвет -> Image
+_icon_cache: dict = {}
+
+# Как часто обновлять сводку метрик в меню (с)
+METRICS_MENU_REFRESH = 30
 
-from settings import DISCORD_CLIENT_ID, get_token, get_update_interval, load_settings
-from media_session import MediaSessionManager, TrackInfo
-from discord_rpc import DiscordRPC
-from yandex_api import get_yandex_api
+
+def _render_icon_image(color: str):
+    """Нарисовать иконку для трея"""
+    from PIL import Image, ImageDraw
+    
+    size = 64
+    image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(image)
+    
+    fill_color = ICON_COLORS.get(color, ICON_COLORS["gray"])
+    
+    # Рисуем круг
+    draw.ellipse([4, 4, size-4, size-4], fill=fill_color)
+    
+    # Рисуем ноту
+    draw.ellipse([18, 36, 30, 48], fill=(255, 255, 255, 255))
+    draw.rectangle([28, 20, 32, 40], fill=(255, 255, 255, 255))
+    draw.ellipse([34, 30, 46, 42], fill=(255, 255, 255, 255))
+    draw.rectangle([44, 14, 48, 34], fill=(255, 255, 255, 255))
+    draw.rectangle([28, 14, 48, 18], fill=(255, 255, 255, 255))
+    
+    return image
 
 
 class YandexMusicRPCTray:
     """Приложение с иконкой в трее"""
     
     def __init__(self, on_quit: Optional[Callable] = None, on_open: Optional[Callable] = None):
-        self.media_manager = MediaSessionManager()
-        self.discord = DiscordRPC(DISCORD_CLIENT_ID)
-        
-        token = get_token()
-        self.yandex_api = get_yandex_api(token if token else None)
-        
         self.running = False
-        self._loop: Optional[asyncio.AbstractEventLoop] = None
-        self._last_cover_key = None
-        self._last_cover_url = None
-        self._current_track = None
         self.icon = None
+        self.tray = None  # Бэкенд трея: модуль pystray или backends.HeadlessTray
         self._update_thread = None
         self._on_quit = on_quit
         self._on_open = on_open
-        self._update_interval = get_update_interval()
-        
-        # Статусы для отображения
-        self._discord_status = "Подключение..."
-        self._music_status = "Поиск музыки..."
-        self._error_message = None
-    
-    def create_icon_image(self, color="green"):
-        """Создать изображение для иконки в трее"""
-        size = 64
-        image = Image.new('RGBA', (size, size), (0, 0, 0, 0))
-        draw = ImageDraw.Draw(image)
         
-        if color == "green":
-            fill_color = (76, 175, 80, 255)
-        elif color == "yellow":
-            fill_color = (255, 193, 7, 255)
-        elif color == "red":
-            fill_color = (244, 67, 54, 255)
-        else:
-            fill_color = (158, 158, 158, 255)
+        # Весь конвейер статуса работает на одном asyncio-рантайме в потоке обновления
+        self.pipeline = create_pipeline(on_status_change=self._refresh_ui)
+        self.media_manager = self.pipeline.media_manager
+        self.discord = self.pipeline.discord
+        self.yandex_api = self.pipeline.yandex_api
         
-        # Рисуем круг
-        draw.ellipse([4, 4, size-4, size-4], fill=fill_color)
+        # Изменения настроек применяются на лету, без перезапуска
+        self._unsubscribe_settings = subscribe(LIVE_SETTINGS, self.pipeline.apply_setting)
         
-        # Рисуем ноту
-        draw.ellipse([18, 36, 30, 48], fill=(255, 255, 255, 255))
-        draw.rectangle([28, 20, 32, 40], fill=(255, 255, 255, 255))
-        draw.ellipse([34, 30, 46, 42], fill=(255, 255, 255, 255))
-        draw.rectangle([44, 14, 48, 34], fill=(255, 255, 255, 255))
-        draw.rectangle([28, 14, 48, 18], fill=(255, 255, 255, 255))
+        # Снимок состояния, который сейчас показан: все строки меню и подсказки
+        # берутся из него, поэтому трек и статусы всегда из одного момента
+        self._shown_state = self.pipeline.state
         
+        # Последнее, что отправлено в трей: обращаемся к ОС только при изменениях
+        self._last_icon_color = None
+        self._last_menu_model = None
+        self._last_tooltip = None
+        self.tray_calls_avoided = {"icon": 0, "menu": 0, "tooltip": 0}
+        self._metrics_text = metrics.snapshot_text()
+        self._metrics_text_at = time.monotonic()
+        metrics.REGISTRY.gauge("tray_calls_avoided", "Пропущенные обращения к API трея",
+                               lambda: sum(self.tray_calls_avoided.values()))
+    
+    def create_icon_image(self, color="green"):
+        """Получить изображение для иконки в трее (рисуется один раз на цвет)"""
+        image = _icon_cache.get(color)
+        if image is None:
+            image = _render_icon_image(color)
+            _icon_cache[color] = image
         return image
     
     def get_status_text(self):
         """Получить текст статуса для меню"""
-        if self._current_track:
-            status = "▶" if self._current_track.is_playing else "⏸"
-            return f"{status} {self._current_track.artist} - {self._current_track.title}"
+        track = self._shown_state.track
+        if track:
+            status = "▶" if track.is_playing else "⏸"
+            return f"{status} {track.artist} - {track.title}"
         return "Нет активного трека"
     
     def get_tooltip_text(self):
         """Получить текст для всплывающей подсказки"""
+        state = self._shown_state
         lines = ["Yandex Music RPC"]
         
         # Статус Discord
-        lines.append(f"Discord: {self._discord_status}")
+        lines.append(f"Discord: {state.discord_status}")
         
         # Статус музыки
-        lines.append(f"Музыка: {self._music_status}")
+        lines.append(f"Музыка: {state.music_status}")
         
         # Ошибка если есть
-        if self._error_message:
-            lines.append(f"⚠ {self._error_message}")
+        if state.error_message:
+            lines.append(f"⚠ {state.error_message}")
         
         return "\n".join(lines)
     
     def get_discord_status_text(self):
         """Текст статуса Discord для меню"""
-        return f"Discord: {self._discord_status}"
+        return f"Discord: {self._shown_state.discord_status}"
     
     def get_music_status_text(self):
         """Текст статуса музыки для меню"""
-        return f"Музыка: {self._music_status}"
+        return f"Музыка: {self._shown_state.music_status}"
+    
+    def stop(self, timeout: float = SHUTDOWN_TIMEOUT + 0.1):
+        """Остановить конвейер и дождаться отключения от Discord (не дольше timeout)"""
+        self.running = False
+        self.pipeline.stop()
+        thread = self._update_thread
+        if thread and thread is not threading.current_thread():
+            thread.join(timeout)
+    
+    def get_metrics_text(self):
+        """Сводка метрик для меню (пересчитывается не чаще METRICS_MENU_REFRESH)"""
+        now = time.monotonic()
+        if now - self._metrics_text_at >= METRICS_MENU_REFRESH:
+            self._metrics_text = metrics.snapshot_text()
+            self._metrics_text_at = now
+        return self._metrics_text
     
     def on_quit(self, icon, item):
         """Обработчик выхода"""
-        self.running = False
+        self.stop()
         icon.stop()
         if self._on_quit:
             self._on_quit()
     
     def on_open(self, icon, item):
         """Открыть главное окно"""
-        self.running = False
+        self.stop()
         icon.stop()
         if self._on_open:
             self._on_open()
@@ -123,14 +168,48 @@ class YandexMusicRPCTray:
     def on_show_status(self, icon, item):
         pass
     
+    def get_profile_text(self):
+        """Текст пункта профилирования (модуль профилировщика грузится только при запуске)"""
+        profiler = sys.modules.get("profiler")
+        if profiler is not None and profiler.is_profiling():
+            return "⏺ Идёт профилирование..."
+        return "Записать профиль CPU"
+    
+    def on_profile(self, icon, item):
+        """Запустить профилировщик; по окончании показать, куда записан профиль"""
+        from profiler import start_profiling
+        if start_profiling(load_settings().get("profile_seconds", 30), on_done=self._on_profile_done):
+            self._update_menu_texts()
+    
+    def _on_profile_done(self, path):
+        self._update_menu_texts()
+        notify = getattr(self.icon, "notify", None)
+        if notify is not None and path:
+            try:
+                notify(f"Профиль записан: {path}", "Yandex Music RPC")
+            except Exception:
+                pass
+    
+    def _update_menu_texts(self):
+        """Перерисовать меню (текст пункта профилирования зависит от состояния)"""
+        self._last_menu_model = None
+        self._update_menu()
+    
     def update_icon(self, status="green"):
-        """Обновить иконку"""
-        if self.icon:
-            self.icon.icon = self.create_icon_image(status)
+        """Обновить иконку (только если цвет изменился)"""
+        if not self.icon:
+            return
+        if status == self._last_icon_color:
+            self.tray_calls_avoided["icon"] += 1
+            return
+        self._last_icon_color = status
+        self.icon.icon = self.create_icon_image(status)
     
     def create_menu(self):
         """Создать меню трея"""
-        return pystray.Menu(
+        item = self.tray.MenuItem
+        
+        return self.tray.Menu(
             item(
                 lambda text: self.get_status_text(),
                 self.on_show_status,
@@ -147,6 +226,15 @@ class YandexMusicRPCTray:
                 None,
                 enabled=False
             ),
+            item(
+                lambda text: self.get_metrics_text(),
+                None,
+                enabled=False
+            ),
+            item(
+                lambda text: self.get_profile_text(),
+                self.on_profile
+            ),
             item("─────────────", None, enabled=False),
             item("Yandex Music RPC", None, enabled=False),
             item("by @nevercr7", None, enabled=False),
@@ -155,145 +243,75 @@ class YandexMusicRPCTray:
             item("Выход", self.on_quit)
         )
     
-    async def _get_track(self) -> Optional[TrackInfo]:
-        """Получить информацию о текущем треке"""
-        return await self.media_manager.get_current_track()
-    
-    def _get_cover_url(self, track: TrackInfo) -> Optional[str]:
-        """Получить URL обложки для трека"""
-        cover_key = f"{track.artist}|{track.title}"
-        
-        if cover_key == self._last_cover_key:
-            return self._last_cover_url
-        
-        try:
-            cover_url = self.yandex_api.get_cover_url(track.title, track.artist)
-            self._last_cover_key = cover_key
-            self._last_cover_url = cover_url
-            return cover_url
-        except Exception:
-            return None
+    def _refresh_ui(self):
+        """Обновить иконку, меню и подсказку по состоянию конвейера"""
+        state = self.pipeline.state
+        self._shown_state = state
+        self.update_icon(state.status_color())
+        self._update_menu()
+        self._update_tooltip()
     
     def update_loop(self):
-        """Цикл обновления статуса"""
-        self._loop = asyncio.new_event_loop()
-        asyncio.set_event_loop(self._loop)
-        
-        discord_retry_count = 0
-        
-        while self.running:
-            try:
-                discord_ok = False
-                music_ok = False
-                
-                # === ПОИСК МУЗЫКИ (независимо от Discord) ===
-                try:
-                    track = self._loop.run_until_complete(self._get_track())
-                    self._current_track = track
-                    
-                    if track:
-                        self._music_status = f"✓ {track.artist} - {track.title}"[:40]
-                        music_ok = True
-                    else:
-                        self._music_status = "Нет активного трека"
-                except Exception as e:
-                    self._current_track = None
-                    self._music_status = f"✗ Ошибка: {str(e)[:20]}"
-                
-                # === ПРОВЕРКА DISCORD ===
-                if not self.discord.connected:
-                    discord_retry_count += 1
-                    self._discord_status = f"Подключение... (попытка {discord_retry_count})"
-                    self._update_menu()
-                    self._update_tooltip()
-                    
-                    if self.discord.connect():
-                        self._discord_status = "✓ Подключен"
-                        self._error_message = None
-                        discord_retry_count = 0
-                        discord_ok = True
-                    else:
-                        self._discord_status = "✗ Не подключен"
-                        self._error_message = "Discord не запущен или недоступен"
-                else:
-                    self._discord_status = "✓ Подключен"
-                    discord_ok = True
-                
-                # === ОБНОВЛЕНИЕ PRESENCE В DISCORD ===
-                if discord_ok and self._current_track:
-                    cover_url = None
-                    try:
-                        cover_url = self._get_cover_url(self._current_track)
-                    except Exception:
-                        pass
-                    
-                    try:
-                        settings = load_settings()
-                        self.discord.update_presence(self._current_track, settings.get("show_timestamp", True), cover_url)
-                    except Exception:
-                        self._discord_status = "✗ Ошибка отправки"
-                        self.discord.connected = False
-                        discord_retry_count = 0
-                
-                elif discord_ok and not self._current_track:
-                    # Очищаем статус если нет трека
-                    try:
-                        self.discord.update_presence(None, False, None)
-                    except Exception:
-                        pass
-                
-                # === ОБНОВЛЕНИЕ ИКОНКИ ===
-                if not discord_ok:
-                    self.update_icon("red")
-                elif music_ok:
-                    if self._current_track and self._current_track.is_playing:
-                        self.update_icon("green")
-                    else:
-                        self.update_icon("yellow")
-                else:
-                    self.update_icon("gray")
-                
-                self._error_message = None if (discord_ok or music_ok) else self._error_message
-                self._update_menu()
-                self._update_tooltip()
-                
-            except Exception as e:
-                self._error_message = f"Ошибка: {str(e)[:30]}"
-                self.update_icon("red")
-            
-            time.sleep(self._update_interval)
-        
-        # Отключаемся при выходе
+        """Поток обновления: единый asyncio-рантайм для всего конвейера"""
         try:
-            self.discord.disconnect()
-        except Exception:
-            pass
-        if self._loop:
-            self._loop.close()
+            asyncio.run(self.pipeline.run())
+        finally:
+            self._unsubscribe_settings()
+    
+    def _get_menu_model(self):
+        """Динамические строки меню — по ним определяем, нужно ли перерисовывать меню"""
+        return (
+            self.get_status_text(),
+            self.get_discord_status_text(),
+            self.get_music_status_text(),
+            self.get_metrics_text(),
+            self.get_profile_text(),
+        )
     
     def _update_menu(self):
-        """Обновить меню трея"""
-        if self.icon:
-            self.icon.menu = self.create_menu()
+        """Обновить меню трея (только если изменились строки)"""
+        if not self.icon:
+            return
+        model = self._get_menu_model()
+        if model == self._last_menu_model:
+            self.tray_calls_avoided["menu"] += 1
+            return
+        self._last_menu_model = model
+        # Меню создаётся один раз, тексты пересчитываются лямбдами
+        self.icon.update_menu()
     
     def _update_tooltip(self):
-        """Обновить всплывающую подсказку"""
-        if self.icon:
-            self.icon.title = self.get_tooltip_text()
+        """Обновить всплывающую подсказку (только если текст изменился)"""
+        if not self.icon:
+            return
+        tooltip = self.get_tooltip_text()
+        if tooltip == self._last_tooltip:
+            self.tray_calls_avoided["tooltip"] += 1
+            return
+        self._last_tooltip = tooltip
+        self.icon.title = tooltip
     
     def run(self):
         """Запустить приложение"""
         self.running = True
         
+        # Локальный /metrics, если включён в настройках
+        metrics.start_http_server(load_settings().get("metrics_port", 0))
+        
         # Запускаем поток обновления
-        self._update_thread = threading.Thread(target=self.update_loop, daemon=True)
+        self._update_thread = threading.Thread(target=self.update_loop, name="update", daemon=True)
         self._update_thread.start()
         
         # Создаём иконку в трее
-        self.icon = pystray.Icon(
+        self.tray = get_tray(load_settings().get("tray_backend") or None)
+        
+        self._last_icon_color = "gray"
+        self._last_tooltip = self.get_tooltip_text()
+        self._last_menu_model = self._get_menu_model()
+        self.icon = self.tray.Icon(
             "YandexMusicRPC",
             self.create_icon_image("gray"),
-            self.get_tooltip_text(),
+            self._last_tooltip,
             self.create_menu()
         )
         
@@ -301,8 +319,19 @@ class YandexMusicRPCTray:
 
 
 def main():
-    app = YandexMusicRPCTray()
-    app.run()
+    setup_logging()
+    try:
+        # Окна у трея нет — повторный запуск только перечитывает настройки
+        if acquire_instance("reload") is None:
+            return
+        app = YandexMusicRPCTray()
+        set_command_handler(lambda command: app.pipeline.reload_settings() if command == "reload" else None)
+        app.run()
+    finally:
+        from pipeline import close_services
+        close_services()
+        release_instance()
+        shutdown_logging()
 
 
 if __name__ == "__main__":
@@ -3,27 +3,42 @@
 Используется для получения обложек альбомов
 """
 
-from typing import Optional
-from yandex_music import Client
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Optional
+
+from metrics import COVER_CACHE, COVER_CACHE_HITS, COVER_CACHE_MISSES, ERRORS, YANDEX_SEARCH
+from logger import get_logger
+
+log = get_logger("yandex")
+
+# Сколько обложек держать в кэше (вытесняются давно не запрошенные)
+COVER_CACHE_SIZE = 512
+
+if TYPE_CHECKING:
+    from yandex_music import Client
 
 
 class YandexMusicAPI:
     """Класс для работы с Yandex Music API"""
     
-    def __init__(self, token: Optional[str] = None):
+    def __init__(self, token: Optional[str] = None, cache_size: int = COVER_CACHE_SIZE):
         """
         Инициализация клиента Yandex Music
         
         Args:
             token: OAuth токен Yandex Music (опционально, без него работает с ограничениями)
+            cache_size: Максимум треков в кэше
         """
         self.token = token
-        self._client: Optional[Client] = None
-        self._cover_cache: dict = {}  # Кэш обложек
+        self._client: Optional["Client"] = None
+        self._cover_cache: OrderedDict = OrderedDict()  # Кэш найденных треков (LRU)
+        self._cache_size = cache_size
     
-    def _get_client(self) -> Client:
+    def _get_client(self) -> "Client":
         """Получить или создать клиент"""
         if self._client is None:
+            # yandex_music тяжёлый — импортируем только при первом запросе
+            from yandex_music import Client
             try:
                 if self.token:
                     self._client = Client(self.token).init()
@@ -31,10 +46,27 @@ class YandexMusicAPI:
                     # Без токена - ограниченный функционал, но поиск работает
                     self._client = Client().init()
             except Exception as e:
-                print(f"Ошибка инициализации Yandex Music API: {e}")
+                log.error("yandex.init", "Ошибка инициализации Yandex Music API", error=str(e))
                 raise
         return self._client
     
+    def set_token(self, token: Optional[str]):
+        """
+        Сменить токен на лету.
+        Пересоздаётся только клиент, кэш обложек сохраняется.
+        """
+        if token == self.token:
+            return
+        self.token = token
+        self._client = None
+    
+    def warm_up(self):
+        """
+        Создать клиент заранее (блокирующий вызов): импорт yandex_music и init()
+        иначе достаются первому поиску обложки
+        """
+        self._get_client()
+    
     def search_track(self, title: str, artist: str) -> Optional[dict]:
         """
         Поиск трека по названию и исполнителю
@@ -49,12 +81,13 @@ class YandexMusicAPI:
             query = f"{artist} - {title}"
             
             # Ищем
-            search_result = client.search(query, type_='track')
+            with YANDEX_SEARCH.time():
+                search_result = client.search(query, type_='track')
             
             if search_result and search_result.tracks and search_result.tracks.results:
                 track = search_result.tracks.results[0]
                 return {
-                    'id': track.id,
+                    'id': str(track.id),
                     'title': track.title,
                     'artist': ', '.join([a.name for a in track.artists]) if track.artists else '',
                     'album': track.albums[0].title if track.albums else '',
@@ -65,7 +98,8 @@ class YandexMusicAPI:
             return None
             
         except Exception as e:
-            print(f"Ошибка поиска трека: {e}")
+            ERRORS.inc()
+            log.warning("yandex.search", "Ошибка поиска трека", error=str(e))
             return None
     
     def get_cover_url(self, title: str, artist: str, size: str = "400x400") -> Optional[str]:
@@ -80,29 +114,86 @@ class YandexMusicAPI:
         Returns:
             URL обложки или None
         """
+        with COVER_CACHE.time():
+            cover_uri = self._get_cover_uri(title, artist)
+        return cover_url(cover_uri, size) if cover_uri else None
+    
+    def get_cover_uri(self, title: str, artist: str) -> Optional[str]:
+        """
+        Получить cover_uri трека — шаблон ссылки с %% вместо размера.
+        Один поиск на трек, размер подставляется потом (см. cover_url)
+        """
+        with COVER_CACHE.time():
+            return self._get_cover_uri(title, artist)
+    
+    def _get_cover_uri(self, title: str, artist: str) -> Optional[str]:
+        """Получить cover_uri через кэш"""
+        try:
+            track_info = self.find_track(title, artist)
+        except Exception as e:
+            ERRORS.inc()
+            log.warning("yandex.cover", "Ошибка получения обложки", error=str(e))
+            return None
+        return track_info.get('cover_uri') if track_info else None
+    
+    def find_track(self, title: str, artist: str) -> Optional[dict]:
+        """
+        Найти трек через кэш (результат search_track).
+        Один поиск на трек — обложка и текст берут id и cover_uri отсюда
+        """
         # Проверяем кэш
         cache_key = f"{artist}|{title}"
-        if cache_key in self._cover_cache:
-            return self._cover_cache[cache_key]
+        track_info = self._cover_cache.get(cache_key)
+        if track_info is not None:
+            COVER_CACHE_HITS.inc()
+            self._cover_cache.move_to_end(cache_key)
+            return track_info
         
+        COVER_CACHE_MISSES.inc()
+        track_info = self.search_track(title, artist)
+        if track_info:
+            # Сохраняем в кэш, вытесняя самый старый трек
+            self._cover_cache[cache_key] = track_info
+            if len(self._cover_cache) > self._cache_size:
+                self._cover_cache.popitem(last=False)
+        return track_info
+    
+    def get_lyrics(self, track_id: str) -> Optional[str]:
+        """
+        Синхронизированный текст трека в формате LRC
+        
+        Returns:
+            Текст LRC или None, если у трека его нет
+        """
         try:
-            track_info = self.search_track(title, artist)
-            
-            if track_info and track_info.get('cover_uri'):
-                # Формируем URL обложки
-                cover_uri = track_info['cover_uri']
-                # Заменяем %%  на размер
-                cover_url = f"https://{cover_uri.replace('%%', size)}"
-                
-                # Сохраняем в кэш
-                self._cover_cache[cache_key] = cover_url
-                
-                return cover_url
-            
+            client = self._get_client()
+            with YANDEX_SEARCH.time():
+                return client.tracks_lyrics(track_id, format='LRC').fetch_lyrics()
+        except Exception as e:
+            # NotFoundError — обычное дело: у многих треков синхронного текста нет
+            log.debug("yandex.lyrics", "Текст не получен", track_id=track_id, error=str(e))
             return None
-            
+    
+    def get_next_track_id(self, track_id: str) -> Optional[str]:
+        """
+        id трека, следующего за track_id в последней очереди воспроизведения.
+        Очереди доступны только с токеном
+        """
+        if not self.token:
+            return None
+        try:
+            client = self._get_client()
+            queues = client.queues_list()
+            if not queues:
+                return None
+            queue = client.queue(queues[0].id)
+            track_ids = [str(item.id) for item in queue.tracks or []]
+            index = track_ids.index(track_id) if track_id in track_ids else queue.current_index
+            if index is None or index + 1 >= len(track_ids):
+                return None
+            return track_ids[index + 1]
         except Exception as e:
-            print(f"Ошибка получения обложки: {e}")
+            log.debug("yandex.queue", "Очередь не получена", error=str(e))
             return None
     
     def clear_cache(self):
@@ -110,6 +201,11 @@ class YandexMusicAPI:
         self._cover_cache.clear()
 
 
+def cover_url(cover_uri: str, size: str = "400x400") -> str:
+    """URL обложки нужного размера из cover_uri (вместо %% подставляется размер)"""
+    return f"https://{cover_uri.replace('%%', size)}"
+
+
 # Синглтон для использования во всём приложении
 _api_instance: Optional[YandexMusicAPI] = None
 